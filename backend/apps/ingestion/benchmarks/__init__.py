@@ -0,0 +1 @@
+"""Offline benchmarking helpers (local stand-in servers, synthetic data)."""
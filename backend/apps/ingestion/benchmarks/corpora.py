@@ -0,0 +1,213 @@
+# backend/apps/ingestion/benchmarks/corpora.py
+
+import itertools
+import os
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("pdf", "docx", "xlsx", "csv")
+
+_WORDS = """
+    revenue quarter growth margin region market customer segment forecast budget
+    operating expense capital inventory supplier contract pricing volume demand
+    shipment warehouse audit compliance risk report review target variance cost
+    profit cash flow asset liability equity dividend investment portfolio product
+    service channel retail wholesale online partner strategy performance outlook
+""".split()
+_TITLES = """
+    Regional Performance Review|Operating Expenses|Market Outlook|Supply Chain Summary|
+    Customer Segments|Capital Investments|Risk Assessment|Pricing Strategy|Cash Flow Analysis
+""".replace("\n", "").split("|")
+
+
+def make_sales_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic sales sheet with ints, floats, strings, dates and gaps."""
+    rng = np.random.default_rng(seed)
+    regions = np.array(["North", "South", "East", "West"], dtype=object)
+    df = pd.DataFrame({
+        "Order ID": np.arange(100_000, 100_000 + rows),
+        "Region": regions[rng.integers(0, len(regions), rows)],
+        "Item Type": rng.choice(["Cereal", "Snacks", "Office Supplies", "Fruits"], rows),
+        "Order Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+        "Units Sold": rng.integers(1, 10_000, rows),
+        "Unit Price": rng.random(rows).round(2) * 500,
+        "Total Revenue": rng.random(rows) * 1e6,
+    })
+    # sprinkle missing values like real exports have
+    df.loc[rng.random(rows) < 0.01, "Region"] = None
+    df.loc[rng.random(rows) < 0.01, "Unit Price"] = np.nan
+    return df
+
+
+def make_corpus(
+    directory: str,
+    formats: Iterable[str] = FORMATS,
+    pdf_pages: int = 50,
+    docx_paragraphs: int = 400,
+    rows: int = 20_000,
+    sheets: int = 2,
+    seed: int = 0,
+) -> Dict[str, str]:
+    """Write one synthetic file per format into `directory`; returns {format: path}."""
+    paths = {}
+    for fmt in formats:
+        path = os.path.join(directory, f"synthetic.{fmt}")
+        if fmt == "pdf":
+            make_pdf(path, pdf_pages, seed)
+        elif fmt == "docx":
+            make_docx(path, docx_paragraphs, seed)
+        elif fmt == "xlsx":
+            make_xlsx(path, rows, sheets, seed)
+        elif fmt == "csv":
+            make_sales_frame(rows, seed).to_csv(path, index=False)
+        else:
+            raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+        paths[fmt] = path
+    return paths
+
+
+def make_paragraphs(count: int, seed: int = 0) -> List[str]:
+    """Report-like paragraphs of 40-120 words drawn from a small business vocabulary."""
+    rng = np.random.default_rng(seed)
+    words = np.array(_WORDS, dtype=object)
+    paragraphs = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(int(rng.integers(3, 8))):
+            sentence = " ".join(words[rng.integers(0, len(words), int(rng.integers(8, 18)))])
+            figure = f"{rng.random() * 1e6:,.2f}"
+            sentences.append(f"{sentence.capitalize()} reached {figure} in Q{rng.integers(1, 5)}.")
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def make_docx(path: str, paragraphs: int, seed: int = 0) -> None:
+    """Word document with numbered headings every few paragraphs."""
+    import docx
+
+    document = docx.Document()
+    for i, text in enumerate(make_paragraphs(paragraphs, seed)):
+        if i % 6 == 0:
+            document.add_heading(_heading(i // 6), level=2)
+        document.add_paragraph(text)
+    document.save(path)
+
+
+def make_xlsx(path: str, rows: int, sheets: int, seed: int = 0) -> None:
+    """Workbook with `rows` sales rows spread over `sheets` sheets."""
+    sheets = max(1, sheets)
+    with pd.ExcelWriter(path) as writer:
+        for n in range(sheets):
+            count = rows // sheets + (1 if n < rows % sheets else 0)
+            make_sales_frame(count, seed + n).to_excel(writer, sheet_name=f"Sales{n + 1}", index=False)
+
+
+def make_pdf(path: str, pages: int, seed: int = 0, table_every: int = 5) -> None:
+    """
+    Text PDF with a heading and wrapped paragraphs per page, plus a ruled
+    8x4 table (which pdfplumber detects from its lines) on every
+    `table_every`-th page. Written by hand: no PDF library is a dependency.
+    """
+    rng = np.random.default_rng(seed)
+    paragraphs = itertools.cycle(make_paragraphs(pages * 8, seed))
+    streams = []
+    for page in range(pages):
+        ops = ["BT /F1 10 Tf 12 TL 50 742 Td", f"({_pdf_escape(_heading(page))}) Tj T* T*"]
+        lines = 0
+        has_table = table_every > 0 and page % table_every == table_every - 1
+        budget = 30 if has_table else 55
+        while lines < budget:
+            for line in _wrap(next(paragraphs), 95):
+                ops.append(f"({_pdf_escape(line)}) Tj T*")
+                lines += 1
+            ops.append("T*")
+            lines += 1
+        ops.append("ET")
+        if has_table:
+            ops.extend(_pdf_table(rng, top=330))
+        streams.append("\n".join(ops).encode("latin-1"))
+    _write_pdf(path, streams)
+
+
+def _heading(n: int) -> str:
+    return f"{n % 9 + 1}.{n // 9 + 1} {_TITLES[n % len(_TITLES)]}"
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _pdf_table(rng, top: float, rows: int = 8, left: float = 50, widths=(90, 110, 110, 110)) -> List[str]:
+    header = ["Region", "Units Sold", "Unit Price", "Revenue"]
+    regions = ["North", "South", "East", "West"]
+    height = 16
+    right = left + sum(widths)
+    bottom = top - height * rows
+    ops = ["0.5 w"]
+    for r in range(rows + 1):
+        y = top - r * height
+        ops.append(f"{left} {y} m {right} {y} l S")
+    x = left
+    for width in (0, *widths):
+        x += width
+        ops.append(f"{x} {top} m {x} {bottom} l S")
+    for r in range(rows):
+        if r == 0:
+            cells = header
+        else:
+            cells = [
+                regions[int(rng.integers(0, 4))],
+                str(int(rng.integers(1, 10_000))),
+                f"{rng.random() * 500:.2f}",
+                f"{rng.random() * 1e6:.2f}",
+            ]
+        x = left
+        y = top - (r + 1) * height + 5
+        for width, cell in zip(widths, cells):
+            ops.append(f"BT /F1 9 Tf {x + 4} {y} Td ({_pdf_escape(cell)}) Tj ET")
+            x += width
+    return ops
+
+
+def _write_pdf(path: str, streams: List[bytes]) -> None:
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(
+            f"{4 + 2 * i} 0 R".encode() for i in range(len(streams))
+        ) + f"] /Count {len(streams)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, stream in enumerate(streams):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as fh:
+        fh.write(out)
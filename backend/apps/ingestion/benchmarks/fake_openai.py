@@ -0,0 +1,247 @@
+# backend/apps/ingestion/benchmarks/fake_openai.py
+
+import base64
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+import numpy as np
+
+
+def fake_embedding(text: str, dim: int = 1536) -> np.ndarray:
+    """Deterministic float32 unit vector derived from the text's hash."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenAIServer:
+    """
+    Local OpenAI-compatible stand-in server for offline throughput tests.
+
+    Serves POST /v1/embeddings with deterministic vectors after `latency`
+    seconds, and POST /v1/chat/completions (plain or streamed) with a canned
+    answer after `chat_latency` seconds (defaults to `latency`). When
+    `requests_per_minute` is set, requests beyond that rate are answered
+    with 429 + Retry-After, like the real API.
+
+    Usage:
+        with FakeOpenAIServer(latency=0.2) as server:
+            client = openai.OpenAI(api_key="sk-local", base_url=server.base_url)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dim: int = 1536,
+        latency: float = 0.0,
+        requests_per_minute: Optional[float] = None,
+        chat_latency: Optional[float] = None,
+    ):
+        self.dim = dim
+        self.latency = latency
+        self.chat_latency = latency if chat_latency is None else chat_latency
+        self.requests_per_minute = requests_per_minute
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._httpd = _HTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ----- request handling -----
+
+    def _admit(self) -> bool:
+        """Fixed one-second windows holding requests_per_minute / 60 requests."""
+        with self._lock:
+            self.requests += 1
+            if not self.requests_per_minute:
+                return True
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= max(1.0, self.requests_per_minute / 60.0):
+                self.rate_limited += 1
+                return False
+            self._window_count += 1
+            return True
+
+    def _embeddings(self, body: dict) -> dict:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for index, item in enumerate(inputs):
+            text = item if isinstance(item, str) else " ".join(map(str, item))
+            vector = fake_embedding(text, self.dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                vector = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        tokens = sum(len(str(item).split()) for item in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _chat_answer(self, body: dict) -> str:
+        messages = body.get("messages") or [{}]
+        lines = [line for line in str(messages[-1].get("content", "")).splitlines() if line.strip()]
+        # Echo the "Question: ..." line of the QA prompt (or the last line of any other prompt)
+        question = next((l for l in reversed(lines) if l.startswith("Question:")), lines[-1] if lines else "")
+        return f"Stand-in answer for {question[:80]}"
+
+    def _chat_completion(self, body: dict) -> dict:
+        answer = self._chat_answer(body)
+        tokens = len(answer.split())
+        return {
+            "id": "chatcmpl-local",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _chat_chunks(self, body: dict):
+        base = {
+            "id": "chatcmpl-local",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+        }
+        words = self._chat_answer(body).split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, every
+            # keep-alive response stalls ~40ms on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not server._admit():
+                    self._send_json(429, {"error": {
+                        "message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded",
+                    }}, {"Retry-After": "1"})
+                    return
+                path = self.path.rstrip("/")
+                if path.endswith("/embeddings"):
+                    if server.latency:
+                        time.sleep(server.latency)
+                    self._send_json(200, server._embeddings(body))
+                elif path.endswith("/chat/completions"):
+                    if server.chat_latency:
+                        time.sleep(server.chat_latency)
+                    if body.get("stream"):
+                        self._send_stream(server._chat_chunks(body))
+                    else:
+                        self._send_json(200, server._chat_completion(body))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _send_json(self, status, payload, headers=None):
+                raw = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _send_stream(self, chunks):
+                # No Content-Length: the body ends when the connection closes
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once; the default backlog of 5 drops SYNs
+    request_queue_size = 1024
+
+
+@contextmanager
+def fake_openai_subprocess(**kwargs) -> Iterator[str]:
+    """
+    Run a FakeOpenAIServer(**kwargs) in a child process and yield its base URL.
+
+    Load tests use this so the stand-in's JSON encoding doesn't compete with
+    the code under test for the GIL.
+    """
+    parent, child = multiprocessing.get_context("spawn").Pipe()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve_until_told, args=(child, kwargs), daemon=True
+    )
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        parent.send("stop")
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+def _serve_until_told(conn, kwargs) -> None:
+    with FakeOpenAIServer(**kwargs) as server:
+        conn.send(server.base_url)
+        conn.recv()
@@ -0,0 +1,263 @@
+# backend/apps/ingestion/management/commands/bench_ingestion.py
+
+import json
+import math
+import os
+import platform
+import tempfile
+import time
+from contextlib import contextmanager
+
+import chromadb
+from chromadb.config import Settings
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ingestion.benchmarks.corpora import FORMATS, make_corpus
+from apps.ingestion.benchmarks.fake_openai import fake_embedding
+from apps.ingestion.services import vector_store
+from apps.ingestion.services.embedding_providers import HashingEmbeddingProvider
+from apps.ingestion.services.extractor import extract_raw
+from apps.ingestion.services.flat_index import FlatVectorStore
+from apps.ingestion.services.pipeline import assign_chunk_ids
+from apps.ingestion.services.splitter import split_pages
+from apps.ingestion.services.table_chunker import chunk_table
+from apps.ingestion.services.vector_backends import ChromaVectorStore
+
+# Reported in this order, per format
+STAGES = ("extract", "split", "tables", "embed", "write")
+# Bump when stages or their inputs change so old baselines are not compared
+BASELINE_VERSION = 1
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the ingestion stages offline on synthetic PDF, DOCX, XLSX and CSV files.
+
+    Generates one file per format at the requested size, then times
+    extract_raw, split_text's page splitting, table-row chunking, a
+    deterministic fake embedder (or, with --embedder hashing, the local
+    hashing provider) and add_vectors (into a throwaway store of
+    the configured backend). Each stage reports its best time over
+    --repeat runs with rows/s and tokens/s. With --baseline, every stage
+    is compared against a saved run and the command fails when one got
+    slower than --threshold times its baseline.
+
+    Usage:
+        python manage.py bench_ingestion --pdf-pages 100 --rows 50000 --save-baseline bench.json
+        python manage.py bench_ingestion --pdf-pages 100 --rows 50000 --baseline bench.json --threshold 1.2
+        python manage.py bench_ingestion --formats csv,xlsx --stage-threshold write=1.5
+    """
+    # Offline benchmark: don't load URLconfs (and thus the OpenAI clients)
+    requires_system_checks = []
+    help = "Time each ingestion stage on synthetic files and check for regressions against a baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formats", default=",".join(FORMATS))
+        parser.add_argument("--pdf-pages", type=int, default=50)
+        parser.add_argument("--docx-paragraphs", type=int, default=400)
+        parser.add_argument("--rows", type=int, default=20_000,
+                            help="Rows per XLSX workbook and per CSV file.")
+        parser.add_argument("--sheets", type=int, default=2)
+        parser.add_argument("--dim", type=int, default=1536)
+        parser.add_argument("--embedder", choices=("fake", "hashing"), default="fake",
+                            help="fake: hash-seeded random vectors; hashing: the local hashing provider.")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "INGESTION_BATCH_SIZE", 256))
+        parser.add_argument("--backend", default=getattr(settings, "VECTOR_STORE_BACKEND", "chroma"),
+                            help="Vector store add_vectors writes to: chroma or flat.")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline", help="JSON file from an earlier --save-baseline run.")
+        parser.add_argument("--save-baseline", help="Write this run's results to a JSON file.")
+        parser.add_argument("--threshold", type=float, default=1.25,
+                            help="Fail when a stage takes more than this times its baseline.")
+        parser.add_argument("--stage-threshold", action="append", default=[], metavar="STAGE=RATIO",
+                            help="Per-stage override of --threshold (repeatable).")
+        parser.add_argument("--min-delta", type=float, default=0.05,
+                            help="Ignore slow-downs smaller than this many seconds (timer noise).")
+
+    def handle(self, *args, **options):
+        formats = [f for f in options["formats"].split(",") if f]
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise CommandError(f"Unknown format(s) {', '.join(sorted(unknown))}; expected {', '.join(FORMATS)}")
+        thresholds = _parse_thresholds(options["threshold"], options["stage_threshold"])
+        config = {
+            "version": BASELINE_VERSION,
+            "pdf_pages": options["pdf_pages"],
+            "docx_paragraphs": options["docx_paragraphs"],
+            "rows": options["rows"],
+            "sheets": options["sheets"],
+            "dim": options["dim"],
+            "embedder": options["embedder"],
+            "batch_size": options["batch_size"],
+            "backend": options["backend"],
+            "seed": options["seed"],
+        }
+        baseline = _load_baseline(options["baseline"], config) if options["baseline"] else None
+
+        results = {}
+        with tempfile.TemporaryDirectory() as root:
+            paths = make_corpus(
+                root, formats,
+                pdf_pages=options["pdf_pages"],
+                docx_paragraphs=options["docx_paragraphs"],
+                rows=options["rows"],
+                sheets=options["sheets"],
+                seed=options["seed"],
+            )
+            for fmt in formats:
+                size_mb = os.path.getsize(paths[fmt]) / 1024 ** 2
+                try:
+                    results[fmt] = self._bench_file(paths[fmt], root, options)
+                except ImportError as e:
+                    # e.g. DOCX extraction needs the optional `unstructured` package
+                    self.stdout.write(self.style.WARNING(f"{fmt}: skipped ({e})"))
+                    continue
+                self.stdout.write(f"{fmt}: {size_mb:.1f} MB")
+
+        self.stdout.write(
+            f"{'format':<7}{'stage':<9}{'best s':>9}{'rows':>9}{'rows/s':>12}{'tokens/s':>12}"
+            f"{'base s':>9}{'ratio':>7}"
+        )
+        regressions = []
+        for fmt, stages in results.items():
+            for stage, result in stages.items():
+                line = (
+                    f"{fmt:<7}{stage:<9}{result['seconds']:>9.3f}{result['rows']:>9}"
+                    f"{_rate(result['rows'], result['seconds']):>12}"
+                    f"{_rate(result['tokens'], result['seconds']):>12}"
+                )
+                base = ((baseline or {}).get(fmt) or {}).get(stage)
+                if base is None:
+                    self.stdout.write(line)
+                    continue
+                ratio = result["seconds"] / base["seconds"] if base["seconds"] > 0 else math.inf
+                line += f"{base['seconds']:>9.3f}{ratio:>7.2f}"
+                limit = thresholds.get(stage, thresholds[None])
+                if ratio > limit and result["seconds"] - base["seconds"] > options["min_delta"]:
+                    regressions.append(f"{fmt}/{stage} {ratio:.2f}x (limit {limit:.2f}x)")
+                    self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+                elif ratio < 1 / max(limit, 1) and base["seconds"] - result["seconds"] > options["min_delta"]:
+                    self.stdout.write(self.style.SUCCESS(line + "  faster"))
+                else:
+                    self.stdout.write(line)
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w") as fh:
+                json.dump({
+                    "config": config,
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "results": results,
+                }, fh, indent=2)
+            self.stdout.write(f"baseline written to {options['save_baseline']}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} stage(s) regressed: {'; '.join(regressions)}")
+        if baseline is not None:
+            self.stdout.write(self.style.SUCCESS("no regressions against the baseline"))
+
+    def _bench_file(self, path, root, options):
+        """Best-of-repeat {stage: {"seconds", "rows", "tokens"}} for one file."""
+        if options["embedder"] == "hashing":
+            embed = HashingEmbeddingProvider(options["dim"]).embed_documents
+        else:
+            embed = lambda texts: [fake_embedding(t, options["dim"]).tolist() for t in texts]
+        best = {}
+        for run in range(max(1, options["repeat"])):
+            timings = {}
+
+            start = time.perf_counter()
+            raw = extract_raw(path)
+            rows = len(raw.pages) + sum(len(t["dataframe"]) for t in raw.tables)
+            timings["extract"] = (time.perf_counter() - start, rows, 0)
+
+            start = time.perf_counter()
+            text_chunks = list(split_pages(raw.pages))
+            timings["split"] = (time.perf_counter() - start, len(raw.pages), _tokens(text_chunks))
+
+            start = time.perf_counter()
+            table_chunks = [chunk for table in raw.tables for chunk in chunk_table(table)]
+            table_rows = sum(len(t["dataframe"]) for t in raw.tables)
+            timings["tables"] = (time.perf_counter() - start, table_rows, _tokens(table_chunks))
+
+            chunks = list(assign_chunk_ids(text_chunks + table_chunks, "00000000-0000-0000-0000-000000000000"))
+            start = time.perf_counter()
+            embeddings = embed([c["text"] for c in chunks])
+            timings["embed"] = (time.perf_counter() - start, len(chunks), _tokens(chunks))
+
+            directory = os.path.join(root, f"{os.path.basename(path)}-store{run}")
+            with _scratch_store(options["backend"], directory):
+                start = time.perf_counter()
+                for i in range(0, len(chunks), options["batch_size"]):
+                    end = i + options["batch_size"]
+                    vector_store.add_vectors(chunks[i:end], embeddings[i:end])
+                timings["write"] = (time.perf_counter() - start, len(chunks), _tokens(chunks))
+
+            for stage, (seconds, rows, tokens) in timings.items():
+                if stage not in best or seconds < best[stage]["seconds"]:
+                    best[stage] = {"seconds": round(seconds, 4), "rows": rows, "tokens": tokens}
+        return {stage: best[stage] for stage in STAGES if best[stage]["rows"]}
+
+
+@contextmanager
+def _scratch_store(backend, directory):
+    """Point add_vectors at an empty store in `directory` instead of the real collection."""
+    if backend == "chroma":
+        store = ChromaVectorStore(
+            chromadb.PersistentClient(path=directory, settings=Settings())
+            .get_or_create_collection("bench")
+        )
+    elif backend == "flat":
+        store = FlatVectorStore(directory, dtype=getattr(settings, "FLAT_INDEX_DTYPE", "float32"))
+    else:
+        raise CommandError(f"Unknown backend {backend!r}; expected chroma or flat")
+    previous, vector_store.store = vector_store.store, store
+    try:
+        yield store
+    finally:
+        vector_store.store = previous
+        if backend == "chroma":
+            chromadb.api.client.SharedSystemClient.clear_system_cache()
+
+
+def _load_baseline(path, config):
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError) as e:
+        raise CommandError(f"Cannot read baseline {path}: {e}")
+    if data.get("config") != config:
+        different = sorted(
+            key for key in set(config) | set(data.get("config") or {})
+            if config.get(key) != (data.get("config") or {}).get(key)
+        )
+        raise CommandError(
+            f"Baseline {path} was recorded with different settings ({', '.join(different)}); "
+            "rerun with the same options or save a new baseline"
+        )
+    return data["results"]
+
+
+def _parse_thresholds(default, overrides):
+    thresholds = {None: default}
+    for item in overrides:
+        stage, _, ratio = item.partition("=")
+        if stage not in STAGES:
+            raise CommandError(f"Unknown stage {stage!r} in --stage-threshold; expected one of {', '.join(STAGES)}")
+        try:
+            thresholds[stage] = float(ratio)
+        except ValueError:
+            raise CommandError(f"Invalid --stage-threshold {item!r}; expected STAGE=RATIO")
+    return thresholds
+
+
+def _tokens(chunks):
+    return sum(c.get("token_count") or 0 for c in chunks)
+
+
+def _rate(count, seconds):
+    if not count:
+        return "-"
+    return f"{count / seconds:,.0f}" if seconds > 0 else "inf"
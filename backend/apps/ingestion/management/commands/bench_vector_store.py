@@ -0,0 +1,140 @@
+# backend/apps/ingestion/management/commands/bench_vector_store.py
+
+import os
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from django.core.management.base import BaseCommand
+
+from apps.ingestion.services.flat_index import FlatVectorStore
+from apps.ingestion.services.vector_backends import ChromaVectorStore
+
+
+class Command(BaseCommand):
+    """
+    Benchmark vector store backends on synthetic embeddings.
+
+    Loads the same clustered, unit-length vectors into a throwaway Chroma
+    collection and into flat float32 / int8 indexes, then reports load time,
+    re-open + first query time, single-query latency, batched query
+    throughput, recall@k against exact search, and size on disk.
+
+    Usage:
+        python manage.py bench_vector_store --vectors 100000 --dim 1536 --queries 200
+    """
+    # Offline benchmark: don't load URLconfs (and thus the OpenAI clients)
+    requires_system_checks = []
+    help = "Compare the Chroma and flat (mmap float32/int8) vector store backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vectors", type=int, default=50_000)
+        parser.add_argument("--dim", type=int, default=1536)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Vectors per upsert call while loading.")
+        parser.add_argument("--backends", default="chroma,flat-float32,flat-int8")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        vectors, queries = make_vectors(
+            options["vectors"], options["queries"], options["dim"], options["seed"]
+        )
+        k = options["k"]
+        ids = [f"chunk-{i}" for i in range(len(vectors))]
+        docs = [f"synthetic chunk {i}" for i in range(len(vectors))]
+        metadatas = [{"chunk_id": i, "page": n % 50} for n, i in enumerate(ids)]
+
+        # Exact top-k by cosine similarity (vectors are unit length)
+        truth = [set(np.argsort(-(vectors @ q))[:k]) for q in queries]
+
+        self.stdout.write(
+            f"vectors={len(vectors)} dim={options['dim']} queries={len(queries)} k={k}"
+        )
+        self.stdout.write(
+            f"{'backend':<14}{'load s':>9}{'open+1st ms':>13}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'batch q/s':>11}{'recall':>8}{'disk MB':>9}"
+        )
+        with tempfile.TemporaryDirectory() as root:
+            for name in options["backends"].split(","):
+                directory = os.path.join(root, name)
+                opener = _opener(name, directory)
+
+                store = opener()
+                start = time.perf_counter()
+                for i in range(0, len(vectors), options["batch_size"]):
+                    end = i + options["batch_size"]
+                    store.upsert(ids[i:end], vectors[i:end], docs[i:end], metadatas[i:end])
+                load = time.perf_counter() - start
+
+                # Fresh handle, as a newly started worker process would have
+                _reset_chroma()
+                start = time.perf_counter()
+                store = opener()
+                store.search(queries[:1], k)
+                open_ms = (time.perf_counter() - start) * 1000
+
+                latencies, hits = [], []
+                for q in queries:
+                    start = time.perf_counter()
+                    hits.append(store.search([q], k)[0])
+                    latencies.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                store.search(queries, k)
+                batch_rate = len(queries) / (time.perf_counter() - start)
+
+                recall = statistics.mean(
+                    len({int(h[0].rsplit("-", 1)[1]) for h in found} & expected) / k
+                    for found, expected in zip(hits, truth)
+                )
+                self.stdout.write(
+                    f"{name:<14}{load:>9.2f}{open_ms:>13.1f}{_pct(latencies, 50):>9.2f}"
+                    f"{_pct(latencies, 95):>9.2f}{batch_rate:>11.0f}{recall:>8.3f}"
+                    f"{_disk_mb(directory):>9.1f}"
+                )
+                del store
+                _reset_chroma()
+
+
+def make_vectors(count: int, queries: int, dim: int, seed: int = 0):
+    """Unit vectors around a few hundred centres (like topic clusters), plus perturbed queries."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, count // 200), dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, len(centres), count)]
+    vectors += 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = vectors[rng.integers(0, count, queries)]
+    picks = picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32)
+    return vectors, picks / np.linalg.norm(picks, axis=1, keepdims=True)
+
+
+def _opener(name: str, directory: str):
+    if name == "chroma":
+        return lambda: ChromaVectorStore(
+            chromadb.PersistentClient(path=directory, settings=Settings())
+            .get_or_create_collection("bench")
+        )
+    if name.startswith("flat-"):
+        return lambda: FlatVectorStore(directory, dtype=name.split("-", 1)[1])
+    raise ValueError(f"Unknown backend {name!r}")
+
+
+def _reset_chroma() -> None:
+    # PersistentClient reuses one in-process system per path; drop it to measure a cold open
+    chromadb.api.client.SharedSystemClient.clear_system_cache()
+
+
+def _disk_mb(directory: str) -> float:
+    total = 0
+    for dirpath, _, filenames in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+    return total / 1024 ** 2
+
+
+def _pct(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
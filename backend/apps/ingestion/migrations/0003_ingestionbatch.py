@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-16 20:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0002_document_content_hash_document_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('ids_digest', models.CharField(max_length=32)),
+                ('stage', models.CharField(choices=[('EMBEDDED', 'Embedded'), ('WRITTEN', 'Written')], max_length=10)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('added', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_batches', to='ingestion.document')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('document', 'index'), name='unique_ingestion_batch')],
+            },
+        ),
+    ]
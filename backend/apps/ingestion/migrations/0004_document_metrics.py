@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0003_ingestionbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,8 @@
 # backend/apps/ingestion/models.py
 
+import os
 import uuid
-from django.db import models
+from django.db import models, transaction
 
 
 class FileUpload(models.Model):
@@ -34,15 +35,62 @@ class Document(models.Model):
     # New fields to record pipeline metrics
     chunk_count = models.IntegerField(null=True, blank=True)
     total_tokens = models.IntegerField(null=True, blank=True)
+    # Per-stage timings of the last ingestion attempt (see services.metrics.StageMetrics)
+    metrics = models.JSONField(null=True, blank=True)
 
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     error_message = models.TextField(null=True, blank=True)
 
+    # sha256 of the file bytes, used to skip re-ingesting identical uploads
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Set when this upload reuses the vectors of an earlier identical file
+    duplicate_of = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='duplicates',
+    )
+
     def __str__(self):
         return f"Document {self.id} – {self.file.name}"
 
+    @classmethod
+    def find_ingested(cls, content_hash: str):
+        """Return the original, successfully ingested Document with these bytes, if any."""
+        if not content_hash:
+            return None
+        return (
+            cls.objects
+            .filter(content_hash=content_hash, status='SUCCESS', duplicate_of__isnull=True)
+            .order_by('uploaded_at')
+            .first()
+        )
+
+    @property
+    def file_type(self) -> str:
+        """Lower-case file extension without the dot, e.g. "pdf" or "xlsx"."""
+        return os.path.splitext(self.file.name)[1].lstrip('.').lower()
+
+    @property
+    def canonical(self):
+        """The Document whose vectors back this record."""
+        return self.duplicate_of or self
+
     # ----- status‐update helpers -----
 
+    def mark_pending(self):
+        """Called when the document is queued for (re-)ingestion."""
+        self.status = 'PENDING'
+        self.error_message = None
+        self.save(update_fields=['status', 'error_message'])
+
+    def mark_retry(self, message: str):
+        """Called when a failed run will be retried (status stays PENDING until it starts)."""
+        self.status = 'PENDING'
+        self.error_message = message
+        self.save(update_fields=['status', 'error_message'])
+
     def mark_processing(self):
         """Called at the start of processing."""
         self.status = 'RUNNING'
@@ -58,8 +106,65 @@ class Document(models.Model):
         self.total_tokens = total_tokens
         self.save(update_fields=['status', 'chunk_count', 'total_tokens'])
 
+    def link_duplicate(self, original: 'Document'):
+        """
+        Point this record at an already ingested identical file.
+        Copies its metrics and marks this record SUCCESS without reprocessing.
+        """
+        self.duplicate_of = original
+        self.status = 'SUCCESS'
+        self.chunk_count = original.chunk_count
+        self.total_tokens = original.total_tokens
+        self.save(update_fields=['duplicate_of', 'status', 'chunk_count', 'total_tokens'])
+
+    def split_off_duplicates(self):
+        """
+        Detach this document's duplicates before its content is replaced.
+
+        The oldest duplicate becomes an original again: it still points at
+        the old file, goes back to PENDING and has to be ingested under its
+        own id. The other duplicates are re-pointed at it. Returns that
+        document, or None when there were no duplicates.
+        """
+        with transaction.atomic():
+            heir = self.duplicates.select_for_update().order_by('uploaded_at').first()
+            if heir is None:
+                return None
+            heir.duplicate_of = None
+            heir.status = 'PENDING'
+            heir.error_message = None
+            heir.save(update_fields=['duplicate_of', 'status', 'error_message'])
+            Document.objects.filter(duplicate_of=self).update(duplicate_of=heir)
+        return heir
+
     def mark_error(self, message: str):
         """Called if any exception bubbles up during processing."""
         self.status = 'ERROR'
         self.error_message = message
         self.save(update_fields=['status', 'error_message'])
+
+
+# Checkpoint of one chunk batch of a document's ingestion run, so a retried
+# or restarted task resumes after the last batch it fully wrote
+class IngestionBatch(models.Model):
+    STAGE_CHOICES = [
+        ('EMBEDDED', 'Embedded'),   # vectors computed; store writes may have started
+        ('WRITTEN', 'Written'),     # vector store and keyword index both written
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_batches')
+    index = models.IntegerField()
+    # Digest of the batch's chunk ids; a changed file or chunking setting won't match
+    ids_digest = models.CharField(max_length=32)
+    stage = models.CharField(max_length=10, choices=STAGE_CHOICES)
+    chunk_count = models.IntegerField(default=0)
+    added = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'index'], name='unique_ingestion_batch'),
+        ]
+
+    def __str__(self):
+        return f"IngestionBatch {self.document_id}#{self.index} – {self.stage}"
@@ -17,3 +17,22 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         # Save the Document instance with default status = PENDING
         document = Document.objects.create(**validated_data)
         return document
+
+
+class DocumentReingestSerializer(serializers.ModelSerializer):
+    """Optional replacement file for re-ingesting an existing document."""
+    class Meta:
+        model = Document
+        fields = ['file']
+        extra_kwargs = {'file': {'required': False}}
+
+
+class DocumentStatusSerializer(serializers.ModelSerializer):
+    """Ingestion status and metrics of a document (read-only)."""
+    class Meta:
+        model = Document
+        fields = [
+            'id', 'file', 'status', 'error_message', 'chunk_count', 'total_tokens',
+            'uploaded_at', 'duplicate_of', 'metrics',
+        ]
+        read_only_fields = fields
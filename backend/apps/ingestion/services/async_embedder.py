@@ -0,0 +1,239 @@
+# apps/ingestion/services/async_embedder.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import openai
+
+from .tokenizer import encoding
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token-bucket limiter refilled continuously at `per_minute` units per minute.
+
+    The burst capacity is one second's worth of budget: providers enforce
+    per-minute limits over shorter sub-windows, so a full minute's burst
+    would still trip 429s. A request larger than the bucket waits for a
+    full bucket and is then charged in full, leaving the bucket in debt, so
+    the following requests wait until the whole amount has been refilled.
+
+    Shared across threads and event loops, so state is guarded by a plain
+    threading lock and waiting is done with asyncio.sleep().
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = float(per_minute) / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = float(amount)
+        # What must be available before the charge; more than a full bucket can never be
+        needed = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class AsyncEmbeddingExecutor:
+    """
+    Embeds texts through the OpenAI embeddings endpoint with several batches
+    in flight at once.
+
+    - up to `max_concurrency` requests of `batch_size` texts run concurrently
+    - requests-per-minute and tokens-per-minute budgets are enforced client
+      side with token buckets, so we rarely hit the server's limits
+    - 429 and 5xx responses, connection errors and timeouts are retried
+      with exponential backoff and jitter, honouring Retry-After when the
+      server sends it
+    - texts longer than `max_input_tokens` are embedded in pieces and
+      averaged, as LangChain's OpenAIEmbeddings does on the sync path
+
+    `base_url` may point at any OpenAI-compatible server (e.g. the local
+    stand-in in apps.ingestion.benchmarks.fake_openai).
+    """
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str],
+        base_url: Optional[str] = None,
+        batch_size: int = 100,
+        max_concurrency: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 6,
+        max_input_tokens: int = 8191,
+        timeout: float = 60.0,
+    ):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.max_input_tokens = max_input_tokens
+        self.timeout = timeout
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.retries = 0
+        # AsyncOpenAI clients (httpx pools are bound to their event loop), one per loop
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def embed_sync(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Blocking wrapper around embed(); must not be called from the executor's own loop.
+
+        Calls from any thread run on one background event loop, so they
+        share its HTTP client and connection pool.
+        """
+        return asyncio.run_coroutine_threadsafe(self.embed(texts), self._background_loop()).result()
+
+    async def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed `texts`, returning vectors in input order."""
+        if not texts:
+            return []
+        pieces, token_counts, owners = self._split_context(list(texts))
+        batches = [
+            (pieces[i:i + self.batch_size], sum(token_counts[i:i + self.batch_size]))
+            for i in range(0, len(pieces), self.batch_size)
+        ]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        client = self._client()
+        results = await asyncio.gather(*(
+            self._embed_batch(client, semaphore, batch, tokens)
+            for batch, tokens in batches
+        ))
+        vectors = [vector for batch_vectors in results for vector in batch_vectors]
+        return self._combine(len(texts), vectors, token_counts, owners)
+
+    def _client(self) -> openai.AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = openai.AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    max_retries=0,  # retries are handled here, with rate-limit awareness
+                    timeout=self.timeout,
+                )
+        return client
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        # Started lazily, so a forked (prefork Celery) worker starts its own
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="embedding-loop", daemon=True
+                ).start()
+                self._loop = loop
+        return self._loop
+
+    async def _embed_batch(
+        self,
+        client: openai.AsyncOpenAI,
+        semaphore: asyncio.Semaphore,
+        batch: List[str],
+        tokens: int,
+    ) -> List[List[float]]:
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(tokens)
+                try:
+                    response = await client.embeddings.create(model=self.model, input=batch)
+                # APIConnectionError also covers APITimeoutError
+                except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    delay = self._backoff(attempt, e)
+                    logger.warning(
+                        "Embedding request got %s; retry %d/%d in %.2fs",
+                        getattr(e, "status_code", type(e).__name__), attempt + 1, self.max_retries, delay,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                data = sorted(response.data, key=lambda d: d.index)
+                return [d.embedding for d in data]
+        raise AssertionError("unreachable")
+
+    @staticmethod
+    def _backoff(attempt: int, error: openai.APIError) -> float:
+        # Connection errors and timeouts carry no response
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # 0.5s, 1s, 2s, ... capped at 30s, with full jitter
+        return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+    def _split_context(self, texts: List[str]) -> Tuple[List[str], List[int], List[int]]:
+        """
+        Split texts longer than the model's input window into window-sized
+        pieces; return the pieces, their token counts and the index of the
+        text each one came from.
+        """
+        pieces, counts, owners = [], [], []
+        for index, (text, tokens) in enumerate(zip(texts, encoding.encode_batch(texts))):
+            if len(tokens) <= self.max_input_tokens:
+                pieces.append(text)
+                counts.append(len(tokens))
+                owners.append(index)
+                continue
+            for start in range(0, len(tokens), self.max_input_tokens):
+                piece = tokens[start:start + self.max_input_tokens]
+                pieces.append(encoding.decode(piece))
+                counts.append(len(piece))
+                owners.append(index)
+        return pieces, counts, owners
+
+    @staticmethod
+    def _combine(
+        n_texts: int,
+        vectors: List[List[float]],
+        token_counts: List[int],
+        owners: List[int],
+    ) -> List[List[float]]:
+        """Average each text's piece vectors, weighted by token count, and renormalise."""
+        grouped: List[List[int]] = [[] for _ in range(n_texts)]
+        for position, owner in enumerate(owners):
+            grouped[owner].append(position)
+        combined = []
+        for positions in grouped:
+            if len(positions) == 1:
+                combined.append(vectors[positions[0]])
+                continue
+            average = np.average(
+                [vectors[p] for p in positions], axis=0,
+                weights=[token_counts[p] for p in positions],
+            )
+            combined.append((average / np.linalg.norm(average)).tolist())
+        return combined
@@ -1,30 +1,57 @@
-import os
-from typing import List
-from langchain_openai import OpenAIEmbeddings
-
-# Ensure your OPENAI_API_KEY is set in environment
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY environment variable is not set")
-
-# Initialize OpenAI Embeddings model with batching
-embedding_model = OpenAIEmbeddings(
-    model="text-embedding-ada-002",
-    chunk_size=100,
-    openai_api_key=OPENAI_API_KEY
+from typing import Dict, List, Optional
+from django.conf import settings
+
+from .embedding_cache import EmbeddingCache
+from .embedding_providers import get_provider
+
+# Content-addressed cache in front of the model (None when disabled)
+embedding_cache = (
+    EmbeddingCache(
+        path=settings.EMBEDDING_CACHE_PATH,
+        max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+    )
+    if getattr(settings, "EMBEDDING_CACHE_ENABLED", True)
+    else None
 )
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+
+def embed_texts(texts: List[str], collection_name: Optional[str] = None) -> List[List[float]]:
     """
-    Generate embeddings for a list of texts using OpenAIEmbeddings.
+    Generate embeddings for a list of texts with the collection's embedding
+    provider (EMBEDDING_PROVIDERS / EMBEDDING_PROVIDER, see embedding_providers).
+
+    Texts already embedded by the same model are served from the embedding
+    cache; only the misses are sent to the model. Providers that compute
+    vectors locally (e.g. "hashing") skip the cache.
 
     Args:
         texts: List of string chunks to embed.
+        collection_name: Collection the vectors are for (default CHROMA_COLLECTION_NAME).
 
     Returns:
         List of embedding vectors corresponding to each text.
     """
     if not texts:
         return []
-    # Directly delegate to LangChain’s batcher
-    return embedding_model.embed_documents(texts)
+    provider = get_provider(collection_name)
+    if embedding_cache is None or not provider.cacheable:
+        return provider.embed_documents(texts)
+
+    vectors = embedding_cache.get_many(provider.model, texts)
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    if missing:
+        # Repeated texts within one call only need to be embedded once
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        fresh = provider.embed_documents(unique_texts)
+        embedding_cache.set_many(provider.model, unique_texts, fresh)
+        by_text = dict(zip(unique_texts, fresh))
+        for i in missing:
+            vectors[i] = by_text[texts[i]]
+    return vectors
+
+
+def cache_stats() -> Dict[str, int]:
+    """Return embedding cache counters (empty when the cache is disabled)."""
+    if embedding_cache is None:
+        return {}
+    return embedding_cache.stats()
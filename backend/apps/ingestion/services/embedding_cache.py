@@ -0,0 +1,245 @@
+# apps/ingestion/services/embedding_cache.py
+
+import atexit
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from .sqlite_utils import WriteTransaction
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement; stay well below it.
+_SQL_BATCH = 500
+# Lookups record hits/misses and last-used times in memory and write them
+# once this many keys were touched or this many seconds passed
+FLUSH_KEYS = 1000
+FLUSH_SECONDS = 30.0
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address of `text` as embedded by `model`."""
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embedding vectors.
+
+    Entries are keyed by sha256(model + text) and stored as float32 blobs in a
+    SQLite file, so every Celery worker on the host shares the same cache.
+    Once the stored payload grows past `max_bytes`, the least recently used
+    entries are evicted. Hit/miss counters are persisted alongside the data.
+
+    Lookups are plain reads and never wait for the write lock: their counters
+    and last-used times are buffered per process and written in one
+    transaction every FLUSH_KEYS keys / FLUSH_SECONDS, on set_many() and
+    stats(), and at exit. Eviction order is therefore approximate.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._pending_lock = threading.Lock()
+        self._pending_used: Dict[str, float] = {}
+        self._pending_hits = self._pending_misses = 0
+        self._flushed_at = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+        atexit.register(self._flush_at_exit)
+
+    # ----- connection / schema -----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connect()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key       TEXT PRIMARY KEY,
+                model     TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                nbytes    INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_used
+                ON embeddings(last_used);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name  TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_stats(name, value) VALUES
+                ('hits', 0), ('misses', 0), ('total_bytes', 0), ('evictions', 0);
+            """
+        )
+
+    # ----- public API -----
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached vectors for `texts`.
+
+        Returns a list aligned with `texts`; entries are None on a miss.
+        """
+        keys = [cache_key(model, t) for t in texts]
+        found: Dict[str, bytes] = {}
+        conn = self._connect()
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), _SQL_BATCH):
+            batch = unique_keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+            found.update(rows)
+
+        vectors: List[Optional[List[float]]] = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                vectors.append(None)
+            else:
+                vec = array("f")
+                vec.frombytes(blob)
+                vectors.append(vec.tolist())
+
+        hits = sum(1 for v in vectors if v is not None)
+        now = time.time()
+        with self._pending_lock:
+            self._pending_used.update(dict.fromkeys(found, now))
+            self._pending_hits += hits
+            self._pending_misses += len(keys) - hits
+            due = (
+                len(self._pending_used) >= FLUSH_KEYS
+                or time.monotonic() - self._flushed_at >= FLUSH_SECONDS
+            )
+        if due:
+            try:
+                self.flush()
+            except sqlite3.OperationalError:
+                # e.g. the write lock stayed busy: usage is best effort, the lookup is not
+                logger.warning("Could not flush embedding cache usage", exc_info=True)
+        return vectors
+
+    def flush(self) -> None:
+        """Write the buffered hit/miss counts and last-used times."""
+        with self._pending_lock:
+            empty = not (self._pending_used or self._pending_hits or self._pending_misses)
+        if not empty:
+            with self._transaction() as tx:
+                self._write_usage(tx)
+
+    def _flush_at_exit(self) -> None:
+        try:
+            self.flush()
+        except sqlite3.Error:
+            logger.warning("Could not flush embedding cache usage at exit", exc_info=True)
+
+    def set_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+    ) -> None:
+        """Store `vectors` for `texts`, then evict down to the size limit."""
+        if len(texts) != len(vectors):
+            raise ValueError(
+                f"Texts length {len(texts)} != vectors length {len(vectors)}"
+            )
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            rows.append((cache_key(model, text), model, blob, len(blob), now))
+
+        with self._transaction() as tx:
+            # Record buffered usage first so eviction sees this process's recent hits
+            self._write_usage(tx)
+            for row in rows:
+                previous = tx.execute(
+                    "SELECT nbytes FROM embeddings WHERE key = ?", (row[0],)
+                ).fetchone()
+                tx.execute(
+                    "INSERT OR REPLACE INTO embeddings(key, model, vector, nbytes, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    row,
+                )
+                self._bump(tx, "total_bytes", row[3] - (previous[0] if previous else 0))
+            self._evict(tx)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cumulative hits, misses, evictions, entry count and payload size."""
+        self.flush()
+        conn = self._connect()
+        stats = dict(conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        stats["entries"] = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return stats
+
+    # ----- internals -----
+
+    def _transaction(self):
+        return WriteTransaction(self._connect())
+
+    def _write_usage(self, tx: sqlite3.Connection) -> None:
+        """Write (and clear) the buffered usage inside `tx`; lost if `tx` rolls back."""
+        with self._pending_lock:
+            used, self._pending_used = self._pending_used, {}
+            hits, self._pending_hits = self._pending_hits, 0
+            misses, self._pending_misses = self._pending_misses, 0
+            self._flushed_at = time.monotonic()
+        tx.executemany(
+            # Another process may have flushed a later use of the same key
+            "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE key = ?",
+            [(ts, key) for key, ts in used.items()],
+        )
+        self._bump(tx, "hits", hits)
+        self._bump(tx, "misses", misses)
+
+    @staticmethod
+    def _bump(tx: sqlite3.Connection, name: str, delta: int) -> None:
+        if delta:
+            tx.execute(
+                "UPDATE cache_stats SET value = value + ? WHERE name = ?", (delta, name)
+            )
+
+    def _evict(self, tx: sqlite3.Connection) -> None:
+        total = tx.execute(
+            "SELECT value FROM cache_stats WHERE name = 'total_bytes'"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% of the limit so we don't evict on every insert.
+        target = int(self.max_bytes * 0.9)
+        freed = evicted = 0
+        cursor = tx.execute(
+            "SELECT key, nbytes FROM embeddings ORDER BY last_used ASC"
+        )
+        doomed = []
+        for key, nbytes in cursor:
+            if total - freed <= target:
+                break
+            doomed.append((key,))
+            freed += nbytes
+            evicted += 1
+        tx.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._bump(tx, "total_bytes", -freed)
+        self._bump(tx, "evictions", evicted)
+        logger.info("Embedding cache evicted %d entries (%d bytes)", evicted, freed)
+
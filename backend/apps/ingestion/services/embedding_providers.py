@@ -0,0 +1,222 @@
+# apps/ingestion/services/embedding_providers.py
+
+import re
+import threading
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+from .async_embedder import AsyncEmbeddingExecutor
+
+EMBEDDING_PROVIDERS = ("openai", "hashing")
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+# Part of HashingEmbeddingProvider's model name; bump when its features change so the
+# new vector space gets a new name (its vectors are computed on the fly, never cached)
+HASHING_VERSION = 1
+
+_WORD = re.compile(r"\w+")
+
+
+class EmbeddingProvider(Embeddings):
+    """
+    Source of the vectors stored in (and searched against) one collection.
+
+    `model` identifies the vector space: embedding caches are keyed by it,
+    and a collection must be searched with vectors from the same model it
+    was built with. `cacheable` is False for providers that compute a
+    vector faster than the embedding cache can look one up.
+    """
+
+    name: str = ""
+    model: str = ""
+    cacheable: bool = True
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Remote OpenAI embeddings (text-embedding-ada-002 by default).
+
+    Clients are created on first use, so importing this module (e.g. in a
+    worker that only ingests into hashing collections) needs no API key.
+    With `concurrent`, document batches go through the AsyncEmbeddingExecutor
+    (several requests in flight, client-side rate limits); otherwise through
+    LangChain's sequential batcher.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str = OPENAI_EMBEDDING_MODEL,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        http_async_client=None,
+        concurrent: bool = False,
+    ):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.http_async_client = http_async_client
+        self.concurrent = concurrent
+        self._client = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.concurrent:
+            return self._async_executor().embed_sync(texts)
+        return self._langchain().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._langchain().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.concurrent:
+            return await self._async_executor().embed(texts)
+        return await self._langchain().aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._langchain().aembed_query(text)
+
+    def _langchain(self):
+        if self._client is None:
+            from langchain_openai import OpenAIEmbeddings
+
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAIEmbeddings(
+                        model=self.model,
+                        chunk_size=100,
+                        openai_api_key=self._require_key(),
+                        base_url=self.base_url,
+                        http_async_client=self.http_async_client,
+                    )
+        return self._client
+
+    def _async_executor(self) -> AsyncEmbeddingExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = AsyncEmbeddingExecutor(
+                        model=self.model,
+                        api_key=self._require_key(),
+                        base_url=self.base_url,
+                        batch_size=settings.EMBEDDING_BATCH_SIZE,
+                        max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+                        requests_per_minute=settings.EMBEDDING_RPM_LIMIT,
+                        tokens_per_minute=settings.EMBEDDING_TPM_LIMIT,
+                        max_retries=settings.EMBEDDING_MAX_RETRIES,
+                    )
+        return self._executor
+
+    def _require_key(self) -> str:
+        if not self.api_key:
+            raise RuntimeError("OPENAI_API_KEY environment variable is not set")
+        return self.api_key
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU-only embeddings by feature hashing (a sparse random projection of the
+    bag of words), with no model download and no network calls.
+
+    Each lowercased word and each pair of neighbouring words is hashed
+    (CRC32, stable across processes) to one of `dim` slots with a +1/-1
+    sign; slot counts are damped with log(1 + n) and the vector is scaled to
+    unit length. Texts sharing words and phrases end up close, but unlike a
+    trained model it knows no synonyms, so retrieval quality is lower; it
+    suits bulk collections where indexing cost matters more than recall.
+    """
+
+    name = "hashing"
+    cacheable = False
+
+    def __init__(self, dim: int = 1024):
+        if dim <= 0:
+            raise ValueError(f"Embedding dimension must be positive, got {dim}")
+        self.dim = dim
+        self.model = f"hashing-v{HASHING_VERSION}-{dim}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.vectors(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors([text])[0].tolist()
+
+    def vectors(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 matrix of unit-length (or all-zero, for empty texts) rows."""
+        slots: List[int] = []
+        lengths: List[int] = []
+        for text in texts:
+            words = _WORD.findall(text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            slots.extend(_slot(feature, self.dim) for feature in features)
+            lengths.append(len(features))
+
+        slots_arr = np.fromiter(slots, dtype=np.int64, count=len(slots))
+        signs = np.where(slots_arr < 0, -1.0, 1.0)
+        columns = np.where(slots_arr < 0, ~slots_arr, slots_arr)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        counts = np.bincount(
+            rows * self.dim + columns, weights=signs, minlength=len(texts) * self.dim
+        ).reshape(len(texts), self.dim)
+
+        matrix = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1)
+
+
+@lru_cache(maxsize=1 << 18)
+def _slot(feature: str, dim: int) -> int:
+    """Hash slot of a feature; negative (~slot) when it counts with a minus sign."""
+    h = zlib.crc32(feature.encode("utf-8"))
+    slot = h % dim
+    return ~slot if h & 0x80000000 else slot
+
+
+def provider_name(collection_name: Optional[str] = None) -> str:
+    """Provider configured for a collection (EMBEDDING_PROVIDERS, else EMBEDDING_PROVIDER)."""
+    collection_name = collection_name or settings.CHROMA_COLLECTION_NAME
+    overrides = getattr(settings, "EMBEDDING_PROVIDERS", {}) or {}
+    return overrides.get(collection_name, getattr(settings, "EMBEDDING_PROVIDER", "openai"))
+
+
+def make_provider(name: str, http_async_client=None, concurrent: bool = False) -> EmbeddingProvider:
+    """
+    Build a provider by name.
+
+    `http_async_client` and `concurrent` only apply to "openai" (see
+    OpenAIEmbeddingProvider).
+    """
+    if name == "openai":
+        return OpenAIEmbeddingProvider(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=getattr(settings, "OPENAI_BASE_URL", None),
+            http_async_client=http_async_client,
+            concurrent=concurrent,
+        )
+    if name == "hashing":
+        return HashingEmbeddingProvider(dim=getattr(settings, "HASHING_EMBEDDING_DIM", 1024))
+    raise ValueError(
+        f"Unknown embedding provider {name!r}; expected one of {', '.join(EMBEDDING_PROVIDERS)}"
+    )
+
+
+_providers: Dict[str, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(collection_name: Optional[str] = None) -> EmbeddingProvider:
+    """Shared ingestion-side provider for a collection (defaults to CHROMA_COLLECTION_NAME)."""
+    name = provider_name(collection_name)
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            provider = _providers[name] = make_provider(
+                name, concurrent=getattr(settings, "EMBEDDING_ASYNC_ENABLED", False)
+            )
+    return provider
@@ -0,0 +1,354 @@
+# apps/ingestion/services/extraction_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+from django.conf import settings
+
+from .extractor import RawDocument, iter_raw
+from .sqlite_utils import WriteTransaction
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached layout or the extractor's output format changes
+FORMAT_VERSION = 4
+# Settings that change what iter_raw produces for the same file
+_EXTRACTION_SETTINGS = (
+    ("PDF_EXTRACTION_ENGINE", "single_pass"),
+    ("EXCEL_FULL_SHEET_INGESTION", True),
+    ("CSV_FULL_SHEET_INGESTION", False),
+    ("CSV_CHUNKSIZE", 50000),
+)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    On-disk cache of parsed files (the RawDocument parts iter_raw yields).
+
+    Entries are keyed by the file's content hash, its name (CSV part names
+    derive from it) and the extraction settings, so a Celery retry, a
+    re-ingest of the same file or a chunking experiment skips parsing. Each
+    entry is a directory with one compact JSON file per part (pages, plus
+    table names and metadata) and one Parquet file per table (never a
+    pickle: the directory may be shared, and loading it must not run code).
+    Once the entries grow past `max_bytes`, the least recently used ones are
+    evicted. Entries are written to a temporary directory and renamed into
+    place only when complete, so readers never see a partial entry.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key       TEXT PRIMARY KEY,
+                nbytes    INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name  TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_stats(name, value) VALUES
+                ('hits', 0), ('misses', 0), ('total_bytes', 0), ('evictions', 0);
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ----- public API -----
+
+    def key(self, file_path: str, content_hash: Optional[str] = None) -> str:
+        signature = [
+            FORMAT_VERSION,
+            content_hash or file_sha256(file_path),
+            os.path.basename(file_path),
+            *(getattr(settings, name, default) for name, default in _EXTRACTION_SETTINGS),
+        ]
+        return hashlib.sha256(json.dumps(signature).encode("utf-8")).hexdigest()
+
+    def iter_raw(self, file_path: str, content_hash: Optional[str] = None) -> "CachedExtraction":
+        """
+        iter_raw(file_path), served from the cache when the file was parsed before.
+
+        On a miss the parts are parsed as usual and written to the cache as
+        they stream through. If the caller stops early (e.g. embedding
+        failed), calling finish() on the result parses the rest into the
+        cache so the retry does not parse again.
+        """
+        key = self.key(file_path, content_hash)
+        entry = self._entry_path(key)
+        with self._transaction() as tx:
+            hit = tx.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+            if hit and os.path.isdir(entry):
+                tx.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._bump(tx, "hits", 1)
+            else:
+                hit = None
+                self._bump(tx, "misses", 1)
+        if hit:
+            return CachedExtraction(self._read(entry, file_path))
+        return CachedExtraction(iter_raw(file_path), writer=_EntryWriter(self, key))
+
+    def stats(self) -> Dict[str, int]:
+        """Return cumulative hits, misses, evictions, entry count and payload size."""
+        conn = self._connect()
+        stats = dict(conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        stats["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+    # ----- internals -----
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, entry: str, file_path: str) -> Iterator[RawDocument]:
+        with open(os.path.join(entry, "manifest.json")) as fh:
+            parts = json.load(fh)["parts"]
+        for n in range(parts):
+            with open(os.path.join(entry, f"part{n}.json")) as fh:
+                part = json.load(fh)
+            tables = []
+            for table in part["tables"]:
+                table["dataframe"] = _read_frame(entry, table.pop("frame"))
+                tables.append(table)
+            # The cached parse may come from the same content under another path
+            for item in (*part["pages"], *tables):
+                if "source" in item.get("metadata", {}):
+                    item["metadata"]["source"] = file_path
+            yield RawDocument(pages=part["pages"], tables=tables)
+
+    def _commit(self, key: str, staging: str) -> None:
+        entry = self._entry_path(key)
+        nbytes = sum(
+            os.path.getsize(os.path.join(staging, name)) for name in os.listdir(staging)
+        )
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another worker cached the same file first; (re-)register its entry
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(entry):
+                return
+        with self._transaction() as tx:
+            previous = tx.execute("SELECT nbytes FROM entries WHERE key = ?", (key,)).fetchone()
+            tx.execute(
+                "INSERT OR REPLACE INTO entries(key, nbytes, last_used) VALUES (?, ?, ?)",
+                (key, nbytes, time.time()),
+            )
+            self._bump(tx, "total_bytes", nbytes - (previous[0] if previous else 0))
+            doomed = self._evict(tx)
+        for key in doomed:
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def _transaction(self):
+        return WriteTransaction(self._connect())
+
+    @staticmethod
+    def _bump(tx: sqlite3.Connection, name: str, delta: int) -> None:
+        if delta:
+            tx.execute("UPDATE cache_stats SET value = value + ? WHERE name = ?", (delta, name))
+
+    def _evict(self, tx: sqlite3.Connection) -> List[str]:
+        """Drop least recently used entries from the index; returns their keys."""
+        total = tx.execute("SELECT value FROM cache_stats WHERE name = 'total_bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return []
+        # Evict down to 90% of the limit so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, nbytes in tx.execute("SELECT key, nbytes FROM entries ORDER BY last_used ASC"):
+            if total - freed <= target:
+                break
+            doomed.append(key)
+            freed += nbytes
+        tx.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in doomed])
+        self._bump(tx, "total_bytes", -freed)
+        self._bump(tx, "evictions", len(doomed))
+        logger.info("Extraction cache evicted %d entries (%d bytes)", len(doomed), freed)
+        return doomed
+
+
+class _EntryWriter:
+    """Writes one cache entry part by part into a staging directory."""
+
+    def __init__(self, cache: ExtractionCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.parts = 0
+        self.staging = tempfile.mkdtemp(prefix=".staging-", dir=cache.directory)
+
+    def add(self, part: RawDocument) -> None:
+        n = self.parts
+        tables = []
+        for i, table in enumerate(part.tables):
+            frame = _write_frame(table["dataframe"], os.path.join(self.staging, f"part{n}_table{i}"))
+            tables.append({
+                **{k: v for k, v in table.items() if k != "dataframe"},
+                "frame": frame,
+            })
+        with open(os.path.join(self.staging, f"part{n}.json"), "w") as fh:
+            json.dump({"pages": part.pages, "tables": tables}, fh,
+                      separators=(",", ":"), default=str)
+        self.parts += 1
+
+    def commit(self) -> None:
+        with open(os.path.join(self.staging, "manifest.json"), "w") as fh:
+            json.dump({"parts": self.parts}, fh)
+        self.cache._commit(self.key, self.staging)
+
+    def discard(self) -> None:
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+class CachedExtraction:
+    """Iterable of RawDocument parts that fills the cache entry as it is consumed."""
+
+    def __init__(self, parts: Iterator[RawDocument], writer: Optional[_EntryWriter] = None):
+        self._parts = iter(parts)
+        self._writer = writer
+
+    def __iter__(self) -> Iterator[RawDocument]:
+        while True:
+            part = self._next()
+            if part is None:
+                break
+            yield part
+        self._done()
+
+    def finish(self) -> None:
+        """Parse whatever the consumer did not reach into the cache; never raises."""
+        try:
+            while self._writer is not None and self._next() is not None:
+                pass
+            self._done()
+        except Exception:
+            logger.warning("Could not finish caching the extraction", exc_info=True)
+
+    def _next(self) -> Optional[RawDocument]:
+        try:
+            part = next(self._parts)
+        except StopIteration:
+            return None
+        except BaseException:
+            # The parse itself failed: nothing worth caching
+            self._discard()
+            raise
+        if self._writer is not None:
+            try:
+                self._writer.add(part)
+            except Exception:
+                # A cache problem must not fail ingestion; stop caching this file
+                logger.warning("Extraction cache write failed", exc_info=True)
+                self._discard()
+        return part
+
+    def _done(self) -> None:
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.commit()
+
+    def _discard(self) -> None:
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.discard()
+
+    def __del__(self):
+        # Abandoned before the parse completed: nothing to commit
+        if getattr(self, "_writer", None) is not None:
+            self._discard()
+
+
+def _write_frame(df: pd.DataFrame, base: str) -> Dict[str, Any]:
+    """
+    Write one table as Parquet; returns how to read it back (see _read_frame).
+
+    Column labels (PDF tables have missing and duplicate headers) are kept in
+    the part JSON and the file gets positional names. Object columns Arrow
+    cannot type (e.g. numbers and text mixed in one sheet column) are stored
+    as JSON-encoded strings, which keeps ints, floats, strings and None apart.
+    Arrow reads every missing object cell back as None, so columns whose
+    gaps are NaN (as read_csv leaves them) are listed to get NaN back, and
+    columns mixing NaN and None are JSON-encoded too: row texts render
+    them differently.
+    """
+    out = df.copy(deep=False)
+    out.columns = [str(j) for j in range(df.shape[1])]
+    json_columns, nan_columns = [], []
+    for j, name in enumerate(out.columns):
+        column = out[name]
+        if column.dtype != object:
+            continue
+        missing = {type(v) for v in column[column.isna()]}
+        try:
+            pa.array(column, from_pandas=True)
+            encode = len(missing) > 1
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            encode = True
+        if encode:
+            out[name] = [json.dumps(v, default=str) for v in column]
+            json_columns.append(j)
+        elif missing == {float}:
+            nan_columns.append(j)
+    out.to_parquet(base + ".parquet")
+    return {
+        "file": os.path.basename(base) + ".parquet",
+        "columns": list(df.columns),
+        "json_columns": json_columns,
+        "nan_columns": nan_columns,
+    }
+
+
+def _read_frame(entry: str, frame: Dict[str, Any]) -> pd.DataFrame:
+    df = pd.read_parquet(os.path.join(entry, frame["file"]))
+    for j in frame["json_columns"]:
+        df.iloc[:, j] = pd.Series([json.loads(v) for v in df.iloc[:, j]], index=df.index, dtype=object)
+    for j in frame["nan_columns"]:
+        column = df.iloc[:, j]
+        df.iloc[:, j] = column.where(column.notna(), float("nan"))
+    df.columns = frame["columns"]
+    return df
+
+
+# Shared instance (None when disabled)
+extraction_cache = (
+    ExtractionCache(
+        directory=settings.EXTRACTION_CACHE_DIR,
+        max_bytes=settings.EXTRACTION_CACHE_MAX_BYTES,
+    )
+    if getattr(settings, "EXTRACTION_CACHE_ENABLED", True)
+    else None
+)
@@ -1,12 +1,16 @@
 import os
+import logging
+import billiard
 import pdfplumber
 import pandas as pd
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from django.conf import settings
 from langchain_community.document_loaders import UnstructuredPDFLoader, UnstructuredWordDocumentLoader
 from langchain_community.document_loaders import PyPDFLoader
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class RawDocument:
     """
@@ -18,6 +22,16 @@ class RawDocument:
     pages: List[Dict[str, Any]]
     tables: List[Dict[str, Any]]
 
+    @classmethod
+    def merge(cls, parts: Iterable["RawDocument"]) -> "RawDocument":
+        """Concatenate parts (in order) into a single RawDocument."""
+        pages: List[Dict[str, Any]] = []
+        tables: List[Dict[str, Any]] = []
+        for part in parts:
+            pages.extend(part.pages)
+            tables.extend(part.tables)
+        return cls(pages=pages, tables=tables)
+
 
 def extract_raw(file_path: str) -> RawDocument:
     """
@@ -26,11 +40,140 @@ def extract_raw(file_path: str) -> RawDocument:
     Supports PDF table extraction via pdfplumber, CSV fallback encoding,
     chunked CSV reading for large files, with Unicode errors replaced to avoid crashes.
     """
+    return RawDocument.merge(iter_raw(file_path))
+
+
+def iter_pdf_shards(file_path: str) -> Iterator[RawDocument]:
+    """
+    Extract a PDF as page-range shards, in page order.
+
+    PDFs with more than PDF_SHARD_MIN_PAGES pages are cut into ranges of
+    PDF_SHARD_PAGES pages that are parsed in parallel by up to
+    PDF_SHARD_WORKERS processes; shards are yielded in page order as they
+    complete. Otherwise the PDF is extracted from the same open file that
+    was used to count its pages.
+
+    The shard processes come from a billiard (Celery's multiprocessing fork)
+    pool: unlike multiprocessing's, its processes may be started from the
+    daemonic prefork pool workers the ingestion task runs in. The pool only
+    lives while the PDF is parsed.
+    """
+    shard_pages = max(1, getattr(settings, 'PDF_SHARD_PAGES', 50))
+    min_pages = getattr(settings, 'PDF_SHARD_MIN_PAGES', 200)
+    workers = getattr(settings, 'PDF_SHARD_WORKERS', 4)
+
+    with pdfplumber.open(file_path) as pdf:
+        total_pages = len(pdf.pages)
+        ranges = [
+            (start, min(start + shard_pages - 1, total_pages))
+            for start in range(1, total_pages + 1, shard_pages)
+        ]
+        if total_pages <= min_pages or workers <= 1 or len(ranges) < 2:
+            yield _extract_pdf_range(pdf, file_path, 1, total_pages)
+            return
+
+    pool = billiard.Pool(processes=min(workers, len(ranges)))
+    try:
+        # One job per shard, collected in submission (page) order. Not imap(): billiard
+        # doesn't count its results as consumed, so its workers linger ~30s on close
+        jobs = [pool.apply_async(extract_pdf_pages, (file_path, first, last)) for first, last in ranges]
+        for job in jobs:
+            yield job.get()
+        pool.close()
+    except BaseException:
+        # The consumer stopped early or a shard failed
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def extract_pdf_pages(
+    file_path: str,
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+) -> RawDocument:
+    """
+    Single-pass PDF extraction: open the file once with pdfplumber and take
+    both the page text and the tables from each parsed page, so the layout
+    is only parsed once. Produces one text entry per non-empty page.
+
+    `first_page`/`last_page` (1-based, inclusive) limit extraction to a
+    page range; page numbers in the metadata stay absolute.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        last_page = len(pdf.pages) if last_page is None else last_page
+        return _extract_pdf_range(pdf, file_path, first_page, last_page)
+
+
+def _extract_pdf_range(pdf, file_path: str, first_page: int, last_page: int) -> RawDocument:
+    """Text and tables of pages first_page..last_page of an open pdfplumber PDF."""
+    pages: List[Dict[str, Any]] = []
+    tables: List[Dict[str, Any]] = []
+    total_pages = len(pdf.pages)
+    for page_num in range(first_page, min(last_page, total_pages) + 1):
+        page = pdf.pages[page_num - 1]
+        text = page.extract_text() or ''
+        if text.strip():
+            pages.append({
+                'text': text,
+                'metadata': {
+                    'source': file_path,
+                    'page': page_num,
+                    'total_pages': total_pages,
+                    'chunk_type': 'text',
+                }
+            })
+        tables.extend(_pdf_page_tables(file_path, page, page_num))
+        # Drop the parsed layout objects before moving on
+        page.close()
+    return RawDocument(pages=pages, tables=tables)
+
+
+def _pdf_page_tables(file_path: str, page, page_num: int) -> List[Dict[str, Any]]:
+    """Extract the tables of one pdfplumber page as DataFrames (first row as header)."""
+    tables: List[Dict[str, Any]] = []
+    extracted = page.extract_tables()
+    for table_idx, table in enumerate(extracted, start=1):
+        # Convert to DataFrame (first row as header)
+        if not table or len(table) < 2:
+            continue  # skip empty or header-only tables
+        df = pd.DataFrame(table[1:], columns=table[0])
+        sheet_name = f"page{page_num}_table{table_idx}"
+        # Add metadata for precise retrieval
+        tables.append({
+            'sheet_name': sheet_name,
+            'dataframe': df,
+            'metadata': {
+                'source': file_path,
+                'page': page_num,
+                'table_index': table_idx,
+                'chunk_type': 'table',
+                'columns': df.columns.tolist()
+            }
+        })
+    return tables
+
+
+def iter_raw(file_path: str) -> Iterator[RawDocument]:
+    """
+    Stream the file as a sequence of RawDocument parts.
+
+    Excel files yield one part per sheet and chunked CSVs one part per
+    CSV_CHUNKSIZE rows, so callers can process a large file without holding
+    all of its tables in memory. Other formats yield a single part.
+    """
     ext = os.path.splitext(file_path)[1].lower()
     pages: List[Dict[str, Any]] = []
     tables: List[Dict[str, Any]] = []
 
     if ext == '.pdf':
+        engine = getattr(settings, 'PDF_EXTRACTION_ENGINE', 'single_pass')
+        if engine == 'single_pass':
+            yield from iter_pdf_shards(file_path)
+            return
+
+        # Legacy two-pass extraction
         # 1) Extract narrative text pages with PyPDFLoader
         loader = PyPDFLoader(file_path)
         docs = loader.load_and_split()
@@ -42,25 +185,7 @@ def extract_raw(file_path: str) -> RawDocument:
         # 2) Extract tables from PDF using pdfplumber
         with pdfplumber.open(file_path) as pdf:
             for page_num, page in enumerate(pdf.pages, start=1):
-                extracted = page.extract_tables()
-                for table_idx, table in enumerate(extracted, start=1):
-                    # Convert to DataFrame (first row as header)
-                    if not table or len(table) < 2:
-                        continue  # skip empty or header-only tables
-                    df = pd.DataFrame(table[1:], columns=table[0])
-                    sheet_name = f"page{page_num}_table{table_idx}"
-                    # Add metadata for precise retrieval
-                    tables.append({
-                        'sheet_name': sheet_name,
-                        'dataframe': df,
-                        'metadata': {
-                            'source': file_path,
-                            'page': page_num,
-                            'table_index': table_idx,
-                            'chunk_type': 'table',
-                            'columns': df.columns.tolist()
-                        }
-                    })
+                tables.extend(_pdf_page_tables(file_path, page, page_num))
 
     elif ext == '.docx':
         loader = UnstructuredWordDocumentLoader(file_path)
@@ -76,6 +201,7 @@ def extract_raw(file_path: str) -> RawDocument:
         xls = pd.ExcelFile(file_path)
         for sheet_name in xls.sheet_names:
             df = xls.parse(sheet_name)
+            tables = []
             if full_sheet_excel:
                 # one chunk per sheet
                 tables.append({
@@ -105,6 +231,8 @@ def extract_raw(file_path: str) -> RawDocument:
                             'columns': df.columns.tolist()
                         }
                     })
+            yield RawDocument(pages=[], tables=tables)
+        return
 
     elif ext == '.csv':
         # CSV: full-sheet or chunked by rows
@@ -127,27 +255,42 @@ def extract_raw(file_path: str) -> RawDocument:
             })
         else:
             chunksize = getattr(settings, 'CSV_CHUNKSIZE', 50000)
-            try:
-                reader = pd.read_csv(file_path, iterator=True, chunksize=chunksize)
-            except UnicodeDecodeError:
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    reader = pd.read_csv(f, iterator=True, chunksize=chunksize)
+            # Decoding happens lazily while iterating, so replace bad bytes up
+            # front instead of falling back after the first chunk was yielded
+            reader = pd.read_csv(
+                file_path,
+                iterator=True,
+                chunksize=chunksize,
+                encoding_errors='replace',
+            )
 
-            for i, chunk_df in enumerate(reader, start=1):
-                part_name = f"{os.path.basename(file_path)}_part{i}"
-                tables.append({
-                    'sheet_name': part_name,
-                    'dataframe': chunk_df,
-                    'metadata': {
+            with reader:
+                chunks = iter(reader)
+                chunk_df = next(chunks, None)
+                i = 1
+                while chunk_df is not None:
+                    # Read one part ahead to know whether the file has more than one
+                    next_df = next(chunks, None)
+                    part_name = f"{os.path.basename(file_path)}_part{i}"
+                    metadata = {
                         'source': file_path,
                         'chunk_type': 'csv_sheet',
                         'sheet_name': part_name,
                         'row_count': len(chunk_df),
                         'columns': chunk_df.columns.tolist()
                     }
-                })
+                    if i > 1 or next_df is not None:
+                        # Only a piece of the table (see table_chunker.chunk_table)
+                        metadata['part'] = i
+                    yield RawDocument(pages=[], tables=[{
+                        'sheet_name': part_name,
+                        'dataframe': chunk_df,
+                        'metadata': metadata,
+                    }])
+                    chunk_df, i = next_df, i + 1
+            return
 
     else:
         raise ValueError(f"Unsupported file extension: {ext}")
 
-    return RawDocument(pages=pages, tables=tables)
+    yield RawDocument(pages=pages, tables=tables)
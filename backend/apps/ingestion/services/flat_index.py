@@ -0,0 +1,422 @@
+# apps/ingestion/services/flat_index.py
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+
+from .lexical_index import where_to_sql
+from .vector_backends import SearchHit, VectorStore
+
+DTYPES = ("float32", "int8")
+# Rows scored per matrix multiplication (a float32 int8-block copy stays cache-sized)
+BLOCK_ROWS = 4096
+# Stay under SQLite's host-parameter limit
+_SQL_BATCH = 500
+# Automatic compaction waits for at least this many flagged rows
+COMPACT_MIN_ROWS = 1024
+
+
+class _Snapshot(NamedTuple):
+    generation: int
+    layout: int                     # row numbering; changes when compact() renumbers rows
+    vectors: Optional[np.ndarray]   # (rows, dim) memmap, float32 or int8
+    scales: Optional[np.ndarray]    # (rows,) float32 dequantization factors (int8 only)
+    alive: np.ndarray               # (rows,) bool, False for deleted/replaced rows
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Brute-force vector index: one memory-mapped matrix plus a SQLite sidecar.
+
+    Vectors are L2-normalized and appended as rows of `vectors.<dtype>`,
+    either float32 or int8 (symmetric per-row quantization, with the scales
+    in `scales.float32`, a quarter of the size). Search is a blocked NumPy
+    matrix product over the mapped rows followed by argpartition top-k, so
+    opening the index reads no vectors and the OS page cache, shared by all
+    worker processes, holds the hot part of the matrix.
+
+    `rows.sqlite3` keeps one row per vector: chunk id, text, JSON metadata
+    and a deleted flag. Upserts and deletes only flag old rows; compact()
+    drops them, and runs by itself after a write once at least
+    COMPACT_MIN_ROWS rows and a `compact_ratio` share of the matrix are
+    flagged (None disables that). Metadata filters are evaluated in
+    SQLite (same translation as the lexical index) and only the matching
+    rows are scored. Writers serialize on the sidecar's write lock.
+    """
+
+    def __init__(self, directory: str, dtype: str = "float32", compact_ratio: Optional[float] = None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown flat index dtype {dtype!r}; expected one of {', '.join(DTYPES)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtype = dtype
+        self.compact_ratio = compact_ratio
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot(-1, 0, None, None, np.zeros(0, dtype=bool))
+
+        conn = self._connect()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS info(key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows("
+                "row INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, text TEXT NOT NULL, "
+                "metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS rows_live_chunk_id ON rows(chunk_id) WHERE deleted = 0"
+            )
+            conn.execute("INSERT OR IGNORE INTO info VALUES ('dtype', ?)", (dtype,))
+            conn.execute("INSERT OR IGNORE INTO info VALUES ('generation', '0')")
+            conn.execute("INSERT OR IGNORE INTO info VALUES ('layout', '0')")
+            conn.execute(
+                "INSERT OR IGNORE INTO info SELECT 'deleted', COUNT(*) FROM rows WHERE deleted = 1"
+            )
+        stored = self._info(conn).get("dtype")
+        if stored != dtype:
+            raise ValueError(
+                f"Flat index at {directory} holds {stored} vectors, not {dtype}; "
+                "rebuild it or change FLAT_INDEX_DTYPE"
+            )
+
+    # ----- storage -----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "rows.sqlite3"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _info(conn: sqlite3.Connection) -> Dict[str, str]:
+        return dict(conn.execute("SELECT key, value FROM info"))
+
+    def _vectors_path(self, layout: int) -> str:
+        # Layout 0 keeps the name indexes had before compaction existed
+        suffix = f".{layout}" if layout else ""
+        return os.path.join(self.directory, f"vectors{suffix}.{self.dtype}")
+
+    def _scales_path(self, layout: int) -> str:
+        suffix = f".{layout}" if layout else ""
+        return os.path.join(self.directory, f"scales{suffix}.float32")
+
+    def _encode(self, embeddings) -> tuple:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype == "float32":
+            return vectors, None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    @staticmethod
+    def _write_at(path: str, offset: int, array: np.ndarray) -> None:
+        # Rows past the committed count may hold leftovers of a failed write; overwrite them
+        with open(path, "r+b" if os.path.exists(path) else "wb") as fh:
+            fh.seek(offset)
+            fh.write(np.ascontiguousarray(array).tobytes())
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        # Last occurrence wins when a batch repeats an id
+        latest = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        keep = sorted(latest.values())
+        ids = [ids[i] for i in keep]
+        vectors, scales = self._encode([embeddings[i] for i in keep])
+
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            info = self._info(conn)
+            layout = int(info["layout"])
+            dim = int(info.get("dim", vectors.shape[1]))
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} != index dimension {dim}")
+            self._flag_deleted(conn, ids)
+            first = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+            self._write_at(self._vectors_path(layout), first * dim * vectors.itemsize, vectors)
+            if scales is not None:
+                self._write_at(self._scales_path(layout), first * scales.itemsize, scales)
+            conn.executemany(
+                "INSERT INTO rows(row, chunk_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (first + n, chunk_id, documents[i], json.dumps(metadatas[i]))
+                    for n, (chunk_id, i) in enumerate(zip(ids, keep))
+                ],
+            )
+            conn.execute("INSERT OR REPLACE INTO info VALUES ('dim', ?)", (str(dim),))
+            self._bump_generation(conn)
+        self._maybe_compact()
+
+    def update_metadata(self, ids, metadatas) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "UPDATE rows SET metadata = ? WHERE chunk_id = ? AND deleted = 0",
+                [(json.dumps(m), chunk_id) for chunk_id, m in zip(ids, metadatas)],
+            )
+
+    def delete(self, ids) -> None:
+        conn = self._connect()
+        with conn:
+            self._flag_deleted(conn, list(ids))
+            self._bump_generation(conn)
+        self._maybe_compact()
+
+    @staticmethod
+    def _flag_deleted(conn: sqlite3.Connection, ids: Sequence[str]) -> None:
+        flagged = 0
+        for start in range(0, len(ids), _SQL_BATCH):
+            part = ids[start:start + _SQL_BATCH]
+            flagged += conn.execute(
+                f"UPDATE rows SET deleted = 1 WHERE deleted = 0 AND chunk_id IN ({','.join('?' * len(part))})",
+                part,
+            ).rowcount
+        if flagged:
+            conn.execute(
+                "UPDATE info SET value = CAST(value AS INTEGER) + ? WHERE key = 'deleted'", (flagged,)
+            )
+
+    @staticmethod
+    def _bump_generation(conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE info SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+
+    # ----- compaction -----
+
+    def compact(self) -> int:
+        """
+        Drop the flagged rows from the matrix and the sidecar; returns how many were dropped.
+
+        Live rows are copied in order into vector (and scale) files for the
+        next layout, and the sidecar rows are renumbered in the transaction
+        that switches to it, so a crash leaves either layout intact. The old
+        files are removed afterwards; processes still mapping them keep a
+        valid view until their next search notices the new layout.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            info = self._info(conn)
+            layout = int(info["layout"])
+            rows = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+            live = np.fromiter(
+                (r for r, in conn.execute("SELECT row FROM rows WHERE deleted = 0 ORDER BY row")),
+                dtype=np.int64,
+            )
+            if len(live) == rows:
+                return 0
+            if len(live):
+                dim = int(info["dim"])
+                _copy_rows(self._vectors_path(layout), self._vectors_path(layout + 1),
+                           self.dtype, (rows, dim), live)
+                if self.dtype == "int8":
+                    _copy_rows(self._scales_path(layout), self._scales_path(layout + 1),
+                               np.float32, (rows,), live)
+            conn.execute("DELETE FROM rows WHERE deleted = 1")
+            # Ascending order: each row moves down into a slot already vacated
+            conn.executemany(
+                "UPDATE rows SET row = ? WHERE row = ?",
+                [(new, int(old)) for new, old in enumerate(live) if new != old],
+            )
+            conn.execute("UPDATE info SET value = ? WHERE key = 'layout'", (str(layout + 1),))
+            conn.execute("UPDATE info SET value = '0' WHERE key = 'deleted'")
+            self._bump_generation(conn)
+        for path in (self._vectors_path(layout), self._scales_path(layout)):
+            try:
+                os.remove(path)
+            except OSError:
+                # Missing (no int8 scales), or still mapped on Windows: only disk space is lost
+                pass
+        return rows - len(live)
+
+    def _maybe_compact(self) -> None:
+        if not self.compact_ratio:
+            return
+        conn = self._connect()
+        deleted = int(self._info(conn)["deleted"])
+        if deleted < COMPACT_MIN_ROWS:
+            return
+        rows = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+        if deleted >= self.compact_ratio * rows:
+            self.compact()
+
+    # ----- lookups -----
+
+    def get_metadata(self, ids) -> Dict[str, Dict[str, Any]]:
+        ids = list(ids)
+        found: Dict[str, Dict[str, Any]] = {}
+        conn = self._connect()
+        for start in range(0, len(ids), _SQL_BATCH):
+            part = ids[start:start + _SQL_BATCH]
+            rows = conn.execute(
+                f"SELECT chunk_id, metadata FROM rows WHERE deleted = 0 "
+                f"AND chunk_id IN ({','.join('?' * len(part))})",
+                part,
+            )
+            found.update((chunk_id, json.loads(meta)) for chunk_id, meta in rows)
+        return found
+
+    def ids_where(self, where) -> Set[str]:
+        clause, params = where_to_sql(where)
+        rows = self._connect().execute(
+            f"SELECT chunk_id FROM rows WHERE deleted = 0 AND {clause}", params
+        )
+        return {chunk_id for chunk_id, in rows}
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()[0]
+
+    # ----- search -----
+
+    def _current(self) -> _Snapshot:
+        """Map the committed rows, re-reading only after a write bumped the generation."""
+        conn = self._connect()
+        generation = int(self._info(conn)["generation"])
+        if generation == self._snapshot.generation:
+            return self._snapshot
+        with self._lock:
+            if generation == self._snapshot.generation:
+                return self._snapshot
+            while True:
+                with conn:
+                    # One read transaction: row count and deleted flags from the same commit
+                    conn.execute("BEGIN")
+                    info = self._info(conn)
+                    generation = int(info["generation"])
+                    layout = int(info["layout"])
+                    rows = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+                    alive = np.zeros(rows, dtype=bool)
+                    alive[np.fromiter(
+                        (r for r, in conn.execute("SELECT row FROM rows WHERE deleted = 0")), dtype=np.int64
+                    )] = True
+                vectors = scales = None
+                try:
+                    if rows:
+                        dim = int(info["dim"])
+                        vectors = np.memmap(self._vectors_path(layout), dtype=self.dtype,
+                                            mode="r", shape=(rows, dim))
+                        if self.dtype == "int8":
+                            scales = np.memmap(self._scales_path(layout), dtype=np.float32,
+                                               mode="r", shape=(rows,))
+                except FileNotFoundError:
+                    # Compacted away between reading the layout and mapping it
+                    continue
+                self._snapshot = _Snapshot(generation, layout, vectors, scales, alive)
+                return self._snapshot
+
+    def search(self, embeddings, k, where=None) -> List[List[SearchHit]]:
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        while True:
+            snapshot = self._current()
+            if snapshot.vectors is None or k <= 0:
+                return [[] for _ in queries]
+
+            if where:
+                clause, params = where_to_sql(where)
+                candidates = np.fromiter(
+                    (r for r, in self._connect().execute(
+                        f"SELECT row FROM rows WHERE deleted = 0 AND {clause} ORDER BY row", params
+                    )),
+                    dtype=np.int64,
+                )
+                candidates = candidates[candidates < len(snapshot.alive)]
+            else:
+                candidates = None
+
+            best_rows, best_scores = _top_k(snapshot, queries, k, candidates)
+            hits = self._hits(snapshot, best_rows, best_scores)
+            if hits is not None:
+                return hits
+            # compact() renumbered the rows meanwhile: score the new layout
+
+    def _hits(
+        self, snapshot: _Snapshot, best_rows: List[np.ndarray], best_scores: List[np.ndarray]
+    ) -> Optional[List[List[SearchHit]]]:
+        """SearchHits for scored rows, or None when the rows no longer use the snapshot's layout."""
+        wanted = sorted({int(r) for rows in best_rows for r in rows})
+        stored: Dict[int, tuple] = {}
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            if int(self._info(conn)["layout"]) != snapshot.layout:
+                return None
+            for start in range(0, len(wanted), _SQL_BATCH):
+                part = wanted[start:start + _SQL_BATCH]
+                for row, chunk_id, text, meta in conn.execute(
+                    f"SELECT row, chunk_id, text, metadata FROM rows WHERE deleted = 0 "
+                    f"AND row IN ({','.join('?' * len(part))})",
+                    part,
+                ):
+                    stored[row] = (chunk_id, text, json.loads(meta))
+        # Rows deleted since the snapshot was taken are dropped here
+        return [
+            [
+                (*stored[int(row)], float(1.0 - score))
+                for row, score in zip(rows, scores)
+                if int(row) in stored
+            ]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+
+def _copy_rows(source_path: str, target_path: str, dtype, shape: tuple, rows: np.ndarray) -> None:
+    """Write `rows` of the matrix in `source_path` to a new file, in order, and sync it."""
+    source = np.memmap(source_path, dtype=dtype, mode="r", shape=shape)
+    with open(target_path, "wb") as fh:
+        for start in range(0, len(rows), BLOCK_ROWS):
+            fh.write(np.ascontiguousarray(source[rows[start:start + BLOCK_ROWS]]).tobytes())
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def _top_k(snapshot: _Snapshot, queries: np.ndarray, k: int, candidates: Optional[np.ndarray]):
+    """
+    Per query, the (rows, cosine scores) of the k best live rows, best first.
+
+    Scores BLOCK_ROWS rows at a time (all rows, or only `candidates`) and
+    keeps each block's top k, so memory stays bounded for any index size.
+    """
+    pool_rows: List[np.ndarray] = []
+    pool_scores: List[np.ndarray] = []
+    total = len(snapshot.alive) if candidates is None else len(candidates)
+    for start in range(0, total, BLOCK_ROWS):
+        if candidates is None:
+            rows = np.arange(start, min(start + BLOCK_ROWS, total))
+            select = slice(start, start + BLOCK_ROWS)   # contiguous: a view of the mapping
+        else:
+            rows = select = candidates[start:start + BLOCK_ROWS]
+        scores = snapshot.vectors[select].astype(np.float32, copy=False) @ queries.T  # (block, queries)
+        if snapshot.scales is not None:
+            scores *= snapshot.scales[select][:, None]
+        scores[~snapshot.alive[select]] = -np.inf
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]           # (k, queries)
+        else:
+            top = np.broadcast_to(np.arange(len(rows))[:, None], (len(rows), len(queries)))
+        pool_rows.append(rows[top])
+        pool_scores.append(np.take_along_axis(scores, top, axis=0))
+
+    if not pool_rows:
+        return [np.empty(0, dtype=np.int64)] * len(queries), [np.empty(0)] * len(queries)
+    all_rows = np.concatenate(pool_rows)                                # (pool, queries)
+    all_scores = np.concatenate(pool_scores)
+    order = np.argsort(-all_scores, axis=0, kind="stable")[:k]
+    best_rows, best_scores = [], []
+    for q in range(len(queries)):
+        scores = all_scores[order[:, q], q]
+        live = np.isfinite(scores)
+        best_rows.append(all_rows[order[:, q], q][live])
+        best_scores.append(scores[live])
+    return best_rows, best_scores
@@ -0,0 +1,195 @@
+# apps/ingestion/services/lexical_index.py
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Words of a query; identifiers such as "INV-2024-0042" or "SKU_88/B" stay together
+_QUERY_WORD = re.compile(r"[^\s\"'()]+")
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_METADATA_KEY = re.compile(r"^\w+$")
+_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+class LexicalIndex:
+    """
+    BM25 keyword index over ingested chunks (SQLite FTS5).
+
+    Complements the dense Chroma search for exact tokens embeddings handle
+    poorly (invoice numbers, SKUs, codes). Rows are keyed by the same chunk
+    ids as the vector store and carry the same metadata, so results from
+    both can be fused. The index is one SQLite file next to the Chroma data,
+    written by the Celery workers and read by the query processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "chunk_id UNINDEXED, text, metadata UNINDEXED, "
+                "tokenize = 'porter unicode61 remove_diacritics 2')"
+            )
+            # chunk_id → FTS rowid, so chunks can be replaced or deleted
+            # without scanning the (unindexed) chunk_id column
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_rows("
+                "chunk_id TEXT PRIMARY KEY, row INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM chunk_rows)").fetchone()[0]:
+                # Index files written before chunk_rows existed
+                conn.execute("INSERT OR IGNORE INTO chunk_rows SELECT chunk_id, rowid FROM chunks")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        """Index a batch of chunks (one transaction); chunks already indexed under an id are replaced."""
+        conn = self._connect()
+        with conn:
+            # Take the write lock up front so the rowids picked below stay free
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete(conn, ids)
+            first = conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM chunks").fetchone()[0]
+            rows = list(range(first, first + len(ids)))
+            conn.executemany(
+                "INSERT INTO chunks(rowid, chunk_id, text, metadata) VALUES (?, ?, ?, ?)",
+                [(r, i, t, json.dumps(m)) for r, i, t, m in zip(rows, ids, texts, metadatas)],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_rows(chunk_id, row) VALUES (?, ?)",
+                zip(ids, rows),
+            )
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Remove chunks by id (one transaction); unknown ids are ignored."""
+        conn = self._connect()
+        with conn:
+            self._delete(conn, ids)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, ids: Sequence[str]) -> None:
+        ids = list(ids)
+        # Stay under SQLite's host-parameter limit
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            conn.execute(
+                f"DELETE FROM chunks WHERE rowid IN "
+                f"(SELECT row FROM chunk_rows WHERE chunk_id IN ({placeholders}))",
+                part,
+            )
+            conn.execute(f"DELETE FROM chunk_rows WHERE chunk_id IN ({placeholders})", part)
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        """
+        Return up to `k` (chunk_id, text, metadata, bm25_score) best matches.
+
+        `where` is a Chroma-style metadata filter ($and, $eq, $in, $gte, $lte,
+        ...), so callers can pass the vector store's clause unchanged.
+        Scores follow FTS5's bm25(): lower (more negative) is better.
+        """
+        match = to_match_expression(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT chunk_id, text, metadata, bm25(chunks) AS score "
+            "FROM chunks WHERE chunks MATCH ?"
+        )
+        params: List[Any] = [match]
+        if where:
+            clause, clause_params = where_to_sql(where)
+            sql += f" AND {clause}"
+            params.extend(clause_params)
+        rows = self._connect().execute(
+            sql + " ORDER BY score LIMIT ?", (*params, k)
+        ).fetchall()
+        return [(cid, text, json.loads(meta), score) for cid, text, meta, score in rows]
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+def to_match_expression(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted phrase of its tokens, OR-ed together, so
+    "invoice INV-2024-0042" matches chunks containing the token sequence
+    inv 2024 0042 (ranked highest) or the word invoice. FTS5 syntax in the
+    user's text is never interpreted.
+    """
+    phrases = []
+    for word in _QUERY_WORD.findall(query):
+        tokens = _TOKEN.findall(word)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"')
+    return " OR ".join(dict.fromkeys(phrases))
+
+
+def where_to_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma-style metadata filter into SQL over the JSON metadata column."""
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(sub) for sub in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(clause for clause, _ in parts) + ")")
+            for _, sub_params in parts:
+                params.extend(sub_params)
+            continue
+        if not _METADATA_KEY.match(key):
+            raise ValueError(f"Invalid metadata key {key!r}")
+        column = f"json_extract(metadata, '$.{key}')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                placeholders = ",".join("?" * len(value))
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({placeholders})")
+                params.extend(value)
+            elif op in _COMPARISONS:
+                clauses.append(f"{column} {_COMPARISONS[op]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported filter operator {op!r}")
+    return " AND ".join(clauses) or "1", params
+
+
+# Shared instance (None when disabled)
+lexical_index = (
+    LexicalIndex(settings.LEXICAL_INDEX_PATH)
+    if getattr(settings, "LEXICAL_INDEX_ENABLED", True)
+    else None
+)
@@ -0,0 +1,273 @@
+# apps/ingestion/services/metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import psutil
+
+# Order the stages are reported in (a document may skip some, e.g. "tables" for a PDF without any)
+STAGES = ("parse", "tables", "chunk", "lookup", "embed", "write")
+# How often the background sampler reads the process RSS
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+class StageMetrics:
+    """
+    Wall time, CPU time, peak RSS and throughput per ingestion stage.
+
+    process_document is a chain of lazy generators, so the stages interleave
+    batch by batch. Each stage's time is exclusive: while a stage pulls from
+    the one upstream, its clock is paused and the upstream one runs. The
+    "embed" stage is the time the pipeline waited on embedding requests;
+    the CPU the request threads used is added to it as well. A sampler
+    thread reads the RSS every RSS_SAMPLE_INTERVAL seconds and attributes
+    it to the stage running at that moment.
+
+    Usage:
+        metrics = StageMetrics()
+        metrics.start()
+        parts = metrics.timed(iter_raw(path), "parse", count=...)
+        with metrics.stage("write"):
+            ...
+        metrics.stop()
+        document.metrics = metrics.as_dict()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._process = psutil.Process()
+        # Innermost stage of the thread running the pipeline (the one creating this object)
+        self._owner = threading.get_ident()
+        self._current: Optional[str] = None
+        self._peak_rss = 0
+        self._started = self._ended = None
+        self._cpu_started = self._cpu_ended = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    # ----- recording -----
+
+    def start(self) -> None:
+        """Start the run's clocks and the background RSS sampler."""
+        self._started, self._cpu_started = time.perf_counter(), time.process_time()
+        self._record_rss(None)
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """Stop the clocks and the sampler (no-op unless running)."""
+        if self._sampler is None:
+            return
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self._ended, self._cpu_ended = time.perf_counter(), time.process_time()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Charge the time spent in the block to `name` (nested stages pause it)."""
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def timed(
+        self,
+        items: Iterable[Any],
+        name: str,
+        count: Optional[Callable[[Any], Tuple[int, int]]] = None,
+    ) -> Iterator[Any]:
+        """
+        Yield from `items`, charging the time spent producing each item to `name`.
+
+        `count(item)` returns the (rows, tokens) the item accounts for.
+        """
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                if count is not None:
+                    self.add(name, *count(item))
+            yield item
+
+    def add(self, name: str, rows: int = 0, tokens: int = 0, cpu: float = 0.0) -> None:
+        """Add processed rows / tokens (and CPU seconds used off the main thread) to a stage."""
+        with self._lock:
+            stats = self._stats_for(name)
+            stats["rows"] += rows
+            stats["tokens"] += tokens
+            stats["cpu"] += cpu
+
+    def count_cpu(self, name: str, fn: Callable) -> Callable:
+        """Wrap `fn` (run in another thread) so the CPU time it uses is charged to `name`."""
+        def wrapper(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, cpu=time.thread_time() - start)
+        return wrapper
+
+    # ----- reporting -----
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        {"stages": {stage: {"wall_s", "cpu_s", "peak_rss_mb", "rows", "tokens",
+                            "rows_per_s", "tokens_per_s"}},
+         "total": {"wall_s", "cpu_s", "peak_rss_mb"}}
+        """
+        with self._lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        ended = self._ended if self._ended is not None else time.perf_counter()
+        cpu_ended = self._cpu_ended if self._cpu_ended is not None else time.process_time()
+        stages = {}
+        for name in sorted(stats, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES)):
+            s = stats[name]
+            wall = s["wall"]
+            stages[name] = {
+                "wall_s": round(wall, 4),
+                "cpu_s": round(s["cpu"], 4),
+                "peak_rss_mb": round(s["peak_rss"] / 1024 ** 2, 1),
+                "rows": int(s["rows"]),
+                "tokens": int(s["tokens"]),
+                "rows_per_s": round(s["rows"] / wall, 1) if wall > 0 else None,
+                "tokens_per_s": round(s["tokens"] / wall, 1) if wall > 0 and s["tokens"] else None,
+            }
+        return {
+            "stages": stages,
+            "total": {
+                "wall_s": round(ended - self._started, 4) if self._started is not None else None,
+                "cpu_s": round(cpu_ended - self._cpu_started, 4) if self._cpu_started is not None else None,
+                "peak_rss_mb": round(self._peak_rss / 1024 ** 2, 1),
+            },
+        }
+
+    # ----- internals -----
+
+    def _stats_for(self, name: str) -> Dict[str, float]:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {
+                "wall": 0.0, "cpu": 0.0, "peak_rss": 0, "rows": 0, "tokens": 0,
+            }
+        return stats
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, name: str) -> None:
+        stack = self._stack()
+        now, cpu = time.perf_counter(), time.thread_time()
+        if stack:
+            self._charge(stack[-1], now, cpu)
+        stack.append([name, now, cpu])
+        self._set_current(name)
+
+    def _exit(self) -> None:
+        stack = self._stack()
+        now, cpu = time.perf_counter(), time.thread_time()
+        frame = stack.pop()
+        self._charge(frame, now, cpu)
+        self._record_rss(frame[0])
+        if stack:
+            # Resume the enclosing stage's clock
+            stack[-1][1], stack[-1][2] = now, cpu
+        self._set_current(stack[-1][0] if stack else None)
+
+    def _charge(self, frame, now: float, cpu: float) -> None:
+        with self._lock:
+            stats = self._stats_for(frame[0])
+            stats["wall"] += now - frame[1]
+            stats["cpu"] += cpu - frame[2]
+
+    def _set_current(self, name: Optional[str]) -> None:
+        if threading.get_ident() == self._owner:
+            self._current = name
+
+    def _record_rss(self, name: Optional[str]) -> None:
+        try:
+            rss = self._process.memory_info().rss
+        except psutil.Error:
+            return
+        with self._lock:
+            self._peak_rss = max(self._peak_rss, rss)
+            if name is not None:
+                stats = self._stats_for(name)
+                stats["peak_rss"] = max(stats["peak_rss"], rss)
+
+    def _sample_rss(self) -> None:
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self._record_rss(self._current)
+
+
+def prometheus_text(
+    status_counts: Dict[str, int],
+    document_metrics: Iterable[Dict[str, Any]],
+    caches: Optional[Dict[str, Dict[str, int]]] = None,
+) -> str:
+    """
+    Render ingestion metrics in the Prometheus text exposition format.
+
+    `document_metrics` are Document.metrics dicts (each document's last
+    attempt); stage values are summed over them, peak RSS is their maximum.
+    `caches` maps a cache name to its stats() counters.
+    """
+    sums: Dict[str, Dict[str, float]] = {}
+    total_wall = 0.0
+    documents = 0
+    for metrics in document_metrics:
+        if not metrics:
+            continue
+        documents += 1
+        total_wall += (metrics.get("total") or {}).get("wall_s") or 0.0
+        for stage, values in (metrics.get("stages") or {}).items():
+            acc = sums.setdefault(stage, {"wall_s": 0.0, "cpu_s": 0.0, "rows": 0, "tokens": 0, "rss": 0.0})
+            for key in ("wall_s", "cpu_s", "rows", "tokens"):
+                acc[key] += values.get(key) or 0
+            acc["rss"] = max(acc["rss"], int((values.get("peak_rss_mb") or 0) * 1024 ** 2))
+
+    lines = []
+
+    def family(name: str, kind: str, help_text: str, samples) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    family("reportminer_documents", "gauge", "Documents by ingestion status.",
+           [({"status": status}, count) for status, count in sorted(status_counts.items())])
+    family("reportminer_ingestion_documents_measured", "gauge",
+           "Documents with recorded ingestion metrics.", [({}, documents)])
+    family("reportminer_ingestion_wall_seconds", "gauge",
+           "Ingestion wall time, summed over documents (last attempt each).", [({}, round(total_wall, 4))])
+    ordered = sorted(sums, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES))
+    for key, name, help_text in (
+        ("wall_s", "reportminer_ingestion_stage_wall_seconds", "Wall time per stage, summed over documents."),
+        ("cpu_s", "reportminer_ingestion_stage_cpu_seconds", "CPU time per stage, summed over documents."),
+        ("rows", "reportminer_ingestion_stage_rows", "Rows (pages, table rows or chunks) per stage, summed over documents."),
+        ("tokens", "reportminer_ingestion_stage_tokens", "Tokens per stage, summed over documents."),
+        ("rss", "reportminer_ingestion_stage_peak_rss_bytes", "Highest worker RSS seen during each stage."),
+    ):
+        family(name, "gauge", help_text,
+               [({"stage": stage}, round(sums[stage][key], 4)) for stage in ordered])
+    for cache, stats in (caches or {}).items():
+        for key in ("hits", "misses", "evictions"):
+            if key in stats:
+                family(f"reportminer_{cache}_cache_{key}_total", "counter",
+                       f"{cache.replace('_', ' ').capitalize()} cache {key}.", [({}, stats[key])])
+        if "total_bytes" in stats:
+            family(f"reportminer_{cache}_cache_bytes", "gauge",
+                   f"{cache.replace('_', ' ').capitalize()} cache payload size.", [({}, stats["total_bytes"])])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,107 @@
+# apps/ingestion/services/pipeline.py
+
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .extractor import RawDocument
+from .splitter import split_pages
+from .table_chunker import chunk_table
+from .vector_store import make_chunk_id
+
+Chunk = Dict[str, Any]
+
+
+def iter_chunks(
+    parts: Iterable[RawDocument],
+    extra_metadata: Optional[Dict[str, Any]] = None,
+) -> Iterator[Chunk]:
+    """
+    Turn a stream of RawDocument parts into ingestion-ready chunks.
+
+    Pages (PDF/DOCX) are split into section-aware, token-bounded chunks;
+    tables (XLSX/CSV) are chunked per INGESTION_TABLE_CHUNK_MODE (single rows
+    or token-budgeted row groups). Every chunk carries its token_count, and
+    `extra_metadata` (e.g. document_id, file_type) is stamped on each one.
+    """
+    for part in parts:
+        chunks = split_pages(part.pages)
+        for table in part.tables:
+            chunks = chain(chunks, chunk_table(table))
+        for chunk in chunks:
+            if extra_metadata:
+                chunk["metadata"] = {**chunk["metadata"], **extra_metadata}
+            yield chunk
+
+
+def store_tables(
+    parts: Iterable[RawDocument],
+    store,
+    document_id: str,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Iterator[RawDocument]:
+    """
+    Pass parts through unchanged, copying each part's tables into `store`
+    (a StructuredStore) on the way so aggregates can run on them directly.
+    """
+    for part in parts:
+        for table in part.tables:
+            store.add_table(document_id, table, metadata)
+        yield part
+
+
+def assign_chunk_ids(chunks: Iterable[Chunk], document_id: str) -> Iterator[Chunk]:
+    """
+    Stamp each chunk with its deterministic "chunk_id" (see make_chunk_id).
+
+    Identical texts within the document are numbered in order of appearance,
+    so each gets its own id. Only a 16-byte digest per distinct text is
+    kept, not the texts themselves.
+    """
+    occurrences: Dict[bytes, int] = {}
+    for chunk in chunks:
+        key = hashlib.blake2b(chunk["text"].encode("utf-8"), digest_size=16).digest()
+        n = occurrences.get(key, 0)
+        occurrences[key] = n + 1
+        chunk["chunk_id"] = make_chunk_id(document_id, chunk["text"], n)
+        yield chunk
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Group an iterable into lists of at most `size` items."""
+    if size < 1:
+        raise ValueError(f"Batch size must be positive, got {size}")
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def embed_batches(
+    batches: Iterable[List[Chunk]],
+    embed_fn: Callable[[List[str]], List[List[float]]],
+    max_in_flight: int = 1,
+) -> Iterator[Tuple[List[Chunk], List[List[float]]]]:
+    """
+    Embed chunk batches, keeping up to `max_in_flight` requests running.
+
+    Batches are yielded back in input order together with their vectors.
+    Upstream batches are only pulled while there is a free slot, so memory
+    stays bounded by roughly (max_in_flight + 1) batches.
+    """
+    max_in_flight = max(1, max_in_flight)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        pending = deque()
+        for batch in batches:
+            texts = [c["text"] for c in batch]
+            pending.append((batch, pool.submit(embed_fn, texts)))
+            if len(pending) >= max_in_flight:
+                done, future = pending.popleft()
+                yield done, future.result()
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
@@ -1,19 +1,15 @@
-import uuid
-from typing import List, Dict, Any, Tuple
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from django.conf import settings
 from .extractor import RawDocument
+from .table_chunker import chunk_table
+from .tokenizer import encoding, count_tokens
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import tiktoken
 import re
 
 
-# # Configurable thresholds for grouping large tables
-# ROW_EMBED_THRESHOLD = getattr(settings, "INGESTION_ROW_EMBED_THRESHOLD", 200)
-# ROW_GROUP_SIZE = getattr(settings, "INGESTION_ROW_GROUP_SIZE", 50)                  REMOVED AS NO ROW GROUPING NOW
-
-
-# Use cl100k_base encoding (used by OpenAI embedding models) for precise token counting
-encoding = tiktoken.get_encoding("cl100k_base")
+# Row grouping for large tables (INGESTION_ROW_EMBED_THRESHOLD, INGESTION_ROW_GROUP_SIZE,
+# INGESTION_ROW_GROUP_TOKENS) is handled by table_chunker.chunk_table
 
 
 HEADING_REGEX = re.compile(r'^(?:\d+(?:\.\d+)*\s+)?[A-Z][A-Za-z0-9\s\-]{5,}$')
@@ -95,83 +91,131 @@ def normalize_headings(headings: List[Tuple[int,str]]) -> List[Tuple[int,str]]:
 
 
 
-def count_tokens(text: str) -> int:
-    """Return the number of tokens in `text` using cl100k_base encoding."""
-    return len(encoding.encode(text))
-
-
-
-
-def split_text(raw: RawDocument) -> List[Dict[str, Any]]:
-    chunks: List[Dict[str, Any]] = []
-
-
-    # ── Token-based splitting via character splitter ──────────────
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=400,          # target ~500 tokens
-        chunk_overlap=100,       # 100 token overlap
-        length_function=count_tokens  # measure length by tokens
-    )
-
-
-    for page in raw.pages:
-        full_text = page["text"]
-        source = page['metadata'].get('source')
-        page_num = page['metadata'].get('page')
-
-        # 1) Find/normalize headings to slice page into sections
-        raw_headings = extract_headings(full_text)
-        headings     = normalize_headings(filter_heading_list(raw_headings))
+def token_windows(
+    texts: List[str],
+    chunk_tokens: int,
+    overlap_tokens: int,
+) -> List[List[Tuple[str, int]]]:
+    """
+    Split each text into windows of at most `chunk_tokens` tokens, with
+    `overlap_tokens` tokens shared between neighbouring windows.
+
+    All texts are encoded once, in a single batch call, and the token arrays
+    are sliced directly; each window comes back as (text, token_count) so
+    callers never have to re-encode a chunk to count it. Window edges are
+    moved back to the nearest token that starts a character, so a
+    multi-byte character is never cut in two.
+    """
+    if overlap_tokens >= chunk_tokens:
+        raise ValueError(
+            f"Overlap ({overlap_tokens}) must be smaller than chunk size ({chunk_tokens})"
+        )
+    windows: List[List[Tuple[str, int]]] = []
+    for tokens in encoding.encode_ordinary_batch(texts):
+        pieces: List[Tuple[str, int]] = []
+        start = 0
+        while start < len(tokens):
+            end = _char_boundary(tokens, min(start + chunk_tokens, len(tokens)), start + 1)
+            text = encoding.decode(tokens[start:end])
+            if text.strip():
+                pieces.append((text, end - start))
+            if end >= len(tokens):
+                break
+            start = _char_boundary(tokens, max(end - overlap_tokens, start + 1), start + 1, end)
+        windows.append(pieces)
+    return windows
+
+
+def _char_boundary(tokens: Sequence[int], i: int, low: int, high: Optional[int] = None) -> int:
+    """
+    Nearest token index in [low, high] (high defaults to len(tokens)) where a
+    character starts, searching back from `i` first. A token whose bytes
+    begin with a UTF-8 continuation byte finishes the previous token's
+    character; the end of the text is always a boundary.
+    """
+    high = len(tokens) if high is None else high
+    for j in chain(range(i, low - 1, -1), range(i + 1, high + 1)):
+        if j >= len(tokens) or encoding.decode_single_token_bytes(tokens[j])[0] & 0xC0 != 0x80:
+            return j
+    return high
+
+
+def _page_segments(full_text: str) -> List[Tuple[str, str]]:
+    """Slice a page into (section_title, section_text) segments at detected headings."""
+    # 1) Find/normalize headings to slice page into sections
+    raw_headings = extract_headings(full_text)
+    headings     = normalize_headings(filter_heading_list(raw_headings))
+
+    # 2) Build (title, text) segments
+    segments = []
+    if headings:
+        for i, (pos, title) in enumerate(headings):
+            start = pos
+            end   = headings[i+1][0] if i+1 < len(headings) else len(full_text)
+            segments.append((title.strip(), full_text[start:end].strip()))
+    else:
+        # no headings → one big section
+        segments = [("", full_text)]
+    return segments
+
+
+def split_pages(pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Split extracted pages into section-aware, token-bounded chunks.
 
-        # 2) Build (title, text) segments
-        segments = []
-        if headings:
-            for i, (pos, title) in enumerate(headings):
-                start = pos
-                end   = headings[i+1][0] if i+1 < len(headings) else len(full_text)
-                segments.append((title.strip(), full_text[start:end].strip()))
-        else:
-            # no headings → one big section
-            segments = [("", full_text)]
+    SPLITTER_ENGINE="token" (default) encodes every section of a page in one
+    batch and slices the token arrays; "recursive" keeps the previous
+    RecursiveCharacterTextSplitter path. Page metadata is carried over and
+    every chunk has its token_count set.
+    """
+    chunk_tokens   = getattr(settings, "SPLITTER_CHUNK_TOKENS", 400)
+    overlap_tokens = getattr(settings, "SPLITTER_OVERLAP_TOKENS", 100)
+    engine         = getattr(settings, "SPLITTER_ENGINE", "token")
+
+    if engine == "recursive":
+        # ── Token-based splitting via character splitter ──────────────
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens,
+            chunk_overlap=overlap_tokens,
+            length_function=count_tokens  # measure length by tokens
+        )
+
+        def split_sections(texts: List[str]) -> List[List[Tuple[str, int]]]:
+            return [
+                [(sub, count_tokens(sub)) for sub in splitter.split_text(text)]
+                for text in texts
+            ]
+    elif engine == "token":
+        def split_sections(texts: List[str]) -> List[List[Tuple[str, int]]]:
+            return token_windows(texts, chunk_tokens, overlap_tokens)
+    else:
+        raise ValueError(f"Unknown SPLITTER_ENGINE: {engine!r}")
+
+    for page in pages:
+        segments = _page_segments(page["text"])
 
         # 3) Within each section, sub-split if large
-        for sec_idx, (section_title, section_text) in enumerate(segments):
-            sub_texts = splitter.split_text(section_text)
-            for idx, sub in enumerate(sub_texts):
+        pieces = split_sections([section_text for _, section_text in segments])
+        for sec_idx, ((section_title, _), sub_texts) in enumerate(zip(segments, pieces)):
+            for idx, (sub, token_count) in enumerate(sub_texts):
                 metadata = {
-                    "source":       source,
-                    "page":         page_num,
+                    **page["metadata"],
                     "section":      section_title or "Introduction",
                     "section_idx":  sec_idx,
                     "chunk_idx":    idx,
                 }
-                token_count = count_tokens(sub)
-                chunks.append({
+                yield {
                     "text":        sub,
                     "metadata":    metadata,
                     "token_count": token_count
-                })
+                }
 
-    # ── Structured tables (no change) ────────────────────────────
-    for table in raw.tables:
-        sheet = table['sheet_name']
-        df    = table['dataframe']
-
-        # Single full-table chunk
-        table_json = df.to_json(orient="records")
-        metadata = {
-            "source":     sheet,
-            "type":       "table",
-            "row_count":  len(df),
-            "columns":    df.columns.tolist()
-        }
-        token_count = count_tokens(table_json)
-        chunks.append({
-            "text":        table_json,
-            "metadata":    metadata,
-            "token_count": token_count
-        })
 
-    return chunks
+def split_text(raw: RawDocument) -> List[Dict[str, Any]]:
+    chunks: List[Dict[str, Any]] = list(split_pages(raw.pages))
 
+    # ── Structured tables (mode from INGESTION_TABLE_CHUNK_MODE) ─
+    for table in raw.tables:
+        chunks.extend(chunk_table(table))
 
+    return chunks
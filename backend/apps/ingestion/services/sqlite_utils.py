@@ -0,0 +1,26 @@
+# apps/ingestion/services/sqlite_utils.py
+
+import sqlite3
+
+
+class WriteTransaction:
+    """
+    Context manager running a block inside BEGIN IMMEDIATE / COMMIT.
+
+    For connections opened with isolation_level=None (autocommit), as the
+    embedding and extraction caches do: the write lock is taken up front, so
+    a read-then-write block cannot fail half-way with SQLITE_BUSY.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
@@ -0,0 +1,332 @@
+# apps/ingestion/services/structured_store.py
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from django.conf import settings
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_integer_dtype, is_numeric_dtype
+
+from .lexical_index import where_to_sql
+
+# Part suffixes the extractor adds when it splits one sheet/CSV into several tables
+_PART_SUFFIX = re.compile(r"_(part|row)\d+$")
+# Currency symbols, thousands separators, percent signs and spaces in numeric-looking text
+_NUMBER_NOISE = re.compile(r"[\s,$€£¥%]")
+# Share of non-empty text cells that must parse as numbers for a column to be stored as REAL
+NUMERIC_TEXT_RATIO = 0.9
+
+AGGREGATES = ("sum", "avg", "min", "max", "count")
+
+
+class StructuredStore:
+    """
+    Typed SQLite copy of every table extracted from uploaded documents.
+
+    Each logical table (an Excel sheet, a CSV file, a PDF page table) becomes
+    one SQLite table with INTEGER / REAL / TEXT columns; the parts a large
+    sheet or CSV is read in are appended to the same table. A catalog row
+    records the table's document, sheet, metadata (document_id, file_type,
+    sheet_name, source) and original column names, so aggregates such as
+    "sum of Revenue by Region" run as one SQL statement per table instead
+    of going through embedded row text.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._catalog: Tuple[int, List[Dict[str, Any]]] = (-1, [])
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS structured_tables("
+                "name TEXT PRIMARY KEY, document_id TEXT NOT NULL, sheet_name TEXT NOT NULL, "
+                "metadata TEXT NOT NULL, columns TEXT NOT NULL, row_count INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS structured_tables_document ON structured_tables(document_id)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS info(key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO info VALUES ('generation', 0)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ----- writes -----
+
+    def add_table(
+        self,
+        document_id: str,
+        table: Dict[str, Any],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Store one extracted table (as yielded by extract_raw/iter_raw); returns its SQLite name.
+
+        Rows are appended when the document already has a table with the same
+        logical name and columns (the next part of a chunked CSV). Column
+        types come from the first part; an INTEGER column becomes REAL when a
+        later part has fractional values. Unparsable cells in a numeric
+        column are stored as NULL.
+        """
+        df = table["dataframe"]
+        sheet = _PART_SUFFIX.sub("", str(table.get("sheet_name", "")))
+        names = _column_names(df.columns)
+        key = f"{document_id}:{sheet}:{json.dumps(names)}"
+        name = "t_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+        columns = [f"c{j}" for j in range(len(names))]
+
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT columns FROM structured_tables WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                types = [_sql_type(df.iloc[:, j]) for j in range(len(names))]
+                conn.execute(
+                    f"CREATE TABLE {name} ("
+                    + ", ".join(f"{c} {t}" for c, t in zip(columns, types)) + ")"
+                )
+                meta = {
+                    **(metadata or {}),
+                    "document_id": str(document_id),
+                    "sheet_name": sheet,
+                    "source": table.get("metadata", {}).get("source", sheet),
+                }
+                conn.execute(
+                    "INSERT INTO structured_tables VALUES (?, ?, ?, ?, ?, 0)",
+                    (name, str(document_id), sheet, json.dumps(meta),
+                     json.dumps([[n, c, t] for n, c, t in zip(names, columns, types)])),
+                )
+            else:
+                stored = json.loads(row[0])
+                types = [_widen(t, df.iloc[:, j]) for j, (_, _, t) in enumerate(stored)]
+                if types != [t for _, _, t in stored]:
+                    # SQLite columns take any value; only the catalog type changes
+                    conn.execute(
+                        "UPDATE structured_tables SET columns = ? WHERE name = ?",
+                        (json.dumps([[n, c, t] for (n, c, _), t in zip(stored, types)]), name),
+                    )
+
+            values = [_sql_values(df.iloc[:, j], t) for j, t in enumerate(types)]
+            conn.executemany(
+                f"INSERT INTO {name} VALUES ({','.join('?' * len(columns))})",
+                zip(*values) if values else [],
+            )
+            conn.execute(
+                "UPDATE structured_tables SET row_count = row_count + ? WHERE name = ?",
+                (len(df), name),
+            )
+            conn.execute("UPDATE info SET value = value + 1 WHERE key = 'generation'")
+        return name
+
+    def delete_document(self, document_id: str) -> int:
+        """Drop every table of a document; returns how many were dropped."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            names = [n for n, in conn.execute(
+                "SELECT name FROM structured_tables WHERE document_id = ?", (str(document_id),)
+            )]
+            for name in names:
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute("DELETE FROM structured_tables WHERE document_id = ?", (str(document_id),))
+            if names:
+                conn.execute("UPDATE info SET value = value + 1 WHERE key = 'generation'")
+        return len(names)
+
+    # ----- reads -----
+
+    def tables(self, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Catalog entries, optionally filtered by a Chroma-style `where` on their metadata.
+
+        Each entry: {"name", "document_id", "sheet_name", "metadata", "row_count",
+        "columns": [{"name", "sql", "type"}]}. The unfiltered catalog is cached
+        per process until a write changes it.
+        """
+        conn = self._connect()
+        if where:
+            clause, params = where_to_sql(where)
+            rows = conn.execute(
+                f"SELECT name, document_id, sheet_name, metadata, columns, row_count "
+                f"FROM structured_tables WHERE {clause} ORDER BY rowid", params
+            ).fetchall()
+            return [_catalog_entry(row) for row in rows]
+
+        generation = conn.execute("SELECT value FROM info WHERE key = 'generation'").fetchone()[0]
+        if generation != self._catalog[0]:
+            rows = conn.execute(
+                "SELECT name, document_id, sheet_name, metadata, columns, row_count "
+                "FROM structured_tables ORDER BY rowid"
+            ).fetchall()
+            self._catalog = (generation, [_catalog_entry(row) for row in rows])
+        return self._catalog[1]
+
+    def aggregate(
+        self,
+        tables: List[Dict[str, Any]],
+        op: str,
+        column: Optional[str] = None,
+        group_by: Optional[str] = None,
+    ) -> List[Tuple[Any, Any]]:
+        """
+        Run `op` over `column` (None = rows, for "count") across `tables`.
+
+        Columns are matched by name, case-insensitively; tables lacking one
+        are skipped. Partial results are combined per group, so the same
+        sheet split over several documents aggregates as one. Returns
+        [(group value or None, result)] sorted by group.
+        """
+        if op not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate {op!r}; expected one of {', '.join(AGGREGATES)}")
+        if column is None and op != "count":
+            raise ValueError(f"'{op}' needs a column")
+
+        partial: Dict[Any, List[Any]] = {}   # group → [sum, count, min, max]
+        conn = self._connect()
+        for table in tables:
+            value_sql = _find_column(table, column) if column else "1"
+            group_sql = _find_column(table, group_by) if group_by else "NULL"
+            if value_sql is None or group_sql is None:
+                continue
+            for group, total, count, low, high in conn.execute(
+                f"SELECT {group_sql}, SUM({value_sql}), COUNT({value_sql}), "
+                f"MIN({value_sql}), MAX({value_sql}) FROM {table['name']} GROUP BY 1"
+            ):
+                acc = partial.setdefault(group, [None, 0, None, None])
+                if total is not None:
+                    acc[0] = total if acc[0] is None else acc[0] + total
+                acc[1] += count
+                if low is not None:
+                    acc[2] = low if acc[2] is None else min(acc[2], low)
+                if high is not None:
+                    acc[3] = high if acc[3] is None else max(acc[3], high)
+
+        results = []
+        for group, (total, count, low, high) in partial.items():
+            if op == "sum":
+                value = total
+            elif op == "avg":
+                value = total / count if count else None
+            elif op == "min":
+                value = low
+            elif op == "max":
+                value = high
+            else:
+                value = count
+            results.append((group, value))
+        return sorted(results, key=lambda item: (item[0] is None, str(item[0])))
+
+
+def _catalog_entry(row) -> Dict[str, Any]:
+    name, document_id, sheet_name, metadata, columns, row_count = row
+    return {
+        "name": name,
+        "document_id": document_id,
+        "sheet_name": sheet_name,
+        "metadata": json.loads(metadata),
+        "row_count": row_count,
+        "columns": [{"name": n, "sql": c, "type": t} for n, c, t in json.loads(columns)],
+    }
+
+
+def _find_column(table: Dict[str, Any], name: str) -> Optional[str]:
+    wanted = name.strip().lower()
+    for column in table["columns"]:
+        if column["name"].lower() == wanted:
+            return column["sql"]
+    return None
+
+
+def _column_names(columns) -> List[str]:
+    """Original column labels as unique, non-empty strings (PDF tables may lack headers)."""
+    names: List[str] = []
+    taken = set()
+    for j, label in enumerate(columns):
+        base = str(label).strip() if label is not None and str(label).strip() else f"column_{j + 1}"
+        name, n = base, 1
+        while name.lower() in taken:
+            n += 1
+            name = f"{base}_{n}"
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def _sql_type(series: pd.Series) -> str:
+    if is_bool_dtype(series) or is_integer_dtype(series):
+        return "INTEGER"
+    if is_numeric_dtype(series):
+        return "REAL"
+    if is_datetime64_any_dtype(series):
+        return "TEXT"
+    _, ratio = _numbers(series)
+    return "REAL" if ratio is not None and ratio >= NUMERIC_TEXT_RATIO else "TEXT"
+
+
+def _widen(sql_type: str, series: pd.Series) -> str:
+    """Type a column stored as `sql_type` needs to also hold `series` (a later part)."""
+    if sql_type != "INTEGER" or is_integer_dtype(series) or is_bool_dtype(series):
+        return sql_type
+    numbers, _ = _numbers(series)
+    return "REAL" if (numbers.dropna() % 1 != 0).any() else sql_type
+
+
+def _numbers(series: pd.Series) -> Tuple[pd.Series, Optional[float]]:
+    """
+    (values as floats, NaN where unparsable; share of non-empty cells that parsed).
+
+    The share is None when the series has no non-empty cells.
+    """
+    if is_numeric_dtype(series):
+        numbers = series.astype(float)
+        present = series.notna()
+        return numbers, (1.0 if present.any() else None)
+    text = series.astype(object).where(series.notna(), None).astype(str).str.strip()
+    present = series.notna() & (text != "")
+    numbers = pd.to_numeric(
+        text.str.replace(_NUMBER_NOISE, "", regex=True).where(present, None), errors="coerce"
+    ).astype(float)
+    if not present.any():
+        return numbers, None
+    return numbers, float(numbers[present].notna().mean())
+
+
+def _sql_values(series: pd.Series, sql_type: str) -> List[Any]:
+    """Column values as Python scalars SQLite accepts (None for missing or unparsable)."""
+    if sql_type == "INTEGER" and (is_integer_dtype(series) or is_bool_dtype(series)):
+        # Exact, without a round trip through float
+        return [None if pd.isna(v) else int(v) for v in series.astype(object).tolist()]
+    if sql_type in ("INTEGER", "REAL"):
+        numbers, _ = _numbers(series)
+        return [
+            None if pd.isna(v) else (int(v) if sql_type == "INTEGER" else float(v))
+            for v in numbers.tolist()
+        ]
+    if is_datetime64_any_dtype(series):
+        return [None if pd.isna(v) else v.isoformat() for v in series]
+    return [None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v) for v in series.tolist()]
+
+
+# Shared instance (None when disabled)
+structured_store = (
+    StructuredStore(settings.STRUCTURED_STORE_PATH)
+    if getattr(settings, "STRUCTURED_STORE_ENABLED", True)
+    else None
+)
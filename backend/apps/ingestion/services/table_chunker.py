@@ -0,0 +1,304 @@
+# apps/ingestion/services/table_chunker.py
+
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from django.conf import settings
+from pandas.api.types import is_integer_dtype
+# Same boxing Series.to_dict() applies to object rows (numpy scalar → Python, NA → None)
+from pandas.core.dtypes.cast import maybe_box_native
+
+from .tokenizer import count_tokens, count_tokens_batch
+
+# Value types ChromaDB accepts as-is in metadata
+_PLAIN_TYPES = {str, int, float, bool, type(None)}
+
+# Table chunking modes (INGESTION_TABLE_CHUNK_MODE)
+MODE_AUTO = "auto"            # "row" up to INGESTION_ROW_EMBED_THRESHOLD rows, else "row_group"
+MODE_ROW = "row"              # one chunk per row
+MODE_ROW_GROUP = "row_group"  # consecutive rows packed up to a token budget
+MODE_TABLE = "table"          # one JSON chunk for the whole table
+
+# Metadata keys written by ingestion and matched by query filters; a table
+# column with one of these names is stored as "col_<name>" instead
+SYSTEM_METADATA_KEYS = frozenset({
+    "document_id", "file_type", "chunk_type", "chunk_id", "token_count",
+    "source", "sheet_name", "page", "total_pages", "table_index",
+    "columns", "row_count", "row_start", "row_end",
+})
+
+
+def sanitize_metadata(metadata_dict):
+    """Ensure all metadata keys/values are valid for ChromaDB."""
+    sanitized = {}
+    for key, value in metadata_dict.items():
+        # Ensure the key is a string (convert if not)
+        str_key = str(key) if key is not None else "unknown_key"
+        sanitized[str_key] = _sanitize_value(value)
+    return sanitized
+
+
+def _sanitize_value(value):
+    # Convert value to allowed types
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    elif isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    else:
+        return str(value)
+
+
+def chunk_table(table: Dict[str, Any], mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk one extracted table according to INGESTION_TABLE_CHUNK_MODE
+    (or the explicit `mode`).
+
+    In "auto" mode, the parts of a CSV read in CSV_CHUNKSIZE pieces (tables
+    whose metadata has a "part" number) always get row groups, so every
+    part of one file, including a short last one, is chunked the same way.
+    """
+    mode = mode or getattr(settings, "INGESTION_TABLE_CHUNK_MODE", MODE_AUTO)
+    if mode == MODE_AUTO:
+        threshold = getattr(settings, "INGESTION_ROW_EMBED_THRESHOLD", 200)
+        whole = "part" not in table.get("metadata", {})
+        mode = MODE_ROW if whole and len(table["dataframe"]) <= threshold else MODE_ROW_GROUP
+
+    if mode == MODE_ROW:
+        return iter_row_chunks(table)
+    if mode == MODE_ROW_GROUP:
+        return iter_row_group_chunks(table)
+    if mode == MODE_TABLE:
+        return iter([table_json_chunk(table)])
+    raise ValueError(f"Unknown table chunk mode: {mode}")
+
+
+def iter_row_chunks(table: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one chunk per DataFrame row of an extracted table.
+
+    Text is "col: value; col: value", metadata is the sanitized row (see
+    column_keys()) plus the table's source, sheet name, chunk_type and page.
+    Uses the columnar renderer, falling back to the row loop for frames
+    with duplicate column labels.
+    """
+    if table["dataframe"].columns.is_unique:
+        yield from row_chunks_columnar(table)
+    else:
+        yield from iter_row_chunks_loop(table)
+
+
+def iter_row_chunks_loop(table: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Reference row-by-row implementation (one iterrows() step per row)."""
+    df = table["dataframe"]
+    system_meta = table_metadata(table, MODE_ROW)
+    for _, row in df.iterrows():
+        row_dict = row.to_dict()
+        row_meta = sanitize_metadata(row_dict)
+        row_meta = dict(zip(column_keys(row_meta), row_meta.values()))
+        row_meta.update(system_meta)
+        row_text = "; ".join(f"{k}: {v}" for k, v in row_dict.items())
+        yield {"text": row_text, "metadata": row_meta, "token_count": count_tokens(row_text)}
+
+
+def row_chunks_columnar(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Render every row chunk of a table column by column.
+
+    Produces exactly what iter_row_chunks_loop() does: cells are taken from
+    the consolidated `df.values` array (so mixed int/float frames upcast the
+    same way iterrows() does), boxed like Series.to_dict(), formatted with
+    format() like the f-string, and joined with NumPy object-array adds
+    instead of one Python join per row. Requires unique column labels.
+    """
+    df = table["dataframe"]
+    n_rows = len(df)
+    if n_rows == 0:
+        return []
+
+    columns = list(df.columns)
+    cells = _column_cells(df)
+
+    # ── Texts: "k: v; k: v" built as whole-column string concatenations ──
+    if columns:
+        texts = f"{columns[0]}: " + _as_object_array(map(format, cells[0]))
+        for key, col in zip(columns[1:], cells[1:]):
+            texts = texts + f"; {key}: " + _as_object_array(map(format, col))
+        texts = texts.tolist()
+    else:
+        texts = [""] * n_rows
+
+    # ── Metadata: sanitize whole columns, then zip into per-row dicts ────
+    keys = column_keys(columns)
+    meta_cols = []
+    for col in cells:
+        types = set(map(type, col))
+        if types <= _PLAIN_TYPES:
+            meta_cols.append(col)
+        elif not any(issubclass(t, (str, int, float, bool, list, type(None))) for t in types):
+            # e.g. all Timestamps: every cell takes the str() branch
+            meta_cols.append(list(map(str, col)))
+        else:
+            meta_cols.append(list(map(_sanitize_value, col)))
+    for key, value in table_metadata(table, MODE_ROW).items():
+        keys.append(key)
+        meta_cols.append(repeat(value, n_rows))
+
+    return [
+        {"text": text, "metadata": dict(zip(keys, values)), "token_count": tokens}
+        for text, values, tokens in zip(texts, zip(*meta_cols), count_tokens_batch(texts))
+    ]
+
+
+def iter_row_group_chunks(
+    table: Dict[str, Any],
+    token_budget: Optional[int] = None,
+    max_rows: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Pack consecutive rows into chunks that fill a token budget.
+
+    Every chunk repeats the header line ("col | col | ...") followed by one
+    line per row, and records its 1-based row range in the metadata.
+    Groups close when the next row would exceed `token_budget`
+    (INGESTION_ROW_GROUP_TOKENS) or the group reaches `max_rows`
+    (INGESTION_ROW_GROUP_SIZE). A single row larger than the budget gets a
+    chunk of its own.
+    """
+    if token_budget is None:
+        token_budget = getattr(settings, "INGESTION_ROW_GROUP_TOKENS", 1000)
+    if max_rows is None:
+        max_rows = getattr(settings, "INGESTION_ROW_GROUP_SIZE", 50)
+
+    df = table["dataframe"]
+    if len(df) == 0:
+        return
+
+    columns = [str(c) for c in df.columns]
+    header = " | ".join(columns)
+    lines = _row_lines(df)
+    # +1 per line for the newline joining it to the chunk
+    line_tokens = [n + 1 for n in count_tokens_batch(lines)]
+    header_tokens = count_tokens(header)
+
+    # Row numbers: CSV read chunks keep a running RangeIndex across parts
+    if is_integer_dtype(df.index):
+        row_numbers = [int(i) + 1 for i in df.index]
+    else:
+        row_numbers = list(range(1, len(df) + 1))
+
+    base_meta = table_metadata(table, MODE_ROW_GROUP)
+    base_meta["columns"] = ", ".join(columns)
+
+    start = 0
+    while start < len(lines):
+        end = start + 1
+        tokens = header_tokens + line_tokens[start]
+        while (
+            end < len(lines)
+            and end - start < max_rows
+            and tokens + line_tokens[end] <= token_budget
+        ):
+            tokens += line_tokens[end]
+            end += 1
+
+        metadata = dict(base_meta)
+        metadata.update({
+            "row_start": row_numbers[start],
+            "row_end":   row_numbers[end - 1],
+            "row_count": end - start,
+        })
+        yield {
+            "text":        header + "\n" + "\n".join(lines[start:end]),
+            "metadata":    metadata,
+            "token_count": tokens,
+        }
+        start = end
+
+
+def table_json_chunk(table: Dict[str, Any]) -> Dict[str, Any]:
+    """Single full-table chunk: the DataFrame as JSON records."""
+    df    = table['dataframe']
+    table_json = df.to_json(orient="records")
+    metadata = table_metadata(table, MODE_TABLE)
+    metadata.update({
+        "row_count":  len(df),
+        "columns":    ", ".join(str(c) for c in df.columns)
+    })
+    return {
+        "text":        table_json,
+        "metadata":    metadata,
+        "token_count": count_tokens(table_json)
+    }
+
+
+def table_metadata(table: Dict[str, Any], chunk_type: str) -> Dict[str, Any]:
+    """
+    System metadata every chunk of a table carries: its source file, sheet
+    name, chunk_type and, for PDF tables, the page it was found on.
+    """
+    sheet = table.get("sheet_name", "")
+    meta = table.get("metadata", {})
+    metadata = {
+        "source":      meta.get("source", sheet),
+        "sheet_name":  sheet,
+        "chunk_type":  chunk_type,
+    }
+    if meta.get("page") is not None:
+        metadata["page"] = meta["page"]
+    return metadata
+
+
+def column_keys(columns) -> List[str]:
+    """
+    Metadata keys for table columns: str() of the label, with names in
+    SYSTEM_METADATA_KEYS (and any clash that renaming creates) prefixed
+    with "col_", so a column called "page" cannot satisfy a page filter.
+    """
+    keys = [str(k) if k is not None else "unknown_key" for k in columns]
+    taken = set(keys) | SYSTEM_METADATA_KEYS
+    renamed = []
+    for key in keys:
+        if key in SYSTEM_METADATA_KEYS:
+            key = f"col_{key}"
+            while key in taken:
+                key = f"col_{key}"
+            taken.add(key)
+        renamed.append(key)
+    return renamed
+
+
+def _row_lines(df) -> List[str]:
+    """Render each row as "value | value | ..." (cells formatted like row texts)."""
+    cells = _column_cells(df)
+    if not cells:
+        return [""] * len(df)
+    lines = _as_object_array(map(format, cells[0]))
+    for col in cells[1:]:
+        lines = lines + " | " + _as_object_array(map(format, col))
+    return lines.tolist()
+
+
+def _column_cells(df) -> List[List[Any]]:
+    """Per-column lists of Python cell values as iterrows()/to_dict() see them."""
+    values = df.values
+    if values.dtype.kind in "mM":
+        # datetime64/timedelta64 rows iterate as Timestamp/Timedelta
+        return [list(df.iloc[:, j]) for j in range(values.shape[1])]
+    if values.dtype == object:
+        cells = []
+        for j in range(values.shape[1]):
+            col = values[:, j].tolist()
+            if not set(map(type, col)) <= _PLAIN_TYPES:
+                col = list(map(maybe_box_native, col))
+            cells.append(col)
+        return cells
+    # Numeric/bool: ndarray.tolist() yields native Python scalars
+    return [values[:, j].tolist() for j in range(values.shape[1])]
+
+
+def _as_object_array(items) -> np.ndarray:
+    strings = list(items)
+    arr = np.empty(len(strings), dtype=object)
+    arr[:] = strings
+    return arr
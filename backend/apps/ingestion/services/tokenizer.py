@@ -0,0 +1,20 @@
+# apps/ingestion/services/tokenizer.py
+
+from typing import List
+
+import tiktoken
+
+# Use cl100k_base encoding (used by OpenAI embedding models) for precise token counting
+encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Return the number of tokens in `text` using cl100k_base encoding."""
+    return len(encoding.encode(text))
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """Token counts for many texts, encoded in one (multi-threaded) batch call."""
+    if not texts:
+        return []
+    return [len(tokens) for tokens in encoding.encode_batch(texts)]
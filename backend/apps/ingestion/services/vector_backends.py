@@ -0,0 +1,107 @@
+# apps/ingestion/services/vector_backends.py
+
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+# (chunk_id, text, metadata, distance); lower distance = more similar
+SearchHit = Tuple[str, str, Dict[str, Any], float]
+
+
+class VectorStore:
+    """
+    Storage interface the ingestion pipeline and query engine use for chunk vectors.
+
+    Backends are picked with VECTOR_STORE_BACKEND (see vector_store.open_vector_store).
+    `where` arguments are Chroma-style metadata filters ($and, $or, $eq,
+    $in, $gte, ...), as built by query.filters.build_where.
+    """
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        """Insert chunks, replacing any stored under the same ids."""
+        raise NotImplementedError
+
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Replace the metadata of stored chunks, keeping their vectors."""
+        raise NotImplementedError
+
+    def get_metadata(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Metadata of those ids that are stored, keyed by id."""
+        raise NotImplementedError
+
+    def ids_where(self, where: Dict[str, Any]) -> Set[str]:
+        """Ids of every stored chunk matching a metadata filter."""
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Remove chunks by id; unknown ids are ignored."""
+        raise NotImplementedError
+
+    def search(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        k: int,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[List[SearchHit]]:
+        """Nearest `k` chunks for each query vector, best first."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore over a ChromaDB collection (the default backend)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(
+            ids=list(ids),
+            embeddings=list(embeddings),
+            documents=list(documents),
+            metadatas=list(metadatas),
+        )
+
+    def update_metadata(self, ids, metadatas) -> None:
+        if ids:
+            self.collection.update(ids=list(ids), metadatas=list(metadatas))
+
+    def get_metadata(self, ids) -> Dict[str, Dict[str, Any]]:
+        if not ids:
+            return {}
+        result = self.collection.get(ids=list(ids), include=["metadatas"])
+        return dict(zip(result["ids"], result["metadatas"]))
+
+    def ids_where(self, where) -> Set[str]:
+        return set(self.collection.get(where=where, include=[])["ids"])
+
+    def delete(self, ids, batch_size: int = 1000) -> None:
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[start:start + batch_size])
+
+    def search(self, embeddings, k, where=None) -> List[List[SearchHit]]:
+        result = self.collection.query(
+            query_embeddings=list(embeddings),
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            [
+                (chunk_id, text, metadata or {}, distance)
+                for chunk_id, text, metadata, distance in zip(*columns)
+            ]
+            for columns in zip(
+                result["ids"], result["documents"], result["metadatas"], result["distances"]
+            )
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
@@ -1,42 +1,131 @@
 # apps/ingestion/services/vector_store.py
 
+import hashlib
+import os
 import uuid
 import logging
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, List, Optional, Set
 
 from django.conf import settings
-from langchain_chroma import Chroma
-#from chromadb.config import Settings
-import chromadb
+
+from .flat_index import FlatVectorStore
+from .vector_backends import ChromaVectorStore, SearchHit, VectorStore
+
 logger = logging.getLogger(__name__)
 
-# ── Initialize ChromaDB client & collection ─────────────────────────────────────
-from chromadb.config import Settings
 
-chroma_client = chromadb.PersistentClient(
-    path=settings.CHROMA_PERSIST_DIR,
-    settings=Settings(),
-) 
+# ── Vector store backend (VECTOR_STORE_BACKEND) ────────────────────────────────
+
+VECTOR_STORE_BACKENDS = ("chroma", "flat")
+
+
+def open_vector_store(collection_name: str) -> VectorStore:
+    """
+    Open the configured backend for a collection.
+
+    "chroma": the ChromaDB collection in CHROMA_PERSIST_DIR.
+    "flat":   FlatVectorStore in FLAT_INDEX_DIR/<collection_name>, holding
+              FLAT_INDEX_DTYPE ("float32" or "int8") vectors, compacted
+              past FLAT_INDEX_COMPACT_RATIO flagged rows.
+    """
+    backend = getattr(settings, "VECTOR_STORE_BACKEND", "chroma")
+    if backend == "chroma":
+        # Imported here so processes on the flat backend never pay Chroma's startup cost
+        import chromadb
+        from chromadb.config import Settings
+
+        client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR, settings=Settings())
+        return ChromaVectorStore(client.get_or_create_collection(name=collection_name))
+    if backend == "flat":
+        return FlatVectorStore(
+            os.path.join(settings.FLAT_INDEX_DIR, collection_name),
+            dtype=getattr(settings, "FLAT_INDEX_DTYPE", "float32"),
+            compact_ratio=getattr(settings, "FLAT_INDEX_COMPACT_RATIO", 0.3) or None,
+        )
+    raise ValueError(
+        f"Unknown VECTOR_STORE_BACKEND {backend!r}; expected one of {', '.join(VECTOR_STORE_BACKENDS)}"
+    )
+
+
+# Shared store for the configured collection
+store = open_vector_store(getattr(settings, "CHROMA_COLLECTION_NAME", "reportminer"))
+
+
+# ── Collection version (lets query-side caches notice new ingestions) ──────────
+
+def _version_path(collection_name: str) -> str:
+    return os.path.join(settings.CHROMA_PERSIST_DIR, f"{collection_name}.version")
+
+
+def get_collection_version(collection_name: str) -> str:
+    """Return the collection's current version token ("" if never bumped)."""
+    try:
+        with open(_version_path(collection_name)) as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_collection_version(collection_name: str) -> str:
+    """
+    Record that the collection's contents changed.
+
+    The token lives in a small file next to the Chroma data, so Celery
+    workers and Django processes on the host all see the same value.
+    """
+    version = uuid.uuid4().hex
+    path = _version_path(collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fh:
+        fh.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+
+def make_chunk_id(document_id: str, text: str, occurrence: int = 0) -> str:
+    """
+    Deterministic chunk id: a UUID derived from the document id and the chunk text.
+
+    Re-ingesting a document therefore reproduces the ids of unchanged chunks.
+    `occurrence` tells identical texts within one document apart (0 for the
+    first, 1 for the second, ...).
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(uuid.UUID(str(document_id)), f"{digest}:{occurrence}"))
 
-collection = chroma_client.get_or_create_collection(
-    name=getattr(settings, "CHROMA_COLLECTION_NAME", "reportminer")
-)
+
+def chunk_metadata(chunk: Dict[str, Any], chunk_id: str) -> Dict[str, Any]:
+    """Metadata stored with a chunk: its own, plus chunk_id/token_count, minus None values."""
+    meta = dict(chunk.get("metadata", {}))
+    meta.update({
+        "chunk_id":   chunk_id,
+        "token_count": chunk.get("token_count"),
+    })
+    return {k: v for k, v in meta.items() if v is not None}
 
 
 def add_vectors(
     chunks: List[Dict[str, Any]],
     embeddings: List[List[float]]
-) -> None:
+) -> List[str]:
     """
-    Add a batch of embeddings to ChromaDB, sanitizing metadata to remove None values.
+    Upsert a batch of embeddings into the vector store, sanitizing metadata to remove None values.
+
+    Chunks carrying a "chunk_id" (see make_chunk_id) keep it, so writing the
+    same chunk twice replaces it instead of duplicating it; others get a
+    random id.
 
     Args:
         chunks: List of dicts with keys 'text', 'metadata', and 'token_count'.
         embeddings: Corresponding list of vector embeddings.
 
+    Returns:
+        The ids assigned to the chunks, in order.
+
     Raises:
         ValueError: If lengths of chunks and embeddings differ, or if required fields missing.
-        RuntimeError: On failure to add to ChromaDB.
+        RuntimeError: On failure to write to the vector store.
     """
     if len(chunks) != len(embeddings):
         raise ValueError(
@@ -51,26 +140,50 @@ def add_vectors(
         text = chunk.get("text")
         if text is None:
             raise ValueError("Each chunk must include a 'text' field")
-        chunk_id = str(uuid.uuid4())
-
-        meta = dict(chunk.get("metadata", {}))
-        meta.update({
-            "chunk_id":   chunk_id,
-            "token_count": chunk.get("token_count"),
-        })
-        clean_meta = {k: v for k, v in meta.items() if v is not None}
+        chunk_id = chunk.get("chunk_id") or str(uuid.uuid4())
 
         ids.append(chunk_id)
         docs.append(text)
-        metas.append(clean_meta)
+        metas.append(chunk_metadata(chunk, chunk_id))
 
     try:
-        collection.add(
-            ids=ids,
-            documents=docs,
-            embeddings=embeddings,
-            metadatas=metas,
-        )
+        store.upsert(ids, embeddings, docs, metas)
     except Exception as e:
-        logger.error("ChromaDB vector insert failed: %s", e)
-        raise RuntimeError("Failed to add vectors to ChromaDB") from e
+        logger.error("Vector store insert failed: %s", e)
+        raise RuntimeError("Failed to add vectors to the vector store") from e
+    return ids
+
+
+def update_metadata(chunks: List[Dict[str, Any]]) -> None:
+    """Rewrite the stored metadata of chunks (by "chunk_id") without touching their vectors."""
+    if chunks:
+        store.update_metadata(
+            [c["chunk_id"] for c in chunks],
+            [chunk_metadata(c, c["chunk_id"]) for c in chunks],
+        )
+
+
+def stored_metadata(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Metadata of the given chunk ids that exist in the collection, keyed by id."""
+    return store.get_metadata(ids)
+
+
+def document_chunk_ids(document_id: str) -> Set[str]:
+    """Ids of every chunk stored for a document (chunks stamped with its document_id)."""
+    return store.ids_where({"document_id": str(document_id)})
+
+
+def delete_vectors(ids: Iterable[str]) -> int:
+    """Delete chunks by id; returns how many ids were given."""
+    ids = list(ids)
+    store.delete(ids)
+    return len(ids)
+
+
+def search_vectors(
+    embeddings: List[List[float]],
+    k: int,
+    where: Optional[Dict[str, Any]] = None,
+) -> List[List[SearchHit]]:
+    """Top-k (chunk_id, text, metadata, distance) per query vector, best first."""
+    return store.search(embeddings, k, where)
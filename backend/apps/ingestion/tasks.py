@@ -69,91 +69,248 @@
 #         if doc:
 #             doc.mark_error(str(e))
 #         raise
-import uuid
+import hashlib
+from collections import deque
 from celery import shared_task
-from django.utils import timezone
-from .models import Document
-from .services.extractor import extract_raw
-from .services.splitter import split_text
+from .models import Document, IngestionBatch
+from .services.extractor import iter_raw
+from .services.extraction_cache import extraction_cache
 from .services.embedder import embed_texts
-from .services.vector_store import add_vectors
+from .services.vector_store import (
+    add_vectors, bump_collection_version, chunk_metadata, delete_vectors,
+    document_chunk_ids, stored_metadata, update_metadata,
+)
+from .services.lexical_index import lexical_index
+from .services.metrics import StageMetrics
+from .services.pipeline import assign_chunk_ids, batched, embed_batches, iter_chunks, store_tables
+from .services.structured_store import structured_store
 from django.conf import settings
 from celery.utils.log import get_task_logger
 
 logger = get_task_logger(__name__)
 
-def sanitize_metadata(metadata_dict):
-    """Ensure all metadata keys/values are valid for ChromaDB."""
-    sanitized = {}
-    for key, value in metadata_dict.items():
-        # Ensure the key is a string (convert if not)
-        str_key = str(key) if key is not None else "unknown_key"
-
-        # Convert value to allowed types
-        if isinstance(value, (str, int, float, bool)) or value is None:
-            sanitized[str_key] = value
-        elif isinstance(value, list):
-            sanitized[str_key] = ", ".join(str(item) for item in value)
-        else:
-            sanitized[str_key] = str(value)
-    return sanitized
+# Retrying won't help: missing document/file, unsupported or unparsable content
+_PERMANENT_ERRORS = (Document.DoesNotExist, FileNotFoundError, ValueError)
 
 
-@shared_task(bind=True)
+# acks_late: a task whose worker dies is redelivered and resumes from its checkpoints
+@shared_task(
+    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    max_retries=getattr(settings, "INGESTION_MAX_RETRIES", 3),
+)
 def process_document(self, document_id):
     """
-    Orchestrates the ingestion pipeline:
-      1. Load raw content (text or tables)
-      2. Split into chunks
-      3. Embed chunks
-      4. Store vectors in ChromaDB
-      5. Update Document status and metrics
+    Orchestrates the ingestion pipeline as a stream of batches:
+      1. Load raw content (text or tables) part by part, from the extraction
+         cache when this file was parsed before
+      2. Split into chunks, each with a deterministic id (document id + text hash)
+      3. Embed the chunks not already stored, INGESTION_BATCH_SIZE at a time
+         with up to INGESTION_MAX_IN_FLIGHT batches being embedded concurrently
+      4. Upsert each embedded batch into ChromaDB and the lexical (BM25) index;
+         extracted tables are also copied into the structured (SQL) store
+      5. Delete the document's stored chunks that no longer occur
+      6. Update Document status and metrics
+
+    Only a bounded number of batches is held in memory, so peak memory does
+    not grow with the file size. Re-ingesting an updated file only embeds
+    new or changed chunks (unchanged ones whose metadata moved, e.g. to
+    another page, get a metadata update).
+
+    Each batch is checkpointed (IngestionBatch) once embedded and once
+    written to both stores. A retried or redelivered run skips the batches
+    an earlier attempt wrote; a batch it only got as far as embedding is
+    upserted again whole (its vectors come from the embedding cache).
+    Transient failures are retried up to INGESTION_MAX_RETRIES times with
+    exponential backoff; checkpoints are dropped once the run succeeds.
+
+    Wall time, CPU time, peak RSS and rows/tokens per second of every stage
+    (parse, tables, chunk, lookup, embed, write) are stored on
+    Document.metrics, for failed attempts too.
+
+    Returns {"added": n, "unchanged": n, "removed": n} chunk counts.
     """
+    counts = {"added": 0, "unchanged": 0, "removed": 0}
+    changed = False
+    extraction = None
+    metrics = StageMetrics()
+    metrics.start()
     try:
         # 1. Retrieve and mark processing
         doc = Document.objects.get(id=document_id)
         doc.mark_processing()
 
-        # 2. Extract raw content
-        raw_doc = extract_raw(doc.file.path)
+        batch_size = getattr(settings, "INGESTION_BATCH_SIZE", 256)
+        max_in_flight = getattr(settings, "INGESTION_MAX_IN_FLIGHT", 2)
+
+        logger.info(f"[Celery] CHROMA_PERSIST_DIR = {settings.CHROMA_PERSIST_DIR}")
 
-        # 3. Build ingestion‐ready chunks:
-        chunks = []
+        # 2–3. Extract → chunk → batch → skip stored chunks → embed, all lazily
+        if extraction_cache is not None:
+            parts = extraction = extraction_cache.iter_raw(doc.file.path, doc.content_hash)
+        else:
+            parts = iter_raw(doc.file.path)
+        parts = metrics.timed(parts, "parse", count=_part_rows)
+        # document_id / file_type let queries filter on them (pushed down to Chroma)
+        extra_metadata = {"document_id": str(doc.id), "file_type": doc.file_type}
+        if structured_store is not None:
+            # Tables are rewritten whole on every run (cheap next to embedding)
+            structured_store.delete_document(doc.id)
+            parts = store_tables(parts, structured_store, str(doc.id), extra_metadata)
+            parts = metrics.timed(parts, "tables", count=_table_rows)
+        chunks = iter_chunks(parts, extra_metadata=extra_metadata)
+        batches = batched(assign_chunk_ids(chunks, str(doc.id)), batch_size)
+        batches = metrics.timed(batches, "chunk", count=_batch_size)
 
-        # 3a) pages from PDF/DOCX → one chunk per page
-        for page in raw_doc.pages:
-            # page already has {'text': ..., 'metadata': {...}}
-            chunks.append(page)
+        seen_ids = set()
+        totals = {"chunks": 0, "tokens": 0}
+        # Progress of an earlier, interrupted attempt (empty on a fresh run)
+        checkpoints = {b.index: b for b in doc.ingestion_batches.all()}
+        steps = deque()  # (index, ids digest, size) per batch, None = already written
 
-        # 3b) tables from XLSX/CSV → one chunk per row
-        for table in raw_doc.tables:
-            df = table["dataframe"]
-            sheet = table.get("sheet_name", "")
-            for _, row in df.iterrows():
-                row_dict = row.to_dict()  # ✅ define it once
-                row_meta = sanitize_metadata(row_dict)
-                row_meta["sheet_name"] = sheet
-                row_text = "; ".join(f"{k}: {v}" for k, v in row_dict.items())  # ✅ now it exists
-                chunks.append({"text": row_text, "metadata": row_meta})
+        def new_chunks(batches):
+            # Yields, per batch, the chunks that need embedding; the rest are counted here
+            nonlocal changed
+            for index, batch in enumerate(batches):
+                totals["chunks"] += len(batch)
+                totals["tokens"] += sum(c.get('token_count', 0) for c in batch)
+                metrics.add("lookup", rows=len(batch))
+                ids = [c["chunk_id"] for c in batch]
+                seen_ids.update(ids)
+                digest = _ids_digest(ids)
+                checkpoint = checkpoints.get(index)
+                if checkpoint is not None and checkpoint.ids_digest != digest:
+                    checkpoint = None  # left by a run over a different file or chunking
+                if checkpoint is not None and checkpoint.stage == 'WRITTEN':
+                    counts["added"] += checkpoint.added
+                    counts["unchanged"] += checkpoint.chunk_count - checkpoint.added
+                    steps.append(None)
+                    yield []
+                    continue
 
-        # 4. Embed texts
-        texts = [c['text'] for c in chunks]
-        embeddings = embed_texts(texts)
+                if checkpoint is not None:
+                    # The earlier attempt may have written part of it: upsert it whole
+                    fresh = batch
+                else:
+                    stored = stored_metadata(ids)
+                    fresh, moved = [], []
+                    for chunk in batch:
+                        meta = stored.get(chunk["chunk_id"])
+                        if meta is None:
+                            fresh.append(chunk)
+                        elif meta != chunk_metadata(chunk, chunk["chunk_id"]):
+                            moved.append(chunk)
+                    if moved:
+                        update_metadata(moved)
+                        _index_lexical(moved)
+                        changed = True
+                counts["unchanged"] += len(batch) - len(fresh)
+                steps.append((index, digest, len(batch)))
+                yield fresh
 
-    # ——>>> add this:
-        logger.info(f"Generated {len(embeddings)} embeddings for Document {document_id}")
+        embedded = embed_batches(
+            metrics.timed(new_chunks(batches), "lookup"),
+            metrics.count_cpu("embed", embed_texts),
+            max_in_flight,
+        )
+        for batch, embeddings in metrics.timed(embedded, "embed", count=lambda e: _batch_size(e[0])):
+            step = steps.popleft()
+            if step is None:
+                continue
+            index, digest, size = step
+            with metrics.stage("write"):
+                if batch:
+                    # 4. Upsert vectors into ChromaDB, and the same chunks into the BM25 index
+                    _checkpoint(doc, index, digest, 'EMBEDDED', size, len(batch))
+                    add_vectors(batch, embeddings)
+                    _index_lexical(batch)
+                    changed = True
+                    counts["added"] += len(batch)
+                    metrics.add("write", *_batch_size(batch))
+                _checkpoint(doc, index, digest, 'WRITTEN', size, len(batch))
 
-        logger.info(f"[Celery] CHROMA_PERSIST_DIR = {settings.CHROMA_PERSIST_DIR}")
+        # 5. Chunks from a previous version of the file that are gone now
+        with metrics.stage("write"):
+            stale = document_chunk_ids(doc.id) - seen_ids
+            if stale:
+                counts["removed"] = delete_vectors(stale)
+                if lexical_index is not None:
+                    lexical_index.delete(list(stale))
+                changed = True
 
-        # 5. Add vectors to ChromaDB
-        add_vectors(chunks, embeddings)
+        logger.info(
+            f"Document {document_id}: {counts['added']} chunks added, "
+            f"{counts['unchanged']} unchanged, {counts['removed']} removed"
+        )
 
         # 6. Finalize success
-        total_tokens = sum(c.get('token_count', 0) for c in chunks)
-        doc.mark_success(chunk_count=len(chunks), total_tokens=total_tokens)
+        doc.ingestion_batches.all().delete()
+        doc.mark_success(chunk_count=totals["chunks"], total_tokens=totals["tokens"])
+        return counts
     except Exception as e:
-        # Log error and mark document failed
         doc = Document.objects.filter(id=document_id).first()
+        if (
+            doc is not None
+            and not isinstance(e, _PERMANENT_ERRORS)
+            and not self.request.called_directly
+            and self.request.retries < self.max_retries
+        ):
+            # Cache the rest of the parse so the retry only redoes the failed step
+            if extraction is not None:
+                extraction.finish()
+            doc.mark_retry(str(e))
+            backoff = getattr(settings, "INGESTION_RETRY_BACKOFF", 30)
+            raise self.retry(exc=e, countdown=backoff * 2 ** self.request.retries)
+        # Log error and mark document failed
         if doc:
             doc.mark_error(str(e))
-        raise
\ No newline at end of file
+        raise
+    finally:
+        metrics.stop()
+        Document.objects.filter(id=document_id).update(metrics={
+            **metrics.as_dict(),
+            "chunks": counts,
+            "attempt": self.request.retries or 0,
+        })
+        # Any written vectors change what queries can retrieve; drop cached answers
+        if changed:
+            bump_collection_version(settings.CHROMA_COLLECTION_NAME)
+
+
+def _index_lexical(chunks):
+    if lexical_index is not None:
+        lexical_index.add(
+            [c["chunk_id"] for c in chunks],
+            [c["text"] for c in chunks],
+            [chunk_metadata(c, c["chunk_id"]) for c in chunks],
+        )
+
+
+def _part_rows(part):
+    return len(part.pages) + sum(len(t["dataframe"]) for t in part.tables), 0
+
+
+def _table_rows(part):
+    return sum(len(t["dataframe"]) for t in part.tables), 0
+
+
+def _batch_size(batch):
+    return len(batch), sum(c.get('token_count', 0) for c in batch)
+
+
+def _ids_digest(ids):
+    return hashlib.blake2b("\n".join(ids).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _checkpoint(doc, index, digest, stage, chunk_count, added):
+    IngestionBatch.objects.update_or_create(
+        document=doc,
+        index=index,
+        defaults={
+            "ids_digest": digest,
+            "stage": stage,
+            "chunk_count": chunk_count,
+            "added": added,
+        },
+    )
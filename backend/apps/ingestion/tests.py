@@ -1,3 +1,598 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+from itertools import count
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import openai
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import tasks
+from .models import Document
+from .services import async_embedder, embedding_cache as embedding_cache_module, vector_store
+from .services.async_embedder import AsyncEmbeddingExecutor, TokenBucket
+from .services.embedding_cache import EmbeddingCache
+from .services.extraction_cache import ExtractionCache
+from .services.flat_index import FlatVectorStore
+from .services.pipeline import assign_chunk_ids
+from .services.splitter import token_windows
+from .services.structured_store import StructuredStore
+from .services.extractor import iter_pdf_shards, iter_raw
+from .services.table_chunker import (
+    MODE_AUTO, MODE_ROW, MODE_ROW_GROUP, chunk_table, iter_row_chunks_loop, iter_row_group_chunks,
+    row_chunks_columnar,
+)
+from .services.tokenizer import count_tokens, encoding
+from .services.vector_store import make_chunk_id
+
+DOCUMENT_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class TempDirMixin:
+    """Gives each test a scratch directory, removed afterwards."""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+
+class RowChunkTests(SimpleTestCase):
+
+    def table(self, df, **metadata):
+        return {"sheet_name": "Sales", "dataframe": df, "metadata": {"source": "sales.xlsx", **metadata}}
+
+    def assertSameChunks(self, table):
+        # repr() so NaN cells compare equal, while 3 and 3.0 still differ
+        self.assertEqual(repr(row_chunks_columnar(table)), repr(list(iter_row_chunks_loop(table))))
+
+    def test_columnar_matches_loop_on_mixed_frame(self):
+        df = pd.DataFrame({
+            "Region": ["North", None, "East"],
+            "Units": [3, 4, 5],
+            "Price": [1.5, np.nan, 2.25],
+            "Date": pd.to_datetime(["2024-01-01", "2024-02-01", None]),
+            "Shipped": [True, False, True],
+            "Mixed": [1, "two", 3.0],
+        })
+        self.assertSameChunks(self.table(df))
+
+    def test_columnar_matches_loop_on_uniform_frames(self):
+        self.assertSameChunks(self.table(pd.DataFrame({"a": [1, 2], "b": [3, 4]})))
+        self.assertSameChunks(self.table(pd.DataFrame({"a": [1, 2], "b": [0.5, 4.0]})))
+        self.assertSameChunks(self.table(pd.DataFrame({"d": pd.to_datetime(["2024-01-01", "2024-01-02"])})))
+        self.assertSameChunks(self.table(pd.DataFrame({"a": ["x", "y"]}), page=2))
+        self.assertEqual(row_chunks_columnar(self.table(pd.DataFrame({"a": []}))), [])
+
+    def test_row_chunk_text_metadata_and_tokens(self):
+        df = pd.DataFrame({"Region": ["North"], "Units": [3]})
+        [chunk] = row_chunks_columnar(self.table(df, page=4))
+        self.assertEqual(chunk["text"], "Region: North; Units: 3")
+        self.assertEqual(chunk["token_count"], count_tokens(chunk["text"]))
+        self.assertEqual(chunk["metadata"], {
+            "Region": "North", "Units": 3, "source": "sales.xlsx",
+            "sheet_name": "Sales", "chunk_type": MODE_ROW, "page": 4,
+        })
+
+    def test_columns_named_like_system_keys_are_renamed(self):
+        df = pd.DataFrame({"page": [7], "col_page": ["x"], "Region": ["North"]})
+        table = self.table(df, page=2)
+        self.assertSameChunks(table)
+        [chunk] = row_chunks_columnar(table)
+        self.assertEqual(chunk["metadata"]["page"], 2)
+        self.assertEqual(chunk["metadata"]["col_page"], "x")
+        self.assertEqual(chunk["metadata"]["col_col_page"], 7)
+        self.assertEqual(chunk["text"], "page: 7; col_page: x; Region: North")
+
+
+class RowGroupChunkTests(SimpleTestCase):
+
+    def setUp(self):
+        df = pd.DataFrame({
+            "Region": ["North", "South", "East", "West"] * 25,
+            "Units": range(100),
+            "Revenue": np.linspace(0, 1e6, 100),
+        })
+        self.table = {"sheet_name": "Sales", "dataframe": df, "metadata": {"source": "sales.csv"}}
+
+    def test_groups_stay_within_token_budget(self):
+        chunks = list(iter_row_group_chunks(self.table, token_budget=60, max_rows=50))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk["token_count"], 60)
+            self.assertEqual(chunk["metadata"]["chunk_type"], MODE_ROW_GROUP)
+            self.assertEqual(chunk["metadata"]["columns"], "Region, Units, Revenue")
+            self.assertTrue(chunk["text"].startswith("Region | Units | Revenue\n"))
+            self.assertEqual(len(chunk["text"].split("\n")) - 1, chunk["metadata"]["row_count"])
+
+    def test_groups_cover_every_row_once(self):
+        chunks = list(iter_row_group_chunks(self.table, token_budget=60, max_rows=50))
+        expected_start = 1
+        for chunk in chunks:
+            meta = chunk["metadata"]
+            self.assertEqual(meta["row_start"], expected_start)
+            self.assertEqual(meta["row_end"] - meta["row_start"] + 1, meta["row_count"])
+            expected_start = meta["row_end"] + 1
+        self.assertEqual(expected_start, 101)
+
+    def test_max_rows_closes_groups(self):
+        chunks = list(iter_row_group_chunks(self.table, token_budget=100_000, max_rows=30))
+        self.assertEqual([c["metadata"]["row_count"] for c in chunks], [30, 30, 30, 10])
+
+    def test_row_larger_than_budget_gets_its_own_chunk(self):
+        df = pd.DataFrame({"Note": ["short", "word " * 200, "short"]})
+        table = {"sheet_name": "Notes", "dataframe": df, "metadata": {}}
+        chunks = list(iter_row_group_chunks(table, token_budget=50, max_rows=50))
+        self.assertEqual([c["metadata"]["row_count"] for c in chunks], [1, 1, 1])
+        self.assertGreater(chunks[1]["token_count"], 50)
+
+
+@override_settings(CSV_FULL_SHEET_INGESTION=False, CSV_CHUNKSIZE=5, INGESTION_ROW_EMBED_THRESHOLD=200)
+class AutoChunkModeTests(TempDirMixin, SimpleTestCase):
+
+    def chunk_types(self, rows):
+        path = os.path.join(self.tmp, "sales.csv")
+        pd.DataFrame({"Units": range(rows)}).to_csv(path, index=False)
+        return [
+            {c["metadata"]["chunk_type"] for table in part.tables for c in chunk_table(table, MODE_AUTO)}
+            for part in iter_raw(path)
+        ]
+
+    def test_small_csv_read_in_one_part_is_chunked_per_row(self):
+        self.assertEqual(self.chunk_types(4), [{MODE_ROW}])
+
+    def test_every_part_of_a_chunked_csv_gets_row_groups(self):
+        # 12 rows in parts of 5: the short last part must not switch to row chunks
+        self.assertEqual(self.chunk_types(12), [{MODE_ROW_GROUP}] * 3)
+
+
+class TokenWindowTests(SimpleTestCase):
+
+    text = "Revenue €1,200 — 東京 增长 " * 40
+
+    def test_windows_without_overlap_keep_every_character(self):
+        for chunk_tokens in (3, 7, 50):
+            [pieces] = token_windows([self.text], chunk_tokens, 0)
+            # Whitespace-only windows are dropped; every other character must survive
+            joined = "".join(text for text, _ in pieces)
+            self.assertEqual(joined.replace(" ", ""), self.text.replace(" ", ""))
+            self.assertTrue(all(n <= chunk_tokens for _, n in pieces))
+
+    def test_overlapping_windows_are_substrings(self):
+        [pieces] = token_windows([self.text], 10, 3)
+        self.assertGreater(len(pieces), 1)
+        for text, n in pieces:
+            self.assertIn(text, self.text)
+            self.assertEqual(n, len(encoding.encode_ordinary(text)))
+
+
+class ChunkIdTests(SimpleTestCase):
+
+    def chunks(self, *texts):
+        return [{"text": t, "metadata": {}} for t in texts]
+
+    def test_ids_are_deterministic(self):
+        first = [c["chunk_id"] for c in assign_chunk_ids(self.chunks("a", "b"), DOCUMENT_ID)]
+        second = [c["chunk_id"] for c in assign_chunk_ids(self.chunks("a", "b"), DOCUMENT_ID)]
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], make_chunk_id(DOCUMENT_ID, "a"))
+
+    def test_repeated_texts_get_their_own_ids(self):
+        ids = [c["chunk_id"] for c in assign_chunk_ids(self.chunks("a", "b", "a"), DOCUMENT_ID)]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(ids[2], make_chunk_id(DOCUMENT_ID, "a", 1))
+
+    def test_ids_depend_on_the_document(self):
+        other = "00000000-0000-0000-0000-000000000002"
+        self.assertNotEqual(make_chunk_id(DOCUMENT_ID, "a"), make_chunk_id(other, "a"))
+
+
+@override_settings(
+    EMBEDDING_PROVIDER="hashing",
+    EMBEDDING_PROVIDERS={},
+    INGESTION_BATCH_SIZE=4,
+    INGESTION_TABLE_CHUNK_MODE=MODE_ROW,
+    CSV_FULL_SHEET_INGESTION=True,
+)
+class ProcessDocumentTests(TempDirMixin, TestCase):
+    """Incremental re-ingestion and checkpoint resume, against a throwaway flat index."""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp, "media"),
+            CHROMA_PERSIST_DIR=os.path.join(self.tmp, "chroma"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        store = FlatVectorStore(os.path.join(self.tmp, "flat"))
+        for target, name, value in (
+            (vector_store, "store", store),
+            (tasks, "extraction_cache", None),
+            (tasks, "lexical_index", None),
+            (tasks, "structured_store", None),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.embedded = []
+        embed_texts = tasks.embed_texts
+
+        def recording_embed(texts):
+            self.embedded.extend(texts)
+            return embed_texts(texts)
+
+        patcher = mock.patch.object(tasks, "embed_texts", recording_embed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, rows):
+        content = "Region,Units\n" + "".join(f"{region},{units}\n" for region, units in rows)
+        return Document.objects.create(file=SimpleUploadedFile("sales.csv", content.encode("utf-8")))
+
+    def replace_file(self, doc, rows):
+        content = "Region,Units\n" + "".join(f"{region},{units}\n" for region, units in rows)
+        with open(doc.file.path, "w") as fh:
+            fh.write(content)
+
+    def ingest(self, doc):
+        self.embedded.clear()
+        return tasks.process_document(doc.id)
+
+    def rows(self, n):
+        return [(f"Region{i}", i) for i in range(n)]
+
+    def test_reingest_only_embeds_changed_chunks(self):
+        doc = self.upload(self.rows(10))
+        self.assertEqual(self.ingest(doc), {"added": 10, "unchanged": 0, "removed": 0})
+        self.assertEqual(len(self.embedded), 10)
+        self.assertEqual(len(vector_store.document_chunk_ids(doc.id)), 10)
+
+        self.assertEqual(self.ingest(doc), {"added": 0, "unchanged": 10, "removed": 0})
+        self.assertEqual(self.embedded, [])
+
+        rows = self.rows(10)
+        rows[3] = ("Changed", 3)
+        del rows[7:]
+        self.replace_file(doc, rows)
+        self.assertEqual(self.ingest(doc), {"added": 1, "unchanged": 6, "removed": 4})
+        self.assertEqual(self.embedded, ["Region: Changed; Units: 3"])
+        self.assertEqual(len(vector_store.document_chunk_ids(doc.id)), 7)
+        doc.refresh_from_db()
+        self.assertEqual(doc.status, "SUCCESS")
+        self.assertEqual(doc.chunk_count, 7)
+
+    def test_interrupted_run_resumes_after_written_batches(self):
+        doc = self.upload(self.rows(10))
+        add_vectors = tasks.add_vectors
+        calls = count()
+
+        def failing_add_vectors(batch, embeddings):
+            if next(calls) == 1:
+                raise RuntimeError("store unavailable")
+            return add_vectors(batch, embeddings)
+
+        with mock.patch.object(tasks, "add_vectors", failing_add_vectors):
+            with self.assertRaises(RuntimeError):
+                self.ingest(doc)
+        stages = dict(doc.ingestion_batches.values_list("index", "stage"))
+        self.assertEqual(stages, {0: "WRITTEN", 1: "EMBEDDED"})
+
+        # Batch 0 (4 rows) is skipped; batch 1 is upserted again whole
+        self.assertEqual(self.ingest(doc), {"added": 10, "unchanged": 0, "removed": 0})
+        self.assertEqual(len(self.embedded), 6)
+        self.assertEqual(len(vector_store.document_chunk_ids(doc.id)), 10)
+        self.assertFalse(doc.ingestion_batches.exists())
+
+    def test_checkpoints_of_a_different_file_are_ignored(self):
+        doc = self.upload(self.rows(10))
+        doc.ingestion_batches.create(index=0, ids_digest="0" * 32, stage="WRITTEN", chunk_count=4, added=4)
+        self.assertEqual(self.ingest(doc), {"added": 10, "unchanged": 0, "removed": 0})
+        self.assertEqual(len(self.embedded), 10)
+
+
+class _FakeClock:
+    """time.monotonic()/asyncio.sleep() stand-ins: sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = _FakeClock()
+        for name, value in (
+            ("time", SimpleNamespace(monotonic=self.clock.monotonic)),
+            ("asyncio", SimpleNamespace(sleep=self.clock.sleep)),
+        ):
+            patcher = mock.patch.object(async_embedder, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def acquire(self, bucket, *amounts):
+        async def run():
+            for amount in amounts:
+                await bucket.acquire(amount)
+        asyncio.run(run())
+
+    def test_burst_is_one_second_of_budget(self):
+        bucket = TokenBucket(per_minute=600)   # 10 per second
+        self.acquire(bucket, 10)
+        self.assertEqual(self.clock.now, 0)
+        self.acquire(bucket, 5)
+        self.assertAlmostEqual(self.clock.now, 0.5)
+
+    def test_oversized_request_is_charged_in_full(self):
+        bucket = TokenBucket(per_minute=60)    # 1 per second, capacity 1
+        self.acquire(bucket, 5)
+        self.assertEqual(self.clock.now, 0)
+        # The 4 units of debt are refilled before the next unit is granted
+        self.acquire(bucket, 1)
+        self.assertAlmostEqual(self.clock.now, 5)
+
+
+class AsyncEmbeddingExecutorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.executor = AsyncEmbeddingExecutor(model="m", api_key="k", max_input_tokens=4, max_retries=2)
+        self.inputs = []
+        self.failures = []
+        self.client = SimpleNamespace(embeddings=SimpleNamespace(create=self.create))
+        patcher = mock.patch.object(self.executor, "_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(async_embedder.asyncio, "sleep", mock.AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def create(self, model, input):
+        self.inputs.append(list(input))
+        if self.failures:
+            raise self.failures.pop(0)
+        # Pieces of a full window on the first axis, everything else on the second
+        data = [
+            SimpleNamespace(index=i, embedding=[1.0, 0.0] if len(encoding.encode(text)) == 4 else [0.0, 1.0])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=data)
+
+    def test_long_texts_are_averaged_over_pieces(self):
+        tokens = encoding.encode("one two three four five six")[:6]
+        long_text = encoding.decode(tokens)
+        vectors = asyncio.run(self.executor.embed(["a", long_text]))
+        self.assertEqual(self.inputs, [["a", encoding.decode(tokens[:4]), encoding.decode(tokens[4:])]])
+        self.assertEqual(vectors[0], [0.0, 1.0])
+        # Weighted by token count (4 and 2), then normalised
+        np.testing.assert_allclose(vectors[1], np.array([4.0, 2.0]) / np.linalg.norm([4.0, 2.0]))
+
+    def test_connection_errors_and_timeouts_are_retried(self):
+        request = mock.Mock()
+        self.failures = [openai.APIConnectionError(request=request), openai.APITimeoutError(request=request)]
+        self.assertEqual(asyncio.run(self.executor.embed(["a"])), [[0.0, 1.0]])
+        self.assertEqual(len(self.inputs), 3)
+        self.assertEqual(self.executor.retries, 2)
+
+
+def _write_pdf(path, page_texts):
+    """A minimal PDF with one line of Helvetica text per page."""
+    n = len(page_texts)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+class PdfShardTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp, "report.pdf")
+        _write_pdf(self.path, [f"Page {n}" for n in range(1, 6)])
+
+    def pages(self, shards):
+        return [[(p["metadata"]["page"], p["text"]) for p in shard.pages] for shard in shards]
+
+    @override_settings(PDF_SHARD_PAGES=2, PDF_SHARD_MIN_PAGES=2, PDF_SHARD_WORKERS=2)
+    def test_shards_are_parsed_in_page_order(self):
+        self.assertEqual(self.pages(iter_pdf_shards(self.path)), [
+            [(1, "Page 1"), (2, "Page 2")],
+            [(3, "Page 3"), (4, "Page 4")],
+            [(5, "Page 5")],
+        ])
+
+    @override_settings(PDF_SHARD_PAGES=2, PDF_SHARD_MIN_PAGES=5, PDF_SHARD_WORKERS=2)
+    def test_short_pdfs_are_not_sharded(self):
+        self.assertEqual(self.pages(iter_pdf_shards(self.path)), [[(n, f"Page {n}") for n in range(1, 6)]])
+
+
+class StructuredStoreTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = StructuredStore(os.path.join(self.tmp, "structured.sqlite3"))
+
+    def add(self, sheet, **columns):
+        table = {"sheet_name": sheet, "dataframe": pd.DataFrame(columns), "metadata": {}}
+        return self.store.add_table(DOCUMENT_ID, table)
+
+    def column_types(self):
+        [table] = self.store.tables()
+        return {c["name"]: c["type"] for c in table["columns"]}
+
+    def test_later_parts_append_to_the_same_table(self):
+        first = self.add("sales.csv_part1", Region=["North", "South"], Units=[1, 2])
+        second = self.add("sales.csv_part2", Region=["North"], Units=[3])
+        self.assertEqual(first, second)
+        [table] = self.store.tables()
+        self.assertEqual(table["row_count"], 3)
+        self.assertEqual(self.store.aggregate([table], "sum", "units", "region"), [("North", 4), ("South", 2)])
+
+    def test_integer_column_widens_to_real(self):
+        self.add("sales.csv_part1", Region=["North", "South"], Units=[1, 2])
+        self.assertEqual(self.column_types(), {"Region": "TEXT", "Units": "INTEGER"})
+        self.add("sales.csv_part2", Region=["North"], Units=[2.5])
+        self.assertEqual(self.column_types(), {"Region": "TEXT", "Units": "REAL"})
+        [table] = self.store.tables()
+        self.assertEqual(self.store.aggregate([table], "sum", "Units"), [(None, 5.5)])
+
+    def test_unparsable_cells_in_numeric_columns_become_null(self):
+        self.add("sales.csv_part1", Units=[1, 2])
+        self.add("sales.csv_part2", Units=["3", "-", "1,000"])
+        [table] = self.store.tables()
+        self.assertEqual(self.column_types(), {"Units": "INTEGER"})
+        self.assertEqual(self.store.aggregate([table], "sum", "Units"), [(None, 1006)])
+        self.assertEqual(self.store.aggregate([table], "count", "Units"), [(None, 4)])
+
+    def test_numeric_text_is_stored_as_real(self):
+        self.add("report", Revenue=["$1,200", "3.5%", "", None])
+        self.assertEqual(self.column_types(), {"Revenue": "REAL"})
+
+    def test_delete_document_drops_its_tables(self):
+        self.add("sales", Units=[1])
+        self.assertEqual(self.store.delete_document(DOCUMENT_ID), 1)
+        self.assertEqual(self.store.tables(), [])
+
+
+class EmbeddingCacheTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Distinct, increasing last-used times
+        clock = count(1)
+        patcher = mock.patch.object(
+            embedding_cache_module, "time",
+            SimpleNamespace(time=lambda: float(next(clock)), monotonic=lambda: 0.0),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cache(self, max_bytes=1 << 20):
+        cache = EmbeddingCache(os.path.join(self.tmp, "embeddings.sqlite3"), max_bytes=max_bytes)
+        self.addCleanup(cache._connect().close)
+        return cache
+
+    def test_hits_and_misses(self):
+        cache = self.cache()
+        self.assertEqual(cache.get_many("m", ["a", "b"]), [None, None])
+        cache.set_many("m", ["a"], [[1.0, 2.0]])
+        self.assertEqual(cache.get_many("m", ["a", "b", "a"]), [[1.0, 2.0], None, [1.0, 2.0]])
+        self.assertEqual(cache.get_many("other-model", ["a"]), [None])
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 4, 1))
+
+    def test_usage_is_buffered_until_flushed(self):
+        cache = self.cache()
+        cache.set_many("m", ["a"], [[1.0]])
+        cache.get_many("m", ["a", "b"])
+        other = EmbeddingCache(cache.path, max_bytes=cache.max_bytes)
+        self.addCleanup(other._connect().close)
+        self.assertEqual(other.stats()["hits"], 0)
+        cache.flush()
+        self.assertEqual((other.stats()["hits"], other.stats()["misses"]), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        # Room for two 4-float vectors (16 bytes each)
+        cache = self.cache(max_bytes=40)
+        cache.set_many("m", ["a"], [[1.0] * 4])
+        cache.set_many("m", ["b"], [[2.0] * 4])
+        cache.get_many("m", ["a"])
+        cache.set_many("m", ["c"], [[3.0] * 4])
+        self.assertEqual(cache.get_many("m", ["a", "b", "c"]), [[1.0] * 4, None, [3.0] * 4])
+        stats = cache.stats()
+        self.assertEqual((stats["evictions"], stats["entries"], stats["total_bytes"]), (1, 2, 32))
+
+
+@override_settings(CSV_FULL_SHEET_INGESTION=True)
+class ExtractionCacheTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = ExtractionCache(os.path.join(self.tmp, "extractions"), max_bytes=1 << 30)
+        self.addCleanup(lambda: self.cache._connect().close())
+
+    def write_csv(self, name, df):
+        path = os.path.join(self.tmp, name)
+        df.to_csv(path, index=False)
+        return path
+
+    def parse(self, path):
+        return [
+            (part.pages, [t["dataframe"] for t in part.tables])
+            for part in self.cache.iter_raw(path)
+        ]
+
+    def test_second_parse_is_served_from_cache(self):
+        df = pd.DataFrame({"Region": ["North", None], "Units": [1, 2], "Price": [1.5, None]})
+        path = self.write_csv("sales.csv", df)
+        first = self.parse(path)
+        with mock.patch("apps.ingestion.services.extraction_cache.iter_raw") as iter_raw:
+            second = self.parse(path)
+        iter_raw.assert_not_called()
+        self.assertEqual(len(first), len(second))
+        for (pages, frames), (cached_pages, cached_frames) in zip(first, second):
+            self.assertEqual(pages, cached_pages)
+            for frame, cached in zip(frames, cached_frames):
+                pd.testing.assert_frame_equal(frame, cached)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_changed_file_misses(self):
+        path = self.write_csv("sales.csv", pd.DataFrame({"Units": [1]}))
+        self.parse(path)
+        self.write_csv("sales.csv", pd.DataFrame({"Units": [2]}))
+        [(_, [frame])] = self.parse(path)
+        self.assertEqual(frame["Units"].tolist(), [2])
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_mixed_and_unnamed_columns_round_trip(self):
+        path = os.path.join(self.tmp, "sheet.csv")
+        open(path, "w").close()
+        df = pd.DataFrame([[1, "a", None], ["two", 3.5, None]], columns=["Mixed", None, None])
+        part = SimpleNamespace(pages=[], tables=[{"sheet_name": "Sheet1", "dataframe": df, "metadata": {}}])
+        with mock.patch("apps.ingestion.services.extraction_cache.iter_raw", return_value=iter([part])):
+            list(self.cache.iter_raw(path))
+        [(_, [cached])] = self.parse(path)
+        self.assertEqual(list(cached.columns), ["Mixed", None, None])
+        self.assertEqual(cached.values.tolist(), df.values.tolist())
+
+    def test_evicts_least_recently_used_entries(self):
+        first = self.write_csv("a.csv", pd.DataFrame({"Units": [1]}))
+        self.parse(first)
+        self.cache.max_bytes = self.cache.stats()["total_bytes"] * 3 // 2
+        self.parse(self.write_csv("b.csv", pd.DataFrame({"Units": [2]})))
+        stats = self.cache.stats()
+        self.assertEqual((stats["evictions"], stats["entries"]), (1, 1))
+        self.parse(first)
+        self.assertEqual(self.cache.stats()["misses"], 3)
@@ -0,0 +1,40 @@
+# backend/apps/ingestion/uploadhandlers.py
+
+import hashlib
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+def compute_content_hash(uploaded_file) -> str:
+    """Return the sha256 hex digest of an uploaded (or stored) file."""
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """
+    Pass-through upload handler that hashes file bytes while they stream in.
+
+    It must sit in front of Django's storing handlers: every chunk is fed to
+    sha256 and handed on unchanged, and the finished digests are collected in
+    `hashes`, keyed by form field name.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.hashes = {}
+        self._hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.hashes[self.field_name] = self._hasher.hexdigest()
+        # Let the next handler build the UploadedFile
+        return None
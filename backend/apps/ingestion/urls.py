@@ -1,7 +1,9 @@
 # backend/apps/ingestion/urls.py
 from django.urls import path
-from .views import DocumentUploadAPIView
+from .views import DocumentReingestAPIView, DocumentStatusAPIView, DocumentUploadAPIView
 
 urlpatterns = [
     path('upload/', DocumentUploadAPIView.as_view(), name='document-upload'),
+    path('documents/<uuid:document_id>/', DocumentStatusAPIView.as_view(), name='document-status'),
+    path('documents/<uuid:document_id>/reingest/', DocumentReingestAPIView.as_view(), name='document-reingest'),
 ]
@@ -1,11 +1,19 @@
+from django.db.models import Count
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.views import View
 
 # Create your views here.
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import DocumentUploadSerializer
+from .models import Document
+from .serializers import DocumentReingestSerializer, DocumentStatusSerializer, DocumentUploadSerializer
+from .services.embedder import cache_stats as embedding_cache_stats
+from .services.extraction_cache import extraction_cache
+from .services.metrics import prometheus_text
 from .tasks import process_document
+from .uploadhandlers import ContentHashUploadHandler, compute_content_hash
 
 class DocumentUploadAPIView(APIView):
     """
@@ -13,14 +21,46 @@ class DocumentUploadAPIView(APIView):
     Accepts a file upload, creates a Document record (status=PENDING),
     enqueues the processing task, and returns the document ID.
 
+    If identical bytes were already ingested successfully, the new record is
+    linked to the existing vectors (status=SUCCESS) and no task is queued.
+
     Note: permission handling is omitted for now.
     """
+    def initialize_request(self, request, *args, **kwargs):
+        # Hash the upload as it streams in (must be installed before parsing)
+        self.hash_handler = ContentHashUploadHandler(request)
+        request.upload_handlers.insert(0, self.hash_handler)
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, format=None):
         serializer = DocumentUploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
+        upload = serializer.validated_data['file']
+        content_hash = (
+            self.hash_handler.hashes.get('file')
+            or compute_content_hash(upload)
+        )
+
+        # Identical file already ingested → reuse its vectors
+        original = Document.find_ingested(content_hash)
+        if original is not None:
+            document = Document.objects.create(
+                file=original.file.name,
+                content_hash=content_hash,
+            )
+            document.link_duplicate(original)
+            return Response(
+                {
+                    "id": document.id,
+                    "status": document.status,
+                    "duplicate_of": original.id,
+                },
+                status=status.HTTP_200_OK
+            )
+
         # Create the Document (status=PENDING)
-        document = serializer.save()
+        document = serializer.save(content_hash=content_hash)
 
         # Enqueue Celery task
         process_document.delay(str(document.id))
@@ -30,3 +70,98 @@ class DocumentUploadAPIView(APIView):
             {"id": document.id, "status": document.status},
             status=status.HTTP_202_ACCEPTED
         )
+
+
+class DocumentReingestAPIView(APIView):
+    """
+    POST /api/ingestion/documents/<id>/reingest/
+    Re-runs ingestion for an existing document, optionally with an updated
+    file (multipart field "file"; omit it to re-process the stored file).
+
+    Chunk ids are derived from the document id and chunk text, so only new
+    or changed chunks are embedded and chunks that disappeared are deleted.
+
+    A new file with different content must not change what other uploads
+    linked through `duplicate_of` see: those are split off first (see
+    Document.split_off_duplicates) and the oldest is ingested on its own.
+    """
+    def initialize_request(self, request, *args, **kwargs):
+        self.hash_handler = ContentHashUploadHandler(request)
+        request.upload_handlers.insert(0, self.hash_handler)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, document_id, format=None):
+        document = Document.objects.filter(id=document_id).first()
+        if document is None:
+            return Response({"detail": "Document not found."}, status=status.HTTP_404_NOT_FOUND)
+        if document.duplicate_of_id is not None:
+            return Response(
+                {
+                    "detail": "This upload reuses another document's vectors; re-ingest that one.",
+                    "duplicate_of": document.duplicate_of_id,
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if document.status in ('PENDING', 'RUNNING'):
+            return Response(
+                {"detail": "Document is already being ingested.", "status": document.status},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        serializer = DocumentReingestSerializer(document, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data.get('file')
+        heir = None
+        if upload is not None:
+            content_hash = (
+                self.hash_handler.hashes.get('file')
+                or compute_content_hash(upload)
+            )
+            if content_hash != document.content_hash:
+                heir = document.split_off_duplicates()
+            serializer.save(content_hash=content_hash)
+
+        document.mark_pending()
+        process_document.delay(str(document.id))
+        response = {"id": document.id, "status": document.status}
+        if heir is not None:
+            process_document.delay(str(heir.id))
+            response["duplicates_moved_to"] = heir.id
+        return Response(response, status=status.HTTP_202_ACCEPTED)
+
+
+class DocumentStatusAPIView(APIView):
+    """
+    GET /api/ingestion/documents/<id>/
+    Status, error message, chunk/token counts and the per-stage metrics of
+    the last ingestion attempt (see services.metrics.StageMetrics).
+    """
+    def get(self, request, document_id, format=None):
+        document = Document.objects.filter(id=document_id).first()
+        if document is None:
+            return Response({"detail": "Document not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(DocumentStatusSerializer(document).data)
+
+
+class IngestionMetricsView(View):
+    """
+    GET /metrics
+    Prometheus text format: documents per status, per-stage ingestion time,
+    CPU, rows, tokens and peak RSS (summed over documents), cache counters.
+    """
+    def get(self, request):
+        status_counts = dict(
+            Document.objects.values_list('status').annotate(n=Count('id')).order_by()
+        )
+        document_metrics = (
+            Document.objects.filter(metrics__isnull=False)
+            .values_list('metrics', flat=True)
+            .iterator()
+        )
+        caches = {"embedding": embedding_cache_stats()}
+        if extraction_cache is not None:
+            caches["extraction"] = extraction_cache.stats()
+        return HttpResponse(
+            prometheus_text(status_counts, document_metrics, caches),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -0,0 +1,244 @@
+# apps/query/aggregates.py
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from apps.ingestion.services.structured_store import AGGREGATES, structured_store
+
+# Aggregate keywords, checked in this order ("average total" is an average)
+OPERATIONS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("avg", ("average", "mean", "avg")),
+    ("max", ("maximum", "max", "highest", "largest", "biggest")),
+    ("min", ("minimum", "min", "lowest", "smallest")),
+    ("sum", ("total", "sum", "sum of")),
+    ("count", ("how many", "number of", "count of", "count")),
+)
+GROUP_MARKERS = ("grouped by", "broken down by", "for each", "by", "per", "each")
+# Words that may surround an aggregate question without changing its meaning
+FILLER = frozenset("""
+    a all across an and are as at data did do does for from give have in is it list me
+    my of on our overall please record records row rows s sheet sheets show table tables
+    tell that the there value values was we were what whats which
+""".split())
+
+LABELS = {"sum": "Total", "avg": "Average", "min": "Minimum", "max": "Maximum", "count": "Count of"}
+
+
+def structured_answer(question: str, where: Optional[Dict[str, Any]] = None) -> Optional[dict]:
+    """
+    Answer a plain aggregate question straight from the structured store.
+
+    Handles questions made only of an aggregate word, column names of the
+    extracted tables and an optional "by <column>", e.g. "What is the total
+    revenue by region?" or "average unit price". Anything else (a condition,
+    a value, a document name) returns None so the question goes through
+    retrieval and the LLM instead, as does a question whose tables span
+    several documents: a file uploaded twice, or overlapping quarterly
+    sheets, would otherwise be counted more than once. Returns the
+    run_query output shape plus "aggregate" (see run_aggregate).
+    """
+    if structured_store is None:
+        return None
+    tables = structured_store.tables(where)
+    if not tables:
+        return None
+    spec = parse_question(question, tables)
+    if spec is None:
+        return None
+    op, column, group_by = spec
+    used = _tables_with(tables, column, group_by)
+    # The same column name in differently shaped tables (e.g. "Amount" on an invoices
+    # and a payments sheet) is ambiguous; let retrieval handle it
+    if len({tuple(c["name"].lower() for c in t["columns"]) for t in used}) != 1:
+        return None
+    if len({t["document_id"] for t in used}) != 1:
+        return None
+    result = _aggregate(used, op, column, group_by)
+    return {
+        "answer": format_answer(result),
+        "sources": result["tables"],
+        "cached": False,
+        "aggregate": result,
+    }
+
+
+def run_aggregate(
+    op: str,
+    column: Optional[str] = None,
+    group_by: Optional[str] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> dict:
+    """
+    Run `op` over `column` of every stored table that has it (and `group_by`).
+
+    Returns {"op", "column", "group_by", "rows": [{"group", "value"}],
+    "documents": [{"document_id", "source", "rows"}], "tables": [...]}, where
+    "documents" breaks the result down per document.
+    Raises ValueError for an unknown op, or when the structured store is disabled.
+    """
+    if structured_store is None:
+        raise ValueError("The structured store is disabled (STRUCTURED_STORE_ENABLED)")
+    if op not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate {op!r}; expected one of {', '.join(AGGREGATES)}")
+    if column is None and op != "count":
+        raise ValueError(f"'{op}' needs a column")
+    used = _tables_with(structured_store.tables(where), column, group_by)
+    return _aggregate(used, op, column, group_by)
+
+
+def parse_question(
+    question: str, tables: List[Dict[str, Any]]
+) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+    """(op, column, group_by) when the whole question is an aggregate over known columns."""
+    text = f" {_normalize(question)} "
+    op = phrase = None
+    for name, keywords in OPERATIONS:
+        phrase = next((k for k in keywords if f" {k} " in text), None)
+        if phrase:
+            op = name
+            break
+    if op is None:
+        return None
+    text = text.replace(f" {phrase} ", " ", 1)
+
+    columns: Dict[str, Tuple[str, bool]] = {}   # normalized name → (name, numeric)
+    for table in tables:
+        for column in table["columns"]:
+            key = _normalize(column["name"])
+            if key:
+                numeric = column["type"] in ("INTEGER", "REAL")
+                columns[key] = (column["name"], numeric or columns.get(key, ("", False))[1])
+
+    group_by = None
+    for marker in GROUP_MARKERS:
+        at = text.find(f" {marker} ")
+        if at < 0:
+            continue
+        rest = text[at + len(marker) + 2:]
+        found = _longest_match(f" {rest}", columns, prefix=True)
+        if found:
+            key, form = found
+            group_by = columns[key][0]
+            text = text[:at] + " " + rest[len(form):]
+            break
+
+    column = None
+    found = _longest_match(text, {k: v for k, v in columns.items() if v[1] or op == "count"})
+    if found:
+        key, form = found
+        column = columns[key][0]
+        text = text.replace(f" {form} ", " ", 1)
+    if column is None and op != "count":
+        return None
+
+    if any(word not in FILLER for word in text.split()):
+        return None
+    return op, column, group_by
+
+
+def format_answer(result: dict) -> str:
+    what = result["column"] or "rows"
+    label = f"{LABELS[result['op']]} {what}"
+    rows = result["rows"]
+    if not rows:
+        return f"No values found for {what}."
+    if result["group_by"] is None:
+        lines = [f"{label}: {_format_number(rows[0]['value'])}."]
+    else:
+        lines = [f"{label} by {result['group_by']}:"]
+        lines += [f"- {_format_group(row['group'])}: {_format_number(row['value'])}" for row in rows]
+    documents = result["documents"]
+    if len(documents) == 1:
+        lines.append(f"Source: {documents[0]['source']}.")
+    elif documents:
+        lines.append("By document:")
+        lines += [
+            f"- {document['source']}: " + ", ".join(
+                _format_number(row["value"]) if result["group_by"] is None
+                else f"{_format_group(row['group'])} {_format_number(row['value'])}"
+                for row in document["rows"]
+            )
+            for document in documents
+        ]
+    return "\n".join(lines)
+
+
+def _aggregate(tables, op, column, group_by) -> dict:
+    by_document: Dict[str, List[Dict[str, Any]]] = {}
+    for table in tables:
+        by_document.setdefault(table["document_id"], []).append(table)
+    return {
+        "op": op,
+        "column": column,
+        "group_by": group_by,
+        "rows": _rows(tables, op, column, group_by),
+        "documents": [
+            {
+                "document_id": document_id,
+                "source": ", ".join(dict.fromkeys(_source_name(t) for t in document_tables)),
+                "rows": _rows(document_tables, op, column, group_by),
+            }
+            for document_id, document_tables in by_document.items()
+        ],
+        "tables": [_table_source(t) for t in tables],
+    }
+
+
+def _rows(tables, op, column, group_by) -> List[Dict[str, Any]]:
+    return [
+        {"group": group, "value": value}
+        for group, value in structured_store.aggregate(tables, op, column, group_by)
+    ]
+
+
+def _tables_with(tables, column, group_by) -> List[Dict[str, Any]]:
+    wanted = {name.lower() for name in (column, group_by) if name}
+    return [
+        t for t in tables
+        if wanted <= {c["name"].lower() for c in t["columns"]}
+    ]
+
+
+def _table_source(table: Dict[str, Any]) -> dict:
+    columns = ", ".join(c["name"] for c in table["columns"])
+    return {
+        **table["metadata"],
+        "chunk_type": "structured_table",
+        "row_count": table["row_count"],
+        "text": f"{table['metadata'].get('source', table['sheet_name'])}: "
+                f"{table['row_count']} rows ({columns})",
+    }
+
+
+def _source_name(table: Dict[str, Any]) -> str:
+    return os.path.basename(str(table["metadata"].get("source", table["sheet_name"])))
+
+
+def _longest_match(text, columns, prefix=False) -> Optional[Tuple[str, str]]:
+    """(column key, matched form) of the longest column name in `text`; plurals count."""
+    best = None
+    for key in columns:
+        for form in (key, key + "s", key + "es"):
+            hit = text.startswith(f" {form} ") if prefix else f" {form} " in text
+            if hit and (best is None or len(form) > len(best[1])):
+                best = (key, form)
+    return best
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split())
+
+
+def _format_group(group: Any) -> str:
+    return "(blank)" if group is None else str(group)
+
+
+def _format_number(value: Any) -> str:
+    if value is None:
+        return "n/a"
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:,.2f}"
+    if isinstance(value, (int, float)):
+        return f"{int(value):,}"
+    return str(value)
@@ -0,0 +1,115 @@
+# apps/query/answer_cache.py
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, FrozenSet, Optional, Sequence
+
+import numpy as np
+
+_SENTENCE = re.compile(r"[.?!;:]\s+")
+_TOKEN = re.compile(r"\w+(?:[.,'&-]\w+)*")
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of answers keyed by question embedding.
+
+    A lookup hits when a stored question has the same key terms (numbers and
+    names, see question_terms()) and its embedding has cosine similarity of
+    at least `threshold` with the new one, so repeated and near-identical
+    questions skip retrieval and the chat model. Embeddings alone would match
+    "revenue in 2023" with "revenue in 2024", or one company with another.
+    Entries expire after
+    `ttl_seconds` and the least recently used are evicted past `max_entries`.
+
+    Every entry is tagged with the collection it was answered from and that
+    collection's version at the time; once the version changes (new documents
+    were ingested) the collection's entries are dropped.
+    """
+
+    def __init__(self, threshold: float = 0.97, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # id -> (collection, expires_at, key terms, unit vector, answer), in LRU order
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._versions: Dict[str, str] = {}
+        self._ids = count()
+
+    def get(
+        self, collection: str, version: str, question: str, vector: Sequence[float]
+    ) -> Optional[Dict[str, Any]]:
+        """Return the cached answer closest to `vector`, or None if nothing is similar enough."""
+        query = _unit(vector)
+        terms = question_terms(question)
+        with self._lock:
+            self._sync_version(collection, version)
+            now = time.monotonic()
+            keys, vectors = [], []
+            for key, (coll, expires_at, entry_terms, vec, _) in list(self._entries.items()):
+                if expires_at <= now:
+                    del self._entries[key]
+                elif coll == collection and entry_terms == terms:
+                    keys.append(key)
+                    vectors.append(vec)
+            if not keys:
+                return None
+            scores = np.stack(vectors) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._entries.move_to_end(keys[best])
+            return self._entries[keys[best]][4]
+
+    def set(
+        self, collection: str, version: str, question: str, vector: Sequence[float], answer: Dict[str, Any]
+    ) -> None:
+        """Store `answer` for `question`, embedded as `vector`."""
+        terms = question_terms(question)
+        with self._lock:
+            self._sync_version(collection, version)
+            expires_at = time.monotonic() + self.ttl_seconds
+            self._entries[next(self._ids)] = (collection, expires_at, terms, _unit(vector), answer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync_version(self, collection: str, version: str) -> None:
+        if self._versions.get(collection) == version:
+            return
+        self._versions[collection] = version
+        for key in [k for k, entry in self._entries.items() if entry[0] == collection]:
+            del self._entries[key]
+
+
+def question_terms(question: str) -> FrozenSet[str]:
+    """
+    Lowercased numbers and names in a question: tokens with a digit ("2023",
+    "Q3", "1,200" as "1200") and capitalized or all-caps words, except the
+    capitalized first word of a sentence.
+    """
+    terms = set()
+    for sentence in _SENTENCE.split(question):
+        for i, token in enumerate(_TOKEN.findall(sentence)):
+            if any(c.isdigit() for c in token):
+                terms.add(token.replace(",", "").lower())
+            elif token[0].isupper() and (i > 0 or (len(token) > 1 and token.isupper())):
+                terms.add(token.lower())
+    return frozenset(terms)
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
@@ -0,0 +1,109 @@
+# apps/query/cached_embeddings.py
+
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from apps.ingestion.services.embedding_cache import EmbeddingCache
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches question vectors.
+
+    Lookups go to a small in-process LRU first, then to the SQLite
+    EmbeddingCache shared by every worker process on the host; only questions
+    seen by neither are sent to the wrapped model. Document embedding is
+    passed straight through (ingestion has its own cache).
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        shared_cache: Optional[EmbeddingCache] = None,
+        max_local_entries: int = 1024,
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.shared_cache = shared_cache
+        self.max_local_entries = max_local_entries
+        self._local: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._recall(text)
+        if vector is not None:
+            return vector
+
+        if self.shared_cache is not None:
+            vector = self.shared_cache.get_many(self.model, [text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            if self.shared_cache is not None:
+                self.shared_cache.set_many(self.model, [text], [vector])
+
+        self._remember(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._recall(text)
+        if vector is not None:
+            return vector
+
+        # SQLite calls are short but blocking; keep them off the event loop
+        if self.shared_cache is not None:
+            vector = (await asyncio.to_thread(self.shared_cache.get_many, self.model, [text]))[0]
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            if self.shared_cache is not None:
+                await asyncio.to_thread(self.shared_cache.set_many, self.model, [text], [vector])
+
+        self._remember(text, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_query for many questions: all cache misses go out in one embedding request."""
+        vectors: List[Optional[List[float]]] = [self._recall(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.shared_cache is not None:
+            shared = self.shared_cache.get_many(self.model, [texts[i] for i in missing])
+            for i, vector in zip(missing, shared):
+                vectors[i] = vector
+            missing = [i for i in missing if vectors[i] is None]
+        if missing:
+            new_texts = list(dict.fromkeys(texts[i] for i in missing))
+            new_vectors = dict(zip(new_texts, self.embeddings.embed_documents(new_texts)))
+            if self.shared_cache is not None:
+                self.shared_cache.set_many(self.model, new_texts, list(new_vectors.values()))
+            for i in missing:
+                vectors[i] = new_vectors[texts[i]]
+
+        for text, vector in zip(texts, vectors):
+            self._remember(text, vector)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def _recall(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._local.get(text)
+            if vector is not None:
+                self._local.move_to_end(text)
+            return vector
+
+    def _remember(self, text: str, vector: List[float]) -> None:
+        if self.max_local_entries <= 0:
+            return
+        with self._lock:
+            self._local[text] = vector
+            self._local.move_to_end(text)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
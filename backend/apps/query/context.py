@@ -0,0 +1,186 @@
+# apps/query/context.py
+
+import json
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+from apps.ingestion.services.tokenizer import count_tokens_batch, encoding
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Characters of a chunk's head/tail used to look for overlap with another chunk
+_OVERLAP_PROBE = 64
+# Budget left below which a chunk is skipped instead of being cut down to fit
+_MIN_CHUNK_TOKENS = 64
+# Tokens the "stuff" step adds per document (separator between documents)
+_SEPARATOR_TOKENS = 2
+
+
+def build_context(
+    docs: List[Document],
+    question: str,
+    max_tokens: Optional[int] = None,
+    max_chunk_tokens: Optional[int] = None,
+) -> List[Document]:
+    """
+    Select and trim retrieved chunks so the prompt context fits a token budget.
+
+    `docs` come best first (every retrieval mode returns them in score
+    order) and keep that order. Steps:
+      1. drop repeated chunks, chunks contained in a better-ranked one, and
+         the text a chunk shares with a better-ranked neighbour of the same
+         source (consecutive token windows overlap);
+      2. cut chunks above `max_chunk_tokens` (QUERY_CONTEXT_CHUNK_TOKENS):
+         tables keep the rows that best match the question, other text
+         keeps its head;
+      3. add chunks until `max_tokens` (QUERY_CONTEXT_MAX_TOKENS) is used;
+         a chunk that no longer fits is cut to the remaining budget, or
+         skipped when less than a few dozen tokens remain.
+
+    Returns new Document objects; trimmed ones carry "context_trimmed": True.
+    """
+    if max_tokens is None:
+        max_tokens = getattr(settings, "QUERY_CONTEXT_MAX_TOKENS", 3000)
+    if max_chunk_tokens is None:
+        max_chunk_tokens = getattr(settings, "QUERY_CONTEXT_CHUNK_TOKENS", 1000)
+
+    candidates = _deduplicate(docs)
+    token_counts = count_tokens_batch([text for _, text in candidates])
+    terms = {w.lower() for w in _WORD.findall(question)}
+
+    selected: List[Document] = []
+    remaining = max_tokens
+    for (doc, text), tokens in zip(candidates, token_counts):
+        limit = min(max_chunk_tokens, remaining - _SEPARATOR_TOKENS)
+        if tokens > limit:
+            if limit < _MIN_CHUNK_TOKENS:
+                continue
+            text, tokens = _trim(doc, text, terms, limit)
+        remaining -= tokens + _SEPARATOR_TOKENS
+        metadata = dict(doc.metadata)
+        if text != doc.page_content:
+            metadata["context_trimmed"] = True
+        selected.append(Document(page_content=text, metadata=metadata, id=doc.id))
+    return selected
+
+
+# ── Deduplication ─────────────────────────────────────────────────────
+
+def _deduplicate(docs: List[Document]) -> List[Tuple[Document, str]]:
+    """(doc, text without overlap) for every chunk that adds new text."""
+    kept: List[Tuple[Document, str]] = []
+    seen_keys: Set[str] = set()
+    for doc in docs:
+        key = str(doc.metadata.get("chunk_id") or doc.id or "")
+        if key and key in seen_keys:
+            continue
+        text = doc.page_content
+        for other, other_text in kept:
+            if not text.strip():
+                break
+            if text in other_text:
+                text = ""
+            elif doc.metadata.get("source") == other.metadata.get("source"):
+                text = _strip_overlap(other_text, text)
+        if text.strip():
+            seen_keys.add(key)
+            kept.append((doc, text))
+    return kept
+
+
+def _strip_overlap(kept: str, text: str) -> str:
+    """Remove from `text` a head that `kept` ends with, or a tail that `kept` starts with."""
+    probe = text[:_OVERLAP_PROBE]
+    pos = kept.find(probe)
+    while pos != -1:
+        if text.startswith(kept[pos:]):
+            return text[len(kept) - pos:].lstrip()
+        pos = kept.find(probe, pos + 1)
+
+    probe = text[-_OVERLAP_PROBE:]
+    pos = kept.rfind(probe)
+    while pos != -1:
+        end = pos + len(probe)
+        if text.endswith(kept[:end]):
+            return text[:len(text) - end].rstrip()
+        pos = kept.rfind(probe, 0, end - 1)
+    return text
+
+
+# ── Trimming ──────────────────────────────────────────────────────────
+
+def _trim(doc: Document, text: str, terms: Set[str], limit: int) -> Tuple[str, int]:
+    """Cut `text` to at most `limit` tokens; returns (text, tokens)."""
+    table = _table_rows(doc, text)
+    if table is not None:
+        header, rows, render = table
+        trimmed = _best_rows(header, rows, render, terms, limit)
+        if trimmed is not None:
+            return trimmed
+    tokens = encoding.encode_ordinary(text)[:limit]
+    return encoding.decode(tokens), len(tokens)
+
+
+def _table_rows(doc: Document, text: str):
+    """
+    Split a table chunk into (header, rows, render) or return None.
+
+    Understands whole-table JSON chunks ('[{...}, ...]') and row-group
+    chunks (a "col | col" header line followed by one line per row).
+    `render(header, rows, total)` rebuilds a chunk from a subset of rows.
+    """
+    if text.startswith("[{"):
+        try:
+            records = json.loads(text)
+        except ValueError:
+            records = None
+        if isinstance(records, list) and all(isinstance(r, dict) for r in records):
+            rows = [json.dumps(r) for r in records]
+            return "", rows, _render_records
+    if doc.metadata.get("chunk_type") == "row_group" and "\n" in text:
+        header, body = text.split("\n", 1)
+        return header, body.split("\n"), _render_lines
+    return None
+
+
+def _render_records(header: str, rows: List[str], total: int) -> str:
+    return f"[{len(rows)} of {total} rows]\n[" + ",".join(rows) + "]"
+
+
+def _render_lines(header: str, rows: List[str], total: int) -> str:
+    return f"[{len(rows)} of {total} rows]\n{header}\n" + "\n".join(rows)
+
+
+def _best_rows(header, rows, render, terms: Set[str], limit: int) -> Optional[Tuple[str, int]]:
+    """
+    Keep the rows that best match the question, in table order, within `limit` tokens.
+
+    Rows score the summed IDF of the question words they contain, so words
+    found in every row (column names in JSON records) count for nothing.
+    With no matching row the table's first rows are kept.
+    """
+    row_words = [{w.lower() for w in _WORD.findall(row)} for row in rows]
+    doc_freq: Dict[str, int] = {}
+    for words in row_words:
+        for term in terms & words:
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+    idf = {term: math.log(len(rows) / n) for term, n in doc_freq.items()}
+    scores = [sum(idf[t] for t in terms & words) for words in row_words]
+
+    # Room for the header and the "[n of m rows]" note, then one newline/comma per row
+    budget = limit - count_tokens_batch([render(header, [], len(rows))])[0]
+    row_tokens = [n + 1 for n in count_tokens_batch(rows)]
+    order = sorted(range(len(rows)), key=lambda i: (-scores[i], i))
+    chosen: List[int] = []
+    for i in order:
+        if row_tokens[i] <= budget:
+            chosen.append(i)
+            budget -= row_tokens[i]
+    if not chosen:
+        return None
+    chosen.sort()
+    text = render(header, [rows[i] for i in chosen], len(rows))
+    return text, count_tokens_batch([text])[0]
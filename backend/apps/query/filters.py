@@ -0,0 +1,89 @@
+# apps/query/filters.py
+
+import uuid
+from typing import Any, Dict, List, Optional
+
+from apps.ingestion.models import Document
+
+FILTER_KEYS = ("document_ids", "file_type", "chunk_type", "sheet_name", "page_min", "page_max")
+
+
+def build_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Translate query-API filters into a Chroma `where` clause.
+
+    Accepted keys:
+        document_ids  list of Document ids (duplicates resolve to the original upload)
+        file_type     "pdf" / "docx" / "xlsx" / "csv", or a list of them
+        chunk_type    "text" / "row" / "row_group" / "table", or a list of them
+        sheet_name    sheet (or CSV part) name, or a list of them
+        page_min, page_max
+                      inclusive page range
+
+    Table columns named like one of these metadata keys are stored as
+    "col_<name>" (see table_chunker.column_keys), so a filter only ever
+    matches the metadata ingestion wrote. Returns None when there is
+    nothing to filter on. Raises ValueError on
+    unknown keys or malformed values. The same clause is understood by the
+    lexical index, so both retrievers search the same subset.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("'filters' must be an object")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(
+            f"Unknown filter(s): {', '.join(sorted(unknown))}; expected {', '.join(FILTER_KEYS)}"
+        )
+
+    conditions: List[Dict[str, Any]] = []
+    if filters.get("document_ids") is not None:
+        conditions.append(_one_of("document_id", _canonical_ids(filters["document_ids"])))
+    for key in ("file_type", "chunk_type", "sheet_name"):
+        if filters.get(key) is not None:
+            values = _as_list(key, filters[key])
+            if key == "file_type":
+                values = [v.lower().lstrip(".") for v in values]
+            conditions.append(_one_of(key, values))
+    for key, op in (("page_min", "$gte"), ("page_max", "$lte")):
+        if filters.get(key) is not None:
+            conditions.append({"page": {op: _as_int(key, filters[key])}})
+
+    if not conditions:
+        return None
+    # Chroma rejects $and with a single operand
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _canonical_ids(value: Any) -> List[str]:
+    ids = _as_list("document_ids", value)
+    try:
+        ids = [str(uuid.UUID(i)) for i in ids]
+    except ValueError:
+        raise ValueError("'document_ids' must be a list of document UUIDs")
+    # A duplicate upload's chunks are stored under the original document's id
+    resolved = set(ids)
+    for doc in Document.objects.filter(id__in=ids, duplicate_of__isnull=False):
+        resolved.add(str(doc.duplicate_of_id))
+    return sorted(resolved)
+
+
+def _one_of(key: str, values: List[Any]) -> Dict[str, Any]:
+    return {key: values[0]} if len(values) == 1 else {key: {"$in": values}}
+
+
+def _as_list(key: str, value: Any) -> List[str]:
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, str) and v for v in values):
+        raise ValueError(f"'{key}' must be a non-empty string or list of strings")
+    return values
+
+
+def _as_int(key: str, value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"'{key}' must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{key}' must be an integer")
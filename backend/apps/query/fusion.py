@@ -0,0 +1,33 @@
+# apps/query/fusion.py
+
+from typing import Dict, List, Sequence
+
+from langchain_core.documents import Document
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[List[Document]],
+    k: int = 60,
+    limit: int = 10,
+) -> List[Document]:
+    """
+    Merge ranked result lists with reciprocal-rank fusion.
+
+    Each document scores sum(1 / (k + rank)) over the lists it appears in
+    (rank starting at 1), so chunks found by both retrievers rise to the top
+    without having to reconcile BM25 and cosine score scales. Documents are
+    matched by their chunk_id metadata.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:limit]]
+
+
+def _doc_key(doc: Document) -> str:
+    return str(doc.metadata.get("chunk_id") or doc.id or doc.page_content)
@@ -0,0 +1,152 @@
+# backend/apps/query/management/commands/loadtest_query.py
+
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import httpx
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.ingestion.benchmarks.fake_openai import fake_embedding, fake_openai_subprocess
+
+
+class Command(BaseCommand):
+    """
+    Load-test the sync and async query endpoints against local stand-ins.
+
+    A FakeOpenAIServer (in a child process) answers embedding and chat
+    requests with configurable latency, and a throwaway collection of the configured
+    vector store (VECTOR_STORE_BACKEND) is seeded with synthetic chunks. The same questions are then sent to:
+
+      - /api/query/ask/        through the WSGI app, from --threads threads
+                               (one sync worker with that many threads)
+      - /api/query/ask/async/  through the ASGI app, --concurrency at once
+                               on one event loop (one ASGI worker)
+
+    Usage:
+        python manage.py loadtest_query --requests 400 --threads 8 --concurrency 200
+    """
+    # Offline load test: settings are overridden before the query clients are built
+    requires_system_checks = []
+    help = "Compare sync vs async query throughput against local OpenAI/Chroma stand-ins."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Threads serving the sync (WSGI) endpoint.")
+        parser.add_argument("--concurrency", type=int, default=200,
+                            help="Questions in flight on the async (ASGI) endpoint.")
+        parser.add_argument("--embed-latency", type=float, default=0.05)
+        parser.add_argument("--chat-latency", type=float, default=0.5)
+        parser.add_argument("--chunks", type=int, default=500,
+                            help="Synthetic chunks seeded into the throwaway collection.")
+        parser.add_argument("--skip-sync", action="store_true")
+
+    def handle(self, *args, **options):
+        questions = [f"What was the revenue of region {i % 13} in month {i}?" for i in range(options["requests"])]
+        with fake_openai_subprocess(
+            latency=options["embed_latency"],
+            chat_latency=options["chat_latency"],
+        ) as base_url, tempfile.TemporaryDirectory() as chroma_dir, override_settings(
+            OPENAI_API_KEY="sk-local",
+            OPENAI_BASE_URL=base_url,
+            CHROMA_PERSIST_DIR=chroma_dir,
+            FLAT_INDEX_DIR=os.path.join(chroma_dir, "flat"),
+            LEXICAL_INDEX_PATH=f"{chroma_dir}/lexical_index.sqlite3",
+            CHROMA_COLLECTION_NAME="loadtest",
+            # Every question is distinct, but don't let caches flatter either path
+            QUERY_ANSWER_CACHE_ENABLED=False,
+            QUERY_EMBEDDING_CACHE_ENABLED=False,
+            QUERY_EMBEDDING_LRU_SIZE=0,
+            ALLOWED_HOSTS=["localhost"],
+        ):
+            self._seed(options["chunks"])
+            self.stdout.write(
+                f"stand-in server at {base_url}: embed {options['embed_latency']}s, "
+                f"chat {options['chat_latency']}s; {len(questions)} questions"
+            )
+
+            results = []
+            if not options["skip_sync"]:
+                results.append(("sync  /ask/", options["threads"], *self._run_sync(questions, options["threads"])))
+            results.append(("async /ask/async/", options["concurrency"],
+                            *asyncio.run(self._run_async(questions, options["concurrency"]))))
+
+            baseline = None
+            for label, in_flight, elapsed, latencies in results:
+                rate = len(latencies) / elapsed
+                baseline = baseline or rate
+                self.stdout.write(
+                    f"{label:<18} in-flight={in_flight:<4} {elapsed:7.2f}s {rate:8.1f} req/s "
+                    f"({rate / baseline:5.1f}x)  p50={_pct(latencies, 50):.2f}s p95={_pct(latencies, 95):.2f}s"
+                )
+
+    @staticmethod
+    def _seed(count: int) -> None:
+        from apps.ingestion.services.lexical_index import lexical_index
+        from apps.ingestion.services.vector_store import store
+
+        texts = [f"Region {i % 13} revenue in month {i} was {i * 37.5:.2f}." for i in range(count)]
+        for start in range(0, count, 500):
+            batch = texts[start:start + 500]
+            ids = [f"chunk-{start + i}" for i in range(len(batch))]
+            metadatas = [{"source": "loadtest.csv", "chunk_type": "row", "chunk_id": i} for i in ids]
+            store.upsert(ids, [fake_embedding(t) for t in batch], batch, metadatas)
+            if lexical_index is not None:
+                lexical_index.add(ids, batch, metadatas)
+
+    @staticmethod
+    def _run_sync(questions: List[str], threads: int):
+        from django.core.wsgi import get_wsgi_application
+
+        app = get_wsgi_application()
+        local = threading.local()
+
+        def ask(question):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = httpx.Client(
+                    transport=httpx.WSGITransport(app=app), base_url="http://localhost"
+                )
+            start = time.perf_counter()
+            response = client.post("/api/query/ask/", json={"question": question})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = list(pool.map(ask, questions))
+        return time.perf_counter() - start, latencies
+
+    @staticmethod
+    async def _run_async(questions: List[str], concurrency: int):
+        from django.core.asgi import get_asgi_application
+
+        app = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://localhost", timeout=None
+        ) as client:
+            async def ask(question):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/api/query/ask/async/", json={"question": question})
+                    response.raise_for_status()
+                    return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(ask(q) for q in questions))
+        return time.perf_counter() - start, latencies
+
+
+def _pct(values: List[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[pct - 1]
@@ -1,10 +1,53 @@
+from django.conf import settings
 from rest_framework import serializers
 
-class QuestionSerializer(serializers.Serializer):
+from apps.ingestion.services.structured_store import AGGREGATES
+from .filters import build_where
+from .services import RETRIEVAL_MODES, resolve_mode
+
+
+def _where(filters):
+    try:
+        return build_where(filters)
+    except ValueError as e:
+        raise serializers.ValidationError({"filters": [str(e)]})
+
+class QueryOptionsSerializer(serializers.Serializer):
+    """Optional retrieval mode and filters; validated_data has "mode" resolved and "where" built."""
+    mode = serializers.ChoiceField(choices=RETRIEVAL_MODES, required=False, allow_null=True)
+    filters = serializers.DictField(required=False, allow_null=True)  # see filters.build_where
+
+    def validate(self, attrs):
+        attrs["mode"] = resolve_mode(attrs.get("mode"))
+        attrs["where"] = _where(attrs.pop("filters", None))
+        return attrs
+
+class QuestionSerializer(QueryOptionsSerializer):
     question = serializers.CharField()
 
+class BatchQuestionSerializer(QueryOptionsSerializer):
+    questions = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_questions(self, value):
+        limit = getattr(settings, "QUERY_BATCH_MAX_QUESTIONS", 200)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} questions per batch.")
+        return value
+
+class AggregateSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=AGGREGATES)
+    column = serializers.CharField(required=False, allow_null=True, default=None)
+    group_by = serializers.CharField(required=False, allow_null=True, default=None)
+    filters = serializers.DictField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        attrs["where"] = _where(attrs.pop("filters", None))
+        return attrs
+
 class AnswerSerializer(serializers.Serializer):
     answer = serializers.CharField()
     sources = serializers.ListField(
         child=serializers.DictField(),  # e.g. {'chunk_id': ..., 'text': ...}
     )
+    cached = serializers.BooleanField(default=False)  # served from the answer cache
+    aggregate = serializers.DictField(required=False)  # set when answered from the structured store
@@ -1,35 +1,63 @@
 # apps/query/services.py
 
-# 1) imports
-import chromadb
-from chromadb import PersistentClient
-from chromadb.config import Settings
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
 from django.conf import settings
 
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.chains import RetrievalQA
+from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
+
+from apps.ingestion.services.embedding_cache import EmbeddingCache
+from apps.ingestion.services.embedding_providers import make_provider, provider_name
+from apps.ingestion.services.lexical_index import lexical_index
+from apps.ingestion.services.vector_store import get_collection_version, search_vectors
+from .aggregates import structured_answer
+from .answer_cache import SemanticAnswerCache
+from .cached_embeddings import CachedQueryEmbeddings
+from .context import build_context
+from .fusion import reciprocal_rank_fusion
 
-# 2) initialize the Chroma client (using your settings value, no fallback)
-chroma_client = PersistentClient(
-    path=settings.CHROMA_PERSIST_DIR,
-    settings=Settings()
+# Connection pool shared by the async OpenAI clients (arun_query). httpcore
+# re-scans every open connection for each idle one on every request, so a
+# pool full of idle keep-alive connections turns quadratic under load; keep
+# only a few of them.
+async_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=settings.QUERY_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.QUERY_HTTP_MAX_KEEPALIVE,
+    )
 )
 
-# 3) configure the rest exactly as before
-embedding_function = OpenAIEmbeddings(
-    model="text-embedding-ada-002",
-    api_key=settings.OPENAI_API_KEY
+# Question vectors must come from the provider the collection's chunks were embedded with
+query_embeddings = make_provider(
+    provider_name(settings.CHROMA_COLLECTION_NAME),
+    http_async_client=async_http_client,
 )
 
-vectordb = Chroma(
-    client=chroma_client,
-    collection_name=settings.CHROMA_COLLECTION_NAME,
-    embedding_function=embedding_function,
+# Question embeddings are cached in-process and in a SQLite file shared by all
+# worker processes, so popular questions skip the embedding request entirely
+embedding_function = CachedQueryEmbeddings(
+    query_embeddings,
+    model=query_embeddings.model,
+    shared_cache=(
+        EmbeddingCache(
+            path=settings.QUERY_EMBEDDING_CACHE_PATH,
+            max_bytes=settings.QUERY_EMBEDDING_CACHE_MAX_BYTES,
+        )
+        if getattr(settings, "QUERY_EMBEDDING_CACHE_ENABLED", True) and query_embeddings.cacheable
+        else None
+    ),
+    max_local_entries=getattr(settings, "QUERY_EMBEDDING_LRU_SIZE", 1024),
 )
 
-retriever = vectordb.as_retriever(search_kwargs={"k": 10})
+RETRIEVAL_K = 10
+# "hybrid": BM25 keyword index + vector search, reciprocal-rank fused
+# "dense":  vector search only; "lexical": keyword index only (no embedding call)
+RETRIEVAL_MODES = ("hybrid", "dense", "lexical")
 
 QA_PROMPT = PromptTemplate(
     input_variables=["context", "question"],
@@ -41,25 +69,348 @@ QA_PROMPT = PromptTemplate(
     )
 )
 
-qa_chain = RetrievalQA.from_chain_type(
-    llm=ChatOpenAI(
-        temperature=0,
-        model=settings.CHAT_MODEL_NAME,
-        api_key=settings.OPENAI_API_KEY
-    ),
-    chain_type="stuff",
-    retriever=retriever,
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": QA_PROMPT}
+llm = ChatOpenAI(
+    temperature=0,
+    model=settings.CHAT_MODEL_NAME,
+    api_key=settings.OPENAI_API_KEY,
+    base_url=getattr(settings, "OPENAI_BASE_URL", None),
+    http_async_client=async_http_client
+)
+
+# Answers to repeated / near-identical questions (None when disabled)
+answer_cache = (
+    SemanticAnswerCache(
+        threshold=settings.QUERY_ANSWER_CACHE_THRESHOLD,
+        ttl_seconds=settings.QUERY_ANSWER_CACHE_TTL,
+        max_entries=settings.QUERY_ANSWER_CACHE_MAX_ENTRIES,
+    )
+    if getattr(settings, "QUERY_ANSWER_CACHE_ENABLED", True)
+    else None
 )
 
-def run_query(question: str) -> dict:
-    result = qa_chain.invoke({"query": question})
-    sources = [
+
+def run_query(
+    question: str,
+    mode: Optional[str] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> dict:
+    """
+    Answer `question` from the indexed documents.
+
+    Embeds the question, retrieves chunks, stuffs them into QA_PROMPT and
+    asks the LLM. The question is embedded only once, so the vector can also
+    be used to look up the semantic answer cache. Cached responses have "cached": True.
+
+    `mode` picks the retriever (see RETRIEVAL_MODES); "lexical" never calls
+    the embedding model. `where` (see filters.build_where) restricts both
+    retrievers to matching chunks inside the stores, before ranking. The
+    retrieved chunks are deduplicated and trimmed to the context token budget
+    (see context.build_context) before they are stuffed into the prompt.
+
+    With QUERY_STRUCTURED_ANSWERS on, plain aggregate questions over one
+    document's extracted tables ("total revenue by region") are answered
+    from the structured store first, with no embedding or LLM call; such
+    responses carry an "aggregate" field.
+    """
+    mode = resolve_mode(mode)
+    structured = _structured_answer(question, where)
+    if structured is not None:
+        return structured
+    query_vector = None if mode == "lexical" else embedding_function.embed_query(question)
+    version, hit = _cached_answer(question, query_vector, mode, where)
+    if hit is not None:
+        return {**hit, "cached": True}
+
+    dense = dense_search([query_vector], where)[0] if query_vector is not None else []
+    lexical = lexical_search(question, where) if mode != "dense" else []
+    docs = build_context(_combine(mode, dense, lexical), question)
+    answer = llm.invoke(build_prompt(docs, question)).content
+    output = {"answer": answer, "sources": _sources(docs)}
+
+    _remember(question, query_vector, mode, where, version, output)
+    return {**output, "cached": False}
+
+
+async def arun_query(
+    question: str,
+    mode: Optional[str] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> dict:
+    """
+    Async counterpart of run_query for ASGI views.
+
+    The question embedding and the chat completion are awaited on the shared
+    async OpenAI clients, so a request holds no thread while waiting on the
+    network. The vector store and the SQLite keyword index are
+    synchronous; both searches run in the default executor, concurrently.
+    """
+    mode = resolve_mode(mode)
+    structured = await asyncio.to_thread(_structured_answer, question, where)
+    if structured is not None:
+        return structured
+    query_vector = None if mode == "lexical" else await embedding_function.aembed_query(question)
+    version, hit = _cached_answer(question, query_vector, mode, where)
+    if hit is not None:
+        return {**hit, "cached": True}
+
+    async def no_results():
+        return []
+
+    async def no_dense_results():
+        return [[]]
+
+    # Both searches are local and blocking; run them side by side off the event loop
+    (dense,), lexical = await asyncio.gather(
+        asyncio.to_thread(dense_search, [query_vector], where)
+        if query_vector is not None else no_dense_results(),
+        asyncio.to_thread(lexical_search, question, where) if mode != "dense" else no_results(),
+    )
+    docs = build_context(_combine(mode, dense, lexical), question)
+    message = await llm.ainvoke(build_prompt(docs, question))
+    output = {"answer": message.content, "sources": _sources(docs)}
+
+    _remember(question, query_vector, mode, where, version, output)
+    return {**output, "cached": False}
+
+
+def stream_query(
+    question: str,
+    mode: Optional[str] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming counterpart of run_query.
+
+    Yields ("sources", [...]) as soon as retrieval finishes, then one
+    ("token", text) per chunk the chat model produces, then ("done", {...}).
+    A cached or structured-store answer is sent as a single token event.
+    """
+    mode = resolve_mode(mode)
+    structured = _structured_answer(question, where)
+    if structured is not None:
+        yield "sources", structured["sources"]
+        yield "token", structured["answer"]
+        yield "done", {"cached": False, "aggregate": structured["aggregate"]}
+        return
+    query_vector = None if mode == "lexical" else embedding_function.embed_query(question)
+    version, hit = _cached_answer(question, query_vector, mode, where)
+    if hit is not None:
+        yield "sources", hit["sources"]
+        yield "token", hit["answer"]
+        yield "done", {"cached": True}
+        return
+
+    dense = dense_search([query_vector], where)[0] if query_vector is not None else []
+    lexical = lexical_search(question, where) if mode != "dense" else []
+    docs = build_context(_combine(mode, dense, lexical), question)
+    sources = _sources(docs)
+    yield "sources", sources
+
+    parts: List[str] = []
+    for chunk in llm.stream(build_prompt(docs, question)):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield "token", chunk.content
+
+    _remember(question, query_vector, mode, where, version, {"answer": "".join(parts), "sources": sources})
+    yield "done", {"cached": False}
+
+
+async def astream_query(
+    question: str,
+    mode: Optional[str] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Async counterpart of stream_query for ASGI views.
+
+    Same events as stream_query; tokens come from llm.astream, so each one
+    reaches the client as soon as the chat model produces it.
+    """
+    mode = resolve_mode(mode)
+    structured = await asyncio.to_thread(_structured_answer, question, where)
+    if structured is not None:
+        yield "sources", structured["sources"]
+        yield "token", structured["answer"]
+        yield "done", {"cached": False, "aggregate": structured["aggregate"]}
+        return
+    query_vector = None if mode == "lexical" else await embedding_function.aembed_query(question)
+    version, hit = _cached_answer(question, query_vector, mode, where)
+    if hit is not None:
+        yield "sources", hit["sources"]
+        yield "token", hit["answer"]
+        yield "done", {"cached": True}
+        return
+
+    dense = (
+        (await asyncio.to_thread(dense_search, [query_vector], where))[0]
+        if query_vector is not None else []
+    )
+    lexical = await asyncio.to_thread(lexical_search, question, where) if mode != "dense" else []
+    docs = build_context(_combine(mode, dense, lexical), question)
+    sources = _sources(docs)
+    yield "sources", sources
+
+    parts: List[str] = []
+    async for chunk in llm.astream(build_prompt(docs, question)):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield "token", chunk.content
+
+    _remember(question, query_vector, mode, where, version, {"answer": "".join(parts), "sources": sources})
+    yield "done", {"cached": False}
+
+
+def run_batch(
+    questions: List[str],
+    mode: Optional[str] = None,
+    where: Optional[Dict[str, Any]] = None,
+) -> List[dict]:
+    """
+    Answer many questions at once; results come back in input order.
+
+    Same steps as run_query, but batched: the uncached questions are
+    embedded in one request, all vector searches go to the vector store
+    as one multi-query call, and the LLM calls run concurrently (at most
+    QUERY_BATCH_MAX_CONCURRENCY at a time). Repeated questions are answered
+    once. A failed LLM call yields {"error": ...} for that question only.
+    Aggregate questions the structured store can answer skip all of that.
+    """
+    mode = resolve_mode(mode)
+    results: Dict[str, dict] = {}
+    unique = []
+    for question in dict.fromkeys(questions):
+        structured = _structured_answer(question, where)
+        if structured is not None:
+            results[question] = structured
+        else:
+            unique.append(question)
+    vectors = (
+        embedding_function.embed_queries(unique)
+        if mode != "lexical" else [None] * len(unique)
+    )
+
+    pending = []  # (question, vector, cache version)
+    for question, vector in zip(unique, vectors):
+        version, hit = _cached_answer(question, vector, mode, where)
+        if hit is not None:
+            results[question] = {**hit, "cached": True}
+        else:
+            pending.append((question, vector, version))
+
+    if pending:
+        dense = (
+            dense_search([vector for _, vector, _ in pending], where)
+            if mode != "lexical" else [[] for _ in pending]
+        )
+        contexts = [
+            build_context(
+                _combine(mode, hits, lexical_search(question, where) if mode != "dense" else []),
+                question,
+            )
+            for (question, _, _), hits in zip(pending, dense)
+        ]
+        messages = llm.batch(
+            [build_prompt(docs, question) for (question, _, _), docs in zip(pending, contexts)],
+            config={"max_concurrency": getattr(settings, "QUERY_BATCH_MAX_CONCURRENCY", 8)},
+            return_exceptions=True,
+        )
+        for (question, vector, version), docs, message in zip(pending, contexts, messages):
+            if isinstance(message, Exception):
+                results[question] = {"error": str(message)}
+                continue
+            output = {"answer": message.content, "sources": _sources(docs)}
+            _remember(question, vector, mode, where, version, output)
+            results[question] = {**output, "cached": False}
+
+    return [{"question": question, **results[question]} for question in questions]
+
+
+def resolve_mode(mode: Optional[str]) -> str:
+    """Validate a retrieval mode (None → QUERY_RETRIEVAL_MODE)."""
+    mode = mode or getattr(settings, "QUERY_RETRIEVAL_MODE", "hybrid")
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(
+            f"Unknown retrieval mode {mode!r}; expected one of {', '.join(RETRIEVAL_MODES)}"
+        )
+    if lexical_index is None and mode != "dense":
+        # Keyword index disabled: everything falls back to vector search
+        return "dense"
+    return mode
+
+
+def lexical_search(question: str, where: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """BM25 top-k from the keyword index, as LangChain documents."""
+    return [
+        Document(page_content=text, metadata=metadata, id=chunk_id)
+        for chunk_id, text, metadata, _ in lexical_index.search(question, k=RETRIEVAL_K, where=where)
+    ]
+
+
+def dense_search(
+    vectors: List[List[float]], where: Optional[Dict[str, Any]] = None
+) -> List[List[Document]]:
+    """Top-k chunks per query vector from the vector store, in one backend query."""
+    return [
+        [
+            Document(page_content=text, metadata=metadata, id=chunk_id)
+            for chunk_id, text, metadata, _ in hits
+        ]
+        for hits in search_vectors(vectors, RETRIEVAL_K, where)
+    ]
+
+
+def build_prompt(docs: List[Document], question: str) -> str:
+    """Render QA_PROMPT with the chunks' texts as context (LangChain's "stuff" layout)."""
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return QA_PROMPT.format(context=context, question=question)
+
+
+def _structured_answer(question: str, where: Optional[Dict[str, Any]]) -> Optional[dict]:
+    if not getattr(settings, "QUERY_STRUCTURED_ANSWERS", False):
+        return None
+    return structured_answer(question, where)
+
+
+def _combine(mode: str, dense: List[Document], lexical: List[Document]) -> List[Document]:
+    if mode == "hybrid":
+        return reciprocal_rank_fusion(
+            [dense, lexical],
+            k=getattr(settings, "QUERY_RRF_K", 60),
+            limit=RETRIEVAL_K,
+        )
+    return dense if mode == "dense" else lexical
+
+
+def _cached_answer(
+    question: str, query_vector: Optional[List[float]], mode: str, where: Optional[Dict[str, Any]]
+) -> Tuple[str, Optional[dict]]:
+    """Return (collection version, cached answer or None) for the embedded question."""
+    if answer_cache is None or query_vector is None:
+        return "", None
+    version = get_collection_version(settings.CHROMA_COLLECTION_NAME)
+    return version, answer_cache.get(_cache_namespace(mode, where), version, question, query_vector)
+
+
+def _remember(
+    question: str,
+    query_vector: Optional[List[float]],
+    mode: str,
+    where: Optional[Dict[str, Any]],
+    version: str,
+    output: dict,
+) -> None:
+    if answer_cache is not None and query_vector is not None:
+        answer_cache.set(_cache_namespace(mode, where), version, question, query_vector, output)
+
+
+def _cache_namespace(mode: str, where: Optional[Dict[str, Any]]) -> str:
+    # Different retrievers / filters can produce different answers to the same question
+    return f"{settings.CHROMA_COLLECTION_NAME}:{mode}:{json.dumps(where, sort_keys=True)}"
+
+
+def _sources(docs: List[Document]) -> List[dict]:
+    return [
         {**doc.metadata, "text": doc.page_content}
-        for doc in result["source_documents"]
+        for doc in docs
     ]
-    return {
-        "answer": result["result"],
-        "sources": sources
-    }
@@ -1,3 +1,183 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.ingestion.models import Document
+from apps.ingestion.services.structured_store import StructuredStore
+
+from . import aggregates, answer_cache
+from .aggregates import run_aggregate, structured_answer
+from .answer_cache import SemanticAnswerCache, question_terms
+from .filters import build_where
+
+DOCUMENT_ID = "00000000-0000-0000-0000-000000000001"
+OTHER_DOCUMENT_ID = "00000000-0000-0000-0000-000000000002"
+
+
+class BuildWhereTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_no_filters(self):
+        self.assertIsNone(build_where(None))
+        self.assertIsNone(build_where({}))
+        self.assertIsNone(build_where({"file_type": None}))
+
+    def test_single_condition_is_not_wrapped(self):
+        self.assertEqual(build_where({"file_type": ".PDF"}), {"file_type": "pdf"})
+        self.assertEqual(build_where({"page_min": "3"}), {"page": {"$gte": 3}})
+
+    def test_lists_and_page_range(self):
+        self.assertEqual(
+            build_where({
+                "file_type": ["csv", "xlsx"],
+                "chunk_type": "row_group",
+                "sheet_name": ["Sales"],
+                "page_min": 2,
+                "page_max": 5,
+            }),
+            {"$and": [
+                {"file_type": {"$in": ["csv", "xlsx"]}},
+                {"chunk_type": "row_group"},
+                {"sheet_name": "Sales"},
+                {"page": {"$gte": 2}},
+                {"page": {"$lte": 5}},
+            ]},
+        )
+
+    def test_document_ids_resolve_duplicates_to_the_original(self):
+        original = Document.objects.create(file=SimpleUploadedFile("a.csv", b"x"))
+        duplicate = Document.objects.create(file=SimpleUploadedFile("b.csv", b"x"), duplicate_of=original)
+        self.assertEqual(
+            build_where({"document_ids": [str(duplicate.id)]}),
+            {"document_id": {"$in": sorted([str(original.id), str(duplicate.id)])}},
+        )
+        self.assertEqual(
+            build_where({"document_ids": DOCUMENT_ID.upper()}),
+            {"document_id": DOCUMENT_ID},
+        )
+
+    def test_invalid_filters(self):
+        for filters in (
+            ["pdf"],
+            {"filetype": "pdf"},
+            {"file_type": ""},
+            {"file_type": []},
+            {"sheet_name": [1]},
+            {"page_min": "three"},
+            {"page_max": True},
+            {"document_ids": ["not-a-uuid"]},
+        ):
+            with self.subTest(filters=filters), self.assertRaises(ValueError):
+                build_where(filters)
+
+
+class StructuredAnswerTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        store = StructuredStore(os.path.join(tmp, "structured.sqlite3"))
+        patcher = mock.patch.object(aggregates, "structured_store", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The same sheet uploaded as two documents
+        for document_id, source in ((DOCUMENT_ID, "/media/sales.csv"), (OTHER_DOCUMENT_ID, "/media/sales_copy.csv")):
+            store.add_table(document_id, {
+                "sheet_name": "sales.csv",
+                "dataframe": pd.DataFrame({"Region": ["North", "South"], "Revenue": [10, 5]}),
+                "metadata": {"source": source},
+            })
+
+    def test_tables_from_several_documents_go_to_retrieval(self):
+        self.assertIsNone(structured_answer("total revenue"))
+
+    def test_one_document_is_answered_with_its_source(self):
+        output = structured_answer("total revenue", {"document_id": DOCUMENT_ID})
+        self.assertEqual(output["answer"], "Total Revenue: 15.\nSource: sales.csv.")
+        self.assertEqual([t["document_id"] for t in output["sources"]], [DOCUMENT_ID])
+
+    def test_aggregate_breaks_down_per_document(self):
+        result = run_aggregate("sum", "Revenue")
+        self.assertEqual(result["rows"], [{"group": None, "value": 30}])
+        self.assertEqual(
+            [(d["document_id"], d["source"], d["rows"]) for d in result["documents"]],
+            [
+                (DOCUMENT_ID, "sales.csv", [{"group": None, "value": 15}]),
+                (OTHER_DOCUMENT_ID, "sales_copy.csv", [{"group": None, "value": 15}]),
+            ],
+        )
+        self.assertEqual(
+            aggregates.format_answer(result),
+            "Total Revenue: 30.\nBy document:\n- sales.csv: 15\n- sales_copy.csv: 15",
+        )
+
+
+class QuestionTermsTests(SimpleTestCase):
+
+    def test_numbers_and_names(self):
+        self.assertEqual(
+            question_terms("What was ACME revenue in Q3 2023? Compare it with Globex's 1,200 units."),
+            {"acme", "q3", "2023", "globex's", "1200"},
+        )
+
+    def test_sentence_initial_words_are_ignored(self):
+        self.assertEqual(question_terms("Show revenue. Total it by Region"), {"region"})
+        self.assertEqual(question_terms("EMEA revenue"), {"emea"})
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=60, max_entries=2)
+
+    def test_hit_on_similar_vector_with_the_same_terms(self):
+        self.cache.set("docs", "v1", "Revenue in 2023?", [1.0, 0.0], {"answer": "10"})
+        self.assertEqual(self.cache.get("docs", "v1", "revenue in 2023", [0.99, 0.05]), {"answer": "10"})
+
+    def test_miss_on_dissimilar_vector(self):
+        self.cache.set("docs", "v1", "Revenue in 2023?", [1.0, 0.0], {"answer": "10"})
+        self.assertIsNone(self.cache.get("docs", "v1", "Revenue in 2023?", [0.0, 1.0]))
+
+    def test_miss_on_different_numbers_or_names(self):
+        self.cache.set("docs", "v1", "Revenue in 2023?", [1.0, 0.0], {"answer": "10"})
+        self.assertIsNone(self.cache.get("docs", "v1", "Revenue in 2024?", [1.0, 0.0]))
+        self.assertIsNone(self.cache.get("docs", "v1", "Revenue in 2023 for Globex?", [1.0, 0.0]))
+
+    def test_collections_are_separate(self):
+        self.cache.set("docs", "v1", "Revenue?", [1.0, 0.0], {"answer": "10"})
+        self.assertIsNone(self.cache.get("other", "v1", "Revenue?", [1.0, 0.0]))
+
+    def test_new_version_drops_the_collection(self):
+        self.cache.set("docs", "v1", "Revenue?", [1.0, 0.0], {"answer": "10"})
+        self.cache.set("other", "v1", "Revenue?", [1.0, 0.0], {"answer": "20"})
+        self.assertIsNone(self.cache.get("docs", "v2", "Revenue?", [1.0, 0.0]))
+        self.assertEqual(self.cache.get("other", "v1", "Revenue?", [1.0, 0.0]), {"answer": "20"})
+
+    def test_entries_expire(self):
+        with mock.patch.object(answer_cache.time, "monotonic", return_value=1000.0):
+            self.cache.set("docs", "v1", "Revenue?", [1.0, 0.0], {"answer": "10"})
+        with mock.patch.object(answer_cache.time, "monotonic", return_value=1059.0):
+            self.assertIsNotNone(self.cache.get("docs", "v1", "Revenue?", [1.0, 0.0]))
+        with mock.patch.object(answer_cache.time, "monotonic", return_value=1060.0):
+            self.assertIsNone(self.cache.get("docs", "v1", "Revenue?", [1.0, 0.0]))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set("docs", "v1", "Revenue?", [1.0, 0.0], {"answer": "a"})
+        self.cache.set("docs", "v1", "Costs?", [0.0, 1.0], {"answer": "b"})
+        self.cache.get("docs", "v1", "Revenue?", [1.0, 0.0])
+        self.cache.set("docs", "v1", "Margin?", [-1.0, 0.0], {"answer": "c"})
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get("docs", "v1", "Revenue?", [1.0, 0.0]), {"answer": "a"})
+        self.assertIsNone(self.cache.get("docs", "v1", "Costs?", [0.0, 1.0]))
@@ -1,6 +1,12 @@
 from django.urls import path
-from .views import QueryAPIView
+from django.views.decorators.csrf import csrf_exempt
+from .views import AggregateAPIView, QueryAPIView, QueryAsyncView, QueryBatchAPIView, QueryStreamAPIView
 
 urlpatterns = [
     path('ask/', QueryAPIView.as_view(), name='query-ask'),
+    path('batch/', QueryBatchAPIView.as_view(), name='query-batch'),
+    path('aggregate/', AggregateAPIView.as_view(), name='query-aggregate'),
+    path('ask/stream/', QueryStreamAPIView.as_view(), name='query-ask-stream'),
+    # JSON API like ask/ (DRF views are csrf-exempt too)
+    path('ask/async/', csrf_exempt(QueryAsyncView.as_view()), name='query-ask-async'),
 ]
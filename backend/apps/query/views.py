@@ -1,18 +1,185 @@
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .services import run_query
+from .aggregates import run_aggregate
+from .serializers import AggregateSerializer, BatchQuestionSerializer, QuestionSerializer
+from .services import arun_query, astream_query, run_batch, run_query, stream_query
+
+logger = logging.getLogger(__name__)
+
 
 class QueryAPIView(APIView):
     """
-    POST { "question": "..." } → { "answer": "...", "sources": [...] }
+    POST { "question": "...",
+           "mode": "hybrid" | "dense" | "lexical",                     (optional)
+           "filters": { "document_ids": [...], "file_type": "pdf",
+                        "chunk_type": "row", "page_min": 1, "page_max": 5 } }  (optional)
+      → { "answer": "...", "sources": [...], "cached": bool }
+
+    With QUERY_STRUCTURED_ANSWERS on, aggregate questions over one document's
+    tables ("total revenue by region") are answered from the structured store
+    and add "aggregate": {...}.
     """
     def post(self, request):
-        question = request.data.get("question")
-        if not question:
-            return Response(
-                {"detail": "Missing 'question' in request body."},
+        serializer = QuestionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(_question_errors(serializer.errors), status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        output = run_query(data["question"], data["mode"], data["where"])
+        return Response(output)
+
+
+class QueryBatchAPIView(APIView):
+    """
+    POST { "questions": ["...", ...], "mode": ..., "filters": {...} }
+      → { "results": [ { "question": "...", "answer": "...", "sources": [...], "cached": bool }
+                       | { "question": "...", "error": "..." }, ... ] }
+
+    Results are in input order. Mode and filters apply to every question.
+    """
+    def post(self, request):
+        serializer = BatchQuestionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response({"results": run_batch(data["questions"], data["mode"], data["where"])})
+
+
+class AggregateAPIView(APIView):
+    """
+    POST { "op": "sum" | "avg" | "min" | "max" | "count",
+           "column": "Revenue",                   (optional for "count")
+           "group_by": "Region",                  (optional)
+           "filters": {...} }                      (optional, as for ask/)
+      → { "op": ..., "column": ..., "group_by": ...,
+          "rows": [ { "group": ..., "value": ... }, ... ],
+          "documents": [ { "document_id": ..., "source": ..., "rows": [...] }, ... ],
+          "tables": [...] }
+
+    Runs directly on the structured store (tables extracted from XLSX/CSV/PDF
+    documents); column names match case-insensitively.
+    """
+    def post(self, request):
+        serializer = AggregateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            output = run_aggregate(data["op"], data["column"], data["group_by"], data["where"])
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(output)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients send Accept: text/event-stream; error bodies become an SSE error event."""
+    media_type = "text/event-stream"
+    format = "sse"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return _sse("error", data).encode("utf-8")
+
+
+class QueryStreamAPIView(APIView):
+    """
+    POST { "question": "...", "mode": ..., "filters": {...} } → text/event-stream
+
+        event: sources   data: [...]               (once, after retrieval)
+        event: token     data: {"text": "..."}     (per generated chunk)
+        event: done      data: {"cached": bool}   (+ "aggregate" for structured answers)
+        event: error     data: {"detail": "..."}   (if generation fails midway)
+
+    Under ASGI the events come from an async generator (Django would read a
+    sync one to the end in a thread before sending anything); under WSGI
+    from a sync one.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        serializer = QuestionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(_question_errors(serializer.errors), status=status.HTTP_400_BAD_REQUEST)
+        question, mode, where = (serializer.validated_data[k] for k in ("question", "mode", "where"))
+        if isinstance(request._request, ASGIRequest):
+            events = _aevent_stream(question, mode, where)
+        else:
+            events = _event_stream(question, mode, where)
+        response = StreamingHttpResponse(
+            events,
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+        return response
+
+
+class QueryAsyncView(View):
+    """
+    Async variant of QueryAPIView for ASGI deployments.
+
+    POST { "question": "...", "mode": ..., "filters": {...} }
+      → { "answer": "...", "sources": [...], "cached": bool }
+
+    While a question waits on the embedding and chat model requests the
+    event loop serves other requests, so one ASGI worker can keep hundreds
+    of questions in flight. (DRF views are sync-only, hence a plain View.)
+    """
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse(
+                {"detail": "Request body is not valid JSON."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        output = run_query(question)
-        return Response(output)
\ No newline at end of file
+        serializer = QuestionSerializer(data=payload)
+        # Resolving document ids touches the database
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(_question_errors(serializer.errors), status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        output = await arun_query(data["question"], data["mode"], data["where"])
+        return JsonResponse(output, encoder=DjangoJSONEncoder)
+
+
+def _question_errors(errors):
+    # A missing or empty question keeps the {"detail": ...} body /ask/ always returned
+    if "question" in errors:
+        return {"detail": "Missing 'question' in request body."}
+    return errors
+
+
+def _event_stream(question, mode, where):
+    # An SSE comment goes out immediately so clients get headers and a first
+    # byte before retrieval and generation start
+    yield ": stream open\n\n"
+    try:
+        for event, payload in stream_query(question, mode, where):
+            if event == "token":
+                payload = {"text": payload}
+            yield _sse(event, payload)
+    except Exception as e:
+        logger.exception("Streaming query failed")
+        yield _sse("error", {"detail": str(e)})
+
+
+async def _aevent_stream(question, mode, where):
+    yield ": stream open\n\n"
+    try:
+        async for event, payload in astream_query(question, mode, where):
+            if event == "token":
+                payload = {"text": payload}
+            yield _sse(event, payload)
+    except Exception as e:
+        logger.exception("Streaming query failed")
+        yield _sse("error", {"detail": str(e)})
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, cls=DjangoJSONEncoder)}\n\n"
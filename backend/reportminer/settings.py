@@ -2,7 +2,11 @@
 Django settings for reportminer project.
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -119,6 +123,8 @@ REST_FRAMEWORK = {
 # OpenAI + Chat Model settings
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 CHAT_MODEL_NAME = os.getenv('CHAT_MODEL_NAME', 'gpt-4o')
+# Optional OpenAI-compatible endpoint (proxy, or a local stand-in server for benchmarks)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
 
 # ChromaDB settings
 CHROMA_PERSIST_DIR = os.getenv(
@@ -127,6 +133,105 @@ CHROMA_PERSIST_DIR = os.getenv(
 )
 CHROMA_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME", "reportminer")
 
+# Vector store backend: "chroma", or "flat" (brute-force NumPy search over a memory-mapped
+# matrix in FLAT_INDEX_DIR/<collection>; FLAT_INDEX_DTYPE "int8" quarters its size)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+FLAT_INDEX_DIR = os.getenv("FLAT_INDEX_DIR", os.path.join(CHROMA_PERSIST_DIR, "flat"))
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32")
+# Compact the flat index after a write once this share of its rows are replaced/deleted (0 = never)
+FLAT_INDEX_COMPACT_RATIO = float(os.getenv("FLAT_INDEX_COMPACT_RATIO", "0.3"))
+
+# BM25 keyword index over the same chunks (SQLite FTS5), kept next to the Chroma data
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH",
+    os.path.join(CHROMA_PERSIST_DIR, "lexical_index.sqlite3")
+)
+
+# Structured store: extracted tables as typed SQLite tables, so numeric questions
+# ("total revenue by region") are answered with SQL aggregates instead of retrieval
+STRUCTURED_STORE_ENABLED = os.getenv("STRUCTURED_STORE_ENABLED", "true").lower() == "true"
+STRUCTURED_STORE_PATH = os.getenv(
+    "STRUCTURED_STORE_PATH",
+    os.path.join(CHROMA_PERSIST_DIR, "structured.sqlite3")
+)
+# Answer plain aggregate questions on ask/ from the structured store, skipping the LLM.
+# Off by default; when on, only questions whose tables all come from one document qualify
+QUERY_STRUCTURED_ANSWERS = os.getenv("QUERY_STRUCTURED_ANSWERS", "false").lower() == "true"
+
+# Query retrieval: "hybrid" (BM25 + vectors, reciprocal-rank fusion), "dense" or
+# "lexical" (no embedding call); clients may override per request with "mode"
+QUERY_RETRIEVAL_MODE = os.getenv("QUERY_RETRIEVAL_MODE", "hybrid")
+QUERY_RRF_K = int(os.getenv("QUERY_RRF_K", 60))
+
+# Embedding provider: "openai" (remote text-embedding-ada-002) or "hashing" (CPU-only
+# feature hashing, no network; lower recall). EMBEDDING_PROVIDERS overrides it per
+# collection, e.g. "bulk=hashing,reportminer=openai"; queries use the same provider
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_PROVIDERS = dict(
+    item.strip().split("=", 1)
+    for item in os.getenv("EMBEDDING_PROVIDERS", "").split(",")
+    if "=" in item
+)
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", 1024))
+
+# Embedding cache (content-addressed, shared by all workers on the host)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(BASE_DIR / "cache" / "embeddings.sqlite3")
+)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Parsed-file cache: extraction output keyed by file content hash, so retries and
+# re-ingests of the same file skip parsing (least recently used entries are evicted)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", str(BASE_DIR / "cache" / "extractions"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+# Embedding requests: async scheduler with several batches in flight and
+# client-side requests/tokens-per-minute limits (429s are retried with backoff)
+EMBEDDING_ASYNC_ENABLED = os.getenv("EMBEDDING_ASYNC_ENABLED", "true").lower() == "true"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", 3000))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", 1_000_000))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+
+# Question embeddings: in-process LRU in front of a SQLite cache shared by all
+# Django workers (kept apart from the ingestion cache so bulk ingestion can't evict it)
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_PATH = os.getenv(
+    "QUERY_EMBEDDING_CACHE_PATH",
+    str(BASE_DIR / "cache" / "query_embeddings.sqlite3")
+)
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+QUERY_EMBEDDING_LRU_SIZE = int(os.getenv("QUERY_EMBEDDING_LRU_SIZE", 1024))
+
+# Query answer cache: questions with the same numbers and names as a previous one, and
+# an embedding within the cosine threshold of it, reuse its answer; cleared when the
+# collection gets new documents. QUERY_ANSWER_CACHE_ENABLED=false turns it off
+QUERY_ANSWER_CACHE_ENABLED = os.getenv("QUERY_ANSWER_CACHE_ENABLED", "true").lower() == "true"
+QUERY_ANSWER_CACHE_THRESHOLD = float(os.getenv("QUERY_ANSWER_CACHE_THRESHOLD", 0.97))
+QUERY_ANSWER_CACHE_TTL = int(os.getenv("QUERY_ANSWER_CACHE_TTL", 3600))
+QUERY_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+# Prompt context: retrieved chunks are deduplicated and added best-first up to
+# QUERY_CONTEXT_MAX_TOKENS; any one chunk (e.g. a whole-table JSON chunk) is cut to
+# QUERY_CONTEXT_CHUNK_TOKENS, keeping the table rows that match the question
+QUERY_CONTEXT_MAX_TOKENS = int(os.getenv("QUERY_CONTEXT_MAX_TOKENS", 3000))
+QUERY_CONTEXT_CHUNK_TOKENS = int(os.getenv("QUERY_CONTEXT_CHUNK_TOKENS", 1000))
+
+# Async query path (/api/query/ask/async/): HTTP pool shared by the async OpenAI
+# clients; keep-alive connections beyond QUERY_HTTP_MAX_KEEPALIVE are closed when idle
+QUERY_HTTP_MAX_CONNECTIONS = int(os.getenv("QUERY_HTTP_MAX_CONNECTIONS", 200))
+QUERY_HTTP_MAX_KEEPALIVE = int(os.getenv("QUERY_HTTP_MAX_KEEPALIVE", 16))
+
+# Batch query endpoint (/api/query/batch/): questions per request, and chat model
+# calls in flight at once per request
+QUERY_BATCH_MAX_QUESTIONS = int(os.getenv("QUERY_BATCH_MAX_QUESTIONS", 200))
+QUERY_BATCH_MAX_CONCURRENCY = int(os.getenv("QUERY_BATCH_MAX_CONCURRENCY", 8))
+
 # Celery (Redis as broker)
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
@@ -136,11 +241,56 @@ poppler_path = r"C:\Program Files\poppler-24.08.0\Library\bin"
 if poppler_path not in os.environ.get('PATH', ''):
     os.environ['PATH'] = poppler_path + os.pathsep + os.environ['PATH']
 
+# Text splitting: "token" (encode each section once, slice token windows) or
+# "recursive" (RecursiveCharacterTextSplitter measured with tiktoken)
+SPLITTER_ENGINE = os.getenv("SPLITTER_ENGINE", "token")
+SPLITTER_CHUNK_TOKENS = int(os.getenv("SPLITTER_CHUNK_TOKENS", 400))
+SPLITTER_OVERLAP_TOKENS = int(os.getenv("SPLITTER_OVERLAP_TOKENS", 100))
+
 # Chunking configuration (used by splitter.py)
 INGESTION_ROW_EMBED_THRESHOLD = 200
 INGESTION_ROW_GROUP_SIZE = 50
 
+# Table chunking: "auto" (per-row up to INGESTION_ROW_EMBED_THRESHOLD rows, row groups
+# above it and for every part of a CSV read in CSV_CHUNKSIZE pieces), "row",
+# "row_group" or "table" (one JSON blob)
+INGESTION_TABLE_CHUNK_MODE = os.getenv("INGESTION_TABLE_CHUNK_MODE", "auto")
+# Token budget per row group (header included); INGESTION_ROW_GROUP_SIZE caps the rows
+INGESTION_ROW_GROUP_TOKENS = int(os.getenv("INGESTION_ROW_GROUP_TOKENS", 1000))
+
+# Streaming ingestion: chunks per embed/write batch, batches embedded concurrently
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", 256))
+INGESTION_MAX_IN_FLIGHT = int(os.getenv("INGESTION_MAX_IN_FLIGHT", 2))
+
+# Failed ingestion tasks are retried (resuming from their batch checkpoints) up to
+# INGESTION_MAX_RETRIES times, waiting INGESTION_RETRY_BACKOFF seconds, doubling each time
+INGESTION_MAX_RETRIES = int(os.getenv("INGESTION_MAX_RETRIES", 3))
+INGESTION_RETRY_BACKOFF = int(os.getenv("INGESTION_RETRY_BACKOFF", 30))
+
+# PDF extraction: "single_pass" (pdfplumber text + tables in one open) or "pypdf" (legacy two-pass)
+PDF_EXTRACTION_ENGINE = os.getenv("PDF_EXTRACTION_ENGINE", "single_pass")
+# PDFs longer than PDF_SHARD_MIN_PAGES are parsed in PDF_SHARD_PAGES-page ranges across
+# PDF_SHARD_WORKERS processes, started only while such a PDF is parsed (1 = no sharding).
+# The default is capped at 4 (or the CPU count) because several Celery workers may shard at once
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", 50))
+PDF_SHARD_MIN_PAGES = int(os.getenv("PDF_SHARD_MIN_PAGES", 200))
+PDF_SHARD_WORKERS = int(os.getenv("PDF_SHARD_WORKERS", min(4, os.cpu_count() or 1)))
+
 # CSV/Excel ingestion behavior
 CSV_FULL_SHEET_INGESTION = False
 CSV_CHUNKSIZE = 50_000
 EXCEL_FULL_SHEET_INGESTION = True
+
+# `manage.py test`: keep uploads, caches, indexes and vector data in a throwaway
+# directory instead of the source tree (removed when the run exits)
+if sys.argv[1:2] == ["test"]:
+    TEST_DATA_DIR = tempfile.mkdtemp(prefix="reportminer-test-")
+    atexit.register(shutil.rmtree, TEST_DATA_DIR, ignore_errors=True)
+    MEDIA_ROOT = os.path.join(TEST_DATA_DIR, "media")
+    CHROMA_PERSIST_DIR = os.path.join(TEST_DATA_DIR, "chroma_data")
+    FLAT_INDEX_DIR = os.path.join(CHROMA_PERSIST_DIR, "flat")
+    LEXICAL_INDEX_PATH = os.path.join(CHROMA_PERSIST_DIR, "lexical_index.sqlite3")
+    STRUCTURED_STORE_PATH = os.path.join(CHROMA_PERSIST_DIR, "structured.sqlite3")
+    EMBEDDING_CACHE_PATH = os.path.join(TEST_DATA_DIR, "cache", "embeddings.sqlite3")
+    EXTRACTION_CACHE_DIR = os.path.join(TEST_DATA_DIR, "cache", "extractions")
+    QUERY_EMBEDDING_CACHE_PATH = os.path.join(TEST_DATA_DIR, "cache", "query_embeddings.sqlite3")
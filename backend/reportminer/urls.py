@@ -22,10 +22,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path , include
+from apps.ingestion.views import IngestionMetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/ingestion/', include('apps.ingestion.urls')),
     path('api/query/', include('apps.query.urls')),  # ADD THIS LINE
+    path('metrics', IngestionMetricsView.as_view(), name='metrics'),  # Prometheus scrape target
     path('', home),
 ]
\ No newline at end of file